@@ -5,6 +5,17 @@ import os
 import certifi
 from pymongo import MongoClient
 from app.config import Config
+from app.registry import registry
+from app.sentiment import engine as sentiment_engine
+from app.preprocess import tokenizer
+import app.concurrency as concurrency
+import app.indexes as indexes
+import app.rollups as rollups
+import app.entities as entities
+import app.dedup as dedup
+from app.jobs import manager as job_manager
+from app.enrichment import worker as enrichment_worker
+import app.metrics as metrics
 
 async def connectToDatabase():
     mongo_uri = os.getenv("MONGO_URI", Config.MONGO_URI)
@@ -12,7 +23,8 @@ async def connectToDatabase():
     collection_name = os.getenv("COLLECTION_NAME", Config.COLLECTION_NAME)
     
     try:
-        client_mongo = MongoClient(mongo_uri)
+        listeners = [metrics.MongoCommandTimer()] if Config.METRICS_ENABLED else []
+        client_mongo = MongoClient(mongo_uri, maxPoolSize=Config.MONGO_POOL_SIZE, event_listeners=listeners)
         db = client_mongo[str(os.getenv("DATABASE_NAME"))]
         collection = db[str(os.getenv("COLLECTION_NAME"))]
 
@@ -25,12 +37,43 @@ async def connectToDatabase():
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("startup has begun!!")
+    concurrency.configure_threadpool()
     dbHost = await connectToDatabase()
     app.news = dbHost
+    if Config.ENSURE_INDEXES:
+        indexes.ensure_indexes(dbHost)
+        print(f"Missing indexes: {indexes.index_report(dbHost).get('missing')}")
+    job_manager.start(dbHost)
+    rollups.ensure_indexes(dbHost)
+    dedup_pending = False
+    if Config.DEDUP_ENABLED:
+        dedup.ensure_indexes(dbHost)
+        # The dedup job also builds the rollups afterwards, so they never count copies it has yet to find
+        dedup_pending = job_manager.active("dedup") is not None
+        if not dedup_pending and dbHost.find_one({"dedup": {"$exists": False}}, {"_id": 1}) is not None:
+            print("Documents without a dedup fingerprint, submitting a dedup job")
+            job_manager.submit("dedup")
+            dedup_pending = True
+    if Config.ROLLUPS_AUTO_BUILD and not dedup_pending and not rollups.rollups_ready(dbHost) and job_manager.active("rollups") is None:
+        print("Daily rollups not built yet, submitting a rollups job")
+        job_manager.submit("rollups")
+    entities.ensure_indexes(dbHost)
+    if Config.ENTITY_INDEX_AUTO_BUILD and not entities.index_ready(dbHost) and job_manager.active("entity_index") is None:
+        print("Entity index not built yet, submitting an entity_index job")
+        job_manager.submit("entity_index")
+    if Config.WARM_MODELS:
+        registry.warm()
+    if Config.ENRICH_WORKER_ENABLED:
+        enrichment_worker.start(dbHost)
     
     yield
     
     print("shutdown has begun!!")
+    enrichment_worker.shutdown()
+    job_manager.shutdown()
+    sentiment_engine.shutdown()
+    tokenizer.shutdown()
+    concurrency.shutdown()
 
 
 app = FastAPI(
@@ -40,6 +83,9 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+if Config.METRICS_ENABLED:
+    app.middleware("http")(metrics.metrics_middleware)
+
 app.include_router(router) 
 
 
@@ -0,0 +1,245 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from pymongo import ASCENDING
+import app.utils as utils
+from app.config import Config
+from app.writer import BulkWriter
+from app.sentiment import engine as sentiment_engine
+from app.rollups import RollupWriter, ROLLUP_FIELDS, rollups_ready, rebuild_rollups
+from app.entities import EntityIndexWriter
+import app.topics as topics
+import app.fetcher as fetcher
+import app.dedup as dedup
+
+NER_CURSOR = "ner_backfill"
+NER_MODES = ["incremental", "full"]
+TEXT_PROJECTION = {"actual_text": 1, "text": 1, "title": 1}
+
+
+def state_collection(collection):
+    return collection.database[Config.STATE_COLLECTION]
+
+
+def mark_stale_ner(collection):
+    # Flags documents whose text no longer matches the hash recorded at extraction time, so the backfill
+    # query stays the same size however many there are. Documents extracted before hashes were recorded are stamped, not reprocessed.
+    stale = 0
+    documents = collection.find({"ner": {"$exists": True}}, {**TEXT_PROJECTION, "ner_text_hash": 1}).batch_size(Config.BULK_WRITE_SIZE)
+    with BulkWriter(collection) as writer:
+        for doc in documents:
+            current = utils.text_hash(utils.ner_text(doc))
+            recorded = doc.get("ner_text_hash")
+            if recorded is None:
+                writer.update_one({"_id": doc["_id"]}, {"$set": {"ner_text_hash": current}})
+            elif recorded != current:
+                writer.update_one({"_id": doc["_id"]}, {"$set": {"ner_stale": True}})
+                stale += 1
+    return stale
+
+
+def ner_query(collection, mode, verify_hash):
+    if mode == "full":
+        return {}
+    if verify_hash:
+        mark_stale_ner(collection)
+    # Flagged documents stay stale until their NER is rewritten, even if the run that flagged them stopped early
+    return {"$or": [{"ner": {"$exists": False}}, {"ner_stale": True}]}
+
+
+def dedup_documents(collection, mode="incremental", progress=None):
+    result = dedup.assign_clusters(collection, mode=mode, progress=progress)
+    result["rollups_rebuilt"] = False
+    ready = rollups_ready(collection)
+    if (result["counts_changed"] and ready) or (Config.ROLLUPS_AUTO_BUILD and not ready):
+        rebuild_rollups(collection)
+        result["rollups_rebuilt"] = True
+    return result
+
+
+def _cluster_results(collection, docs, field, compute):
+    # Enrichment runs once per story: a copy takes the result of its cluster's canonical article
+    keys = [dedup.cluster_key(doc) for doc in docs]
+    batch_ids = {doc["_id"] for doc in docs}
+    outside = list({key for key in keys if key not in batch_ids})
+    known = {}
+    if outside:
+        for doc in collection.find({"_id": {"$in": outside}, field: {"$exists": True}}, {field: 1}):
+            known[doc["_id"]] = doc[field]
+    pending = {}
+    for key, doc in zip(keys, docs):
+        if key not in known and key not in pending:
+            pending[key] = doc
+    for key, result in zip(pending, compute(list(pending.values()))):
+        known[key] = result
+    return [known[key] for key in keys]
+
+
+def _ner_docs(collection, docs, writer, rollup, entity_index):
+    texts = [utils.ner_text(doc) for doc in docs]
+    ner_dicts = _cluster_results(collection, docs, "ner", lambda pending: utils.gliner_ner_batch([utils.ner_text(doc) for doc in pending]))
+    for doc, text, ner_dict in zip(docs, texts, ner_dicts):
+        writer.update_one(
+            {"_id": doc.get("_id")},
+            {"$set": {"ner": ner_dict, "ner_text_hash": utils.text_hash(text)}, "$unset": {"ner_stale": ""}}
+        )
+        rollup.ner(doc, ner_dict)
+        entity_index.ner(doc, ner_dict)
+
+
+def _sentiment_docs(collection, docs, writer, rollup):
+    scores = _cluster_results(collection, docs, "sentiment", lambda pending: sentiment_engine.score([doc.get("actual_text", "None") for doc in pending]))
+    for doc, score in zip(docs, scores):
+        writer.update_one(
+            {"_id": doc.get("_id")},
+            {"$set": {"sentiment": score}}
+        )
+        rollup.sentiment(doc, score)
+
+
+def backfill_ner(collection, mode="incremental", verify_hash=False, restart=False, progress=None):
+    if Config.DEDUP_ENABLED:
+        dedup_documents(collection)
+    state = state_collection(collection)
+    if restart:
+        state.delete_one({"_id": NER_CURSOR})
+
+    query = ner_query(collection, mode, verify_hash)
+    saved = state.find_one({"_id": NER_CURSOR})
+    if saved and saved.get("mode") == mode:
+        print(f"Resuming NER backfill after {saved.get('last_id')}")
+        query = {"$and": [query, {"_id": {"$gt": saved.get("last_id")}}]}
+
+    to_modify = collection.count_documents(query)
+    if to_modify == 0:
+        state.delete_one({"_id": NER_CURSOR})
+        return {"to_modify": 0, "modified": 0}
+
+    done = 0
+    writer = BulkWriter(collection)
+    rollup = RollupWriter(collection)
+    entity_index = EntityIndexWriter(collection)
+    documents = collection.find(query, {**TEXT_PROJECTION, **ROLLUP_FIELDS, "dedup.cluster": 1}).sort("_id", ASCENDING).batch_size(Config.NER_DOC_BATCH_SIZE)
+    for docs in utils.batched(documents, Config.NER_DOC_BATCH_SIZE):
+        _ner_docs(collection, docs, writer, rollup, entity_index)
+        # The cursor may only move past documents whose writes have landed
+        writer.flush()
+        rollup.flush()
+        entity_index.flush()
+        if writer.errors:
+            # Failed writes are only printed by the writer; stopping here keeps them before the saved cursor
+            raise RuntimeError(f"{writer.errors} NER writes failed, the cursor stays before {docs[0].get('_id')}")
+        state.update_one(
+            {"_id": NER_CURSOR},
+            {"$set": {"mode": mode, "last_id": docs[-1].get("_id"), "updated_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+        done += len(docs)
+        if progress:
+            progress(done, to_modify)
+
+    state.delete_one({"_id": NER_CURSOR})
+    return {"to_modify": to_modify, "modified": writer.modified}
+
+
+def backfill_sentiment(collection, progress=None):
+    if Config.DEDUP_ENABLED:
+        dedup_documents(collection)
+    query = {"sentiment": {"$exists": False}}
+    to_modify = collection.count_documents(query)
+    if to_modify == 0:
+        return {"to_modify": 0, "modified": 0}
+
+    done = 0
+    with BulkWriter(collection) as writer, RollupWriter(collection) as rollup:
+        documents = collection.find(query, {"actual_text": 1, **ROLLUP_FIELDS, "dedup.cluster": 1}).batch_size(Config.SENTIMENT_DOC_BATCH_SIZE)
+        for docs in utils.batched(documents, Config.SENTIMENT_DOC_BATCH_SIZE):
+            _sentiment_docs(collection, docs, writer, rollup)
+            done += len(docs)
+            if progress:
+                progress(done, to_modify)
+    return {"to_modify": to_modify, "modified": writer.modified}
+
+
+def update_sentiment_by_ids(collection, object_ids):
+    documents = list(collection.find({"_id": {"$in": object_ids}}, {"actual_text": 1, **ROLLUP_FIELDS}))
+    scores = sentiment_engine.score([doc.get("actual_text", "None") for doc in documents])
+    with BulkWriter(collection) as writer, RollupWriter(collection) as rollup:
+        for doc, score in zip(documents, scores):
+            writer.update_one(
+                {"_id": doc.get("_id")},
+                {"$set": {"sentiment": score}}
+            )
+            rollup.sentiment(doc, score)
+    return {
+        "found": len(documents),
+        "modified": writer.modified,
+        "sentiments": {str(doc.get("_id")): score for doc, score in zip(documents, scores)},
+    }
+
+
+def train_topic_model(collection, num_topics, relevant_terms=10, progress=None, online=False, coherence="sample", visual="background"):
+    if coherence not in topics.COHERENCE_MODES:
+        raise ValueError("Invalid coherence specified")
+    if visual not in topics.VISUAL_MODES:
+        raise ValueError("Invalid visual specified")
+    train = topics.online_topic_model if online else topics.topic_model
+    return train(collection, num_topics, relevant_terms, progress=progress, coherence=coherence, visual=visual)
+
+
+def backfill_actual_text(collection, mode="missing", retry_failed=False, progress=None):
+    # Runs on a worker thread, so the fetcher gets an event loop of its own
+    return asyncio.run(fetcher.fetch_documents(collection, mode=mode, retry_failed=retry_failed, progress=progress))
+
+
+def enrich_due(now):
+    # Articles skipped for missing text wait out a backoff, so they neither hold up newer ones nor get fetched on every poll
+    return {"$or": [{"enrich.retry_at": {"$exists": False}}, {"enrich.retry_at": {"$lte": now}}]}
+
+
+def _skip_update(doc, now):
+    attempts = (doc.get("enrich") or {}).get("attempts", 0)
+    delay = min(Config.ENRICH_SKIP_BACKOFF * (2 ** attempts), Config.ENRICH_SKIP_MAX_BACKOFF)
+    return {"$set": {"enrich.retry_at": now + timedelta(seconds=delay)}, "$inc": {"enrich.attempts": 1}}
+
+
+def enrich_documents(collection, ids, fetch=True):
+    # Runs every stage on a handful of new articles: text, dedup, VADER and GLiNER
+    result = {"found": 0, "fetched": 0, "skipped": 0, "sentiment": 0, "ner": 0}
+    if not ids:
+        return result
+    if fetch:
+        fetched = asyncio.run(fetcher.fetch_documents(collection, ids=ids))
+        result["fetched"] = fetched["fetched"]
+    if Config.DEDUP_ENABLED:
+        clusters = dedup.assign_clusters(collection, ids=ids)
+        if clusters["counts_changed"] and rollups_ready(collection):
+            rebuild_rollups(collection)
+    projection = {**TEXT_PROJECTION, **ROLLUP_FIELDS, "dedup.cluster": 1, "enrich": 1}
+    # Re-read right before scoring, so articles a backfill job got to first are not counted twice
+    docs = list(collection.find({"_id": {"$in": ids}}, projection).sort("_id", ASCENDING))
+    result["found"] = len(docs)
+    writer = BulkWriter(collection)
+    # Articles without text stay pending for a later fetch instead of being scored on nothing
+    now = datetime.now(timezone.utc)
+    for doc in docs:
+        if doc.get("actual_text") in fetcher.MISSING_TEXT:
+            writer.update_one({"_id": doc["_id"]}, _skip_update(doc, now))
+    docs = [doc for doc in docs if doc.get("actual_text") not in fetcher.MISSING_TEXT]
+    result["skipped"] = result["found"] - len(docs)
+    rollup = RollupWriter(collection)
+    entity_index = EntityIndexWriter(collection)
+    pending = [doc for doc in docs if "sentiment" not in doc]
+    if pending:
+        _sentiment_docs(collection, pending, writer, rollup)
+        result["sentiment"] = len(pending)
+    pending = [doc for doc in docs if "ner" not in doc]
+    if pending:
+        _ner_docs(collection, pending, writer, rollup, entity_index)
+        result["ner"] = len(pending)
+    writer.flush()
+    rollup.flush()
+    entity_index.flush()
+    if writer.errors:
+        # Raised so the worker retries the batch rather than moving past it
+        raise RuntimeError(f"{writer.errors} enrichment writes failed")
+    return result
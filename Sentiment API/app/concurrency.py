@@ -0,0 +1,31 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import anyio.to_thread
+from starlette.concurrency import run_in_threadpool
+from app.config import Config
+
+# Model inference and corpus-wide passes get their own small pool, so they queue
+# behind each other instead of taking threads from short Mongo reads like /data
+model_executor = ThreadPoolExecutor(max_workers=Config.MODEL_WORKERS, thread_name_prefix="model")
+
+
+def configure_threadpool():
+    # Sync routes and run_io share anyio's default limiter; must be called inside the event loop
+    anyio.to_thread.current_default_thread_limiter().total_tokens = Config.THREADPOOL_SIZE
+
+
+async def run_io(func, *args, **kwargs):
+    return await run_in_threadpool(func, *args, **kwargs)
+
+
+async def run_model(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    # run_in_executor does not carry context variables over, so request metrics would lose the model stages
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(model_executor, functools.partial(context.run, func, *args, **kwargs))
+
+
+def shutdown():
+    model_executor.shutdown(wait=False, cancel_futures=True)
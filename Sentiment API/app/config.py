@@ -6,4 +6,120 @@ load_dotenv()
 class Config:
     MONGO_URI = os.getenv("MONGO_URI")
     DATABASE_NAME = os.getenv("DATABASE_NAME")
-    COLLECTION_NAME = os.getenv("COLLECTION_NAME")
\ No newline at end of file
+    COLLECTION_NAME = os.getenv("COLLECTION_NAME")
+
+    # GLiNER model registry
+    GLINER_MODEL = os.getenv("GLINER_MODEL", "urchade/gliner_medium-v2.1")
+    GLINER_LABELS = [label.strip() for label in os.getenv("GLINER_LABELS", "person,nationality,religious group,political group,facility,organisation,country,city,state").split(",") if label.strip()]
+    GLINER_THRESHOLD = float(os.getenv("GLINER_THRESHOLD", "0.5"))
+    # 0 leaves torch to pick its own intra-op thread count
+    MODEL_THREADS = int(os.getenv("MODEL_THREADS", "0"))
+    WARM_MODELS = os.getenv("WARM_MODELS", "true").lower() == "true"
+
+    # Batched NER
+    NER_BATCH_SIZE = int(os.getenv("NER_BATCH_SIZE", "8"))
+    NER_DOC_BATCH_SIZE = int(os.getenv("NER_DOC_BATCH_SIZE", "64"))
+    NER_WINDOW_WORDS = int(os.getenv("NER_WINDOW_WORDS", "256"))
+    NER_WINDOW_OVERLAP = int(os.getenv("NER_WINDOW_OVERLAP", "32"))
+
+    # Bookkeeping for resumable pipelines (backfill cursors etc.)
+    STATE_COLLECTION = os.getenv("STATE_COLLECTION", "pipeline_state")
+
+    # Operations per unordered bulk_write flush
+    BULK_WRITE_SIZE = int(os.getenv("BULK_WRITE_SIZE", "500"))
+
+    # Sentiment engine; 0 workers means one per CPU core
+    SENTIMENT_WORKERS = int(os.getenv("SENTIMENT_WORKERS", "0"))
+    SENTIMENT_CHUNK_SIZE = int(os.getenv("SENTIMENT_CHUNK_SIZE", "256"))
+    SENTIMENT_DOC_BATCH_SIZE = int(os.getenv("SENTIMENT_DOC_BATCH_SIZE", "4096"))
+
+    # Concurrency: anyio threadpool for sync routes / Mongo calls, a separate pool for model work
+    THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "40"))
+    MODEL_WORKERS = int(os.getenv("MODEL_WORKERS", "2"))
+    MONGO_POOL_SIZE = int(os.getenv("MONGO_POOL_SIZE", "100"))
+
+    # Background jobs
+    JOBS_COLLECTION = os.getenv("JOBS_COLLECTION", "jobs")
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+    # Concurrent jobs of the same kind, e.g. only one NER backfill at a time
+    JOB_KIND_LIMIT = int(os.getenv("JOB_KIND_LIMIT", "1"))
+    JOB_PROGRESS_INTERVAL = float(os.getenv("JOB_PROGRESS_INTERVAL", "1.0"))
+
+    # /data/all paging and streaming
+    DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "100"))
+    MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "1000"))
+    STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "500"))
+
+    # Create the indexes in app.indexes at startup
+    ENSURE_INDEXES = os.getenv("ENSURE_INDEXES", "true").lower() == "true"
+
+    # Daily sentiment / entity rollups read by /get_sentiment and /get_ner
+    ROLLUP_COLLECTION = os.getenv("ROLLUP_COLLECTION", "daily_rollups")
+    ENTITY_ROLLUP_COLLECTION = os.getenv("ENTITY_ROLLUP_COLLECTION", "daily_entity_rollups")
+    ROLLUPS_AUTO_BUILD = os.getenv("ROLLUPS_AUTO_BUILD", "true").lower() == "true"
+
+    # Entity -> article inverted index
+    ENTITY_COLLECTION = os.getenv("ENTITY_COLLECTION", "entity_mentions")
+    ENTITY_INDEX_AUTO_BUILD = os.getenv("ENTITY_INDEX_AUTO_BUILD", "true").lower() == "true"
+
+    # Trained topic models, keyed by corpus fingerprint, num_topics and preprocessing version
+    TOPIC_CACHE_DIR = os.getenv("TOPIC_CACHE_DIR", "./LDA_cache")
+    TOPIC_CACHE_MAX_BYTES = int(os.getenv("TOPIC_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+    TOPIC_CACHE_MAX_AGE = int(os.getenv("TOPIC_CACHE_MAX_AGE", str(7 * 24 * 3600)))
+    # Online topic models fold in new articles and are fully retrained after this many updates,
+    # this age in seconds, or once this share of new tokens is missing from their dictionary
+    TOPIC_ONLINE_RETRAIN_UPDATES = int(os.getenv("TOPIC_ONLINE_RETRAIN_UPDATES", "30"))
+    TOPIC_ONLINE_RETRAIN_AGE = int(os.getenv("TOPIC_ONLINE_RETRAIN_AGE", str(30 * 24 * 3600)))
+    TOPIC_ONLINE_MAX_OOV = float(os.getenv("TOPIC_ONLINE_MAX_OOV", "0.2"))
+
+    # Topic model tokenization: process pool and Mongo batch size
+    TOKENIZE_WORKERS = int(os.getenv("TOKENIZE_WORKERS", "0"))
+    TOKENIZE_CHUNK_SIZE = int(os.getenv("TOKENIZE_CHUNK_SIZE", "256"))
+    TOKENIZE_DOC_BATCH_SIZE = int(os.getenv("TOKENIZE_DOC_BATCH_SIZE", "1000"))
+    # Serialize the topic model bag of words to a Matrix Market file and stream it, instead of keeping it in memory
+    TOPIC_STREAM_CORPUS = os.getenv("TOPIC_STREAM_CORPUS", "true").lower() == "true"
+    # Articles sampled for coherence=sample on topic models
+    TOPIC_COHERENCE_SAMPLE = int(os.getenv("TOPIC_COHERENCE_SAMPLE", "2000"))
+    # Rendered pyLDAvis pages kept in memory
+    VISUAL_PAGE_CACHE_SIZE = int(os.getenv("VISUAL_PAGE_CACHE_SIZE", "8"))
+
+    # Article fetching for documents without actual_text
+    FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", "32"))
+    FETCH_PER_HOST = int(os.getenv("FETCH_PER_HOST", "4"))
+    FETCH_TIMEOUT = float(os.getenv("FETCH_TIMEOUT", "30"))
+    FETCH_RETRIES = int(os.getenv("FETCH_RETRIES", "3"))
+    FETCH_BACKOFF = float(os.getenv("FETCH_BACKOFF", "0.5"))
+    FETCH_MAX_BACKOFF = float(os.getenv("FETCH_MAX_BACKOFF", "30"))
+    FETCH_BATCH_SIZE = int(os.getenv("FETCH_BATCH_SIZE", "200"))
+    FETCH_USER_AGENT = os.getenv("FETCH_USER_AGENT", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3")
+
+    # Near-duplicate clustering: enrichment is shared within a cluster and copies are left out of counts
+    DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+    # Estimated Jaccard similarity of word 3-shingles above which two articles are the same story
+    DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+    DEDUP_MIN_WORDS = int(os.getenv("DEDUP_MIN_WORDS", "20"))
+    DEDUP_BATCH_SIZE = int(os.getenv("DEDUP_BATCH_SIZE", "1000"))
+
+    # Enrichment worker: tails the news collection and enriches new articles as they are inserted
+    ENRICH_WORKER_ENABLED = os.getenv("ENRICH_WORKER_ENABLED", "true").lower() == "true"
+    # auto uses a change stream and falls back to polling on a standalone mongod
+    ENRICH_MODE = os.getenv("ENRICH_MODE", "auto")
+    ENRICH_BATCH_SIZE = int(os.getenv("ENRICH_BATCH_SIZE", "32"))
+    # Seconds a micro-batch waits for more inserts before it is enriched
+    ENRICH_BATCH_WAIT = float(os.getenv("ENRICH_BATCH_WAIT", "2.0"))
+    ENRICH_POLL_INTERVAL = float(os.getenv("ENRICH_POLL_INTERVAL", "5.0"))
+    # Seconds before the newest enriched article that a poll still looks at for late inserts
+    ENRICH_POLL_LOOKBACK = float(os.getenv("ENRICH_POLL_LOOKBACK", "300"))
+    # How often the change stream position is saved while no articles arrive
+    ENRICH_TOKEN_SAVE_INTERVAL = float(os.getenv("ENRICH_TOKEN_SAVE_INTERVAL", "60"))
+    ENRICH_RETRY_DELAY = float(os.getenv("ENRICH_RETRY_DELAY", "30.0"))
+    # Fetch actual_text for new articles before scoring them
+    ENRICH_FETCH = os.getenv("ENRICH_FETCH", "true").lower() == "true"
+    # Seconds before an article that had no text is tried again, doubling per attempt up to the max
+    ENRICH_SKIP_BACKOFF = float(os.getenv("ENRICH_SKIP_BACKOFF", "60"))
+    ENRICH_SKIP_MAX_BACKOFF = float(os.getenv("ENRICH_SKIP_MAX_BACKOFF", "3600"))
+
+    # Request, MongoDB and pipeline stage histograms on /metrics
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    # Adds a Server-Timing header with the time per stage (mongo, endpoint, serialize, gliner, ...) to every response
+    METRICS_TRACE = os.getenv("METRICS_TRACE", "false").lower() == "true"
@@ -0,0 +1,150 @@
+import hashlib
+import re
+import unicodedata
+import numpy as np
+from pymongo import ASCENDING
+from app.config import Config
+from app.writer import BulkWriter
+import app.utils as utils
+import app.rollups as rollups
+import app.metrics as metrics
+
+DEDUP_MODES = ["incremental", "full"]
+SHINGLE_WORDS = 3
+NUM_PERM = 64
+# 8 bands of 8 rows: copies with a shingle Jaccard similarity around 0.8 or more almost always share a band
+BANDS = 8
+ROWS = NUM_PERM // BANDS
+# (a * x + b) mod PRIME with everything below 2**31, so the products fit in uint64
+PRIME = (1 << 31) - 1
+_random = np.random.default_rng(42)
+_A = _random.integers(1, PRIME, size=NUM_PERM, dtype=np.uint64)
+_B = _random.integers(0, PRIME, size=NUM_PERM, dtype=np.uint64)
+
+
+def normalize_text(text):
+    text = unicodedata.normalize("NFKC", str(text)).casefold()
+    return " ".join(re.sub(r"[^\w\s]", " ", text).split())
+
+
+def content_hash(normalized):
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def _int64(digest):
+    # Mongo only stores signed 64 bit integers
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def minhash(normalized):
+    words = normalized.split()
+    shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(len(words) - SHINGLE_WORDS + 1, 1))}
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big") % PRIME for shingle in shingles],
+        dtype=np.uint64,
+    )
+    return [int(value) for value in ((np.outer(_A, hashes) + _B[:, None]) % np.uint64(PRIME)).min(axis=1)]
+
+
+def bands(signature):
+    return [
+        _int64(hashlib.blake2b(repr((band, signature[band * ROWS:(band + 1) * ROWS])).encode("utf-8"), digest_size=8).digest())
+        for band in range(BANDS)
+    ]
+
+
+def similarity(a, b):
+    return sum(1 for x, y in zip(a, b) if x == y) / NUM_PERM
+
+
+def signature(doc):
+    normalized = normalize_text(utils.ner_text(doc))
+    # Placeholders such as "NA" or a bare title would otherwise all cluster together
+    if len(normalized.split()) < Config.DEDUP_MIN_WORDS:
+        return None
+    value = minhash(normalized)
+    return {"hash": content_hash(normalized), "minhash": value, "bands": bands(value)}
+
+
+def ensure_indexes(collection):
+    collection.create_index([("dedup.hash", ASCENDING)], name="dedup_hash")
+    collection.create_index([("dedup.bands", ASCENDING)], name="dedup_bands")
+
+
+def cluster_key(doc):
+    return (doc.get("dedup") or {}).get("cluster") or doc.get("_id")
+
+
+class _Canonicals:
+    def __init__(self):
+        self.by_hash = {}
+        self.by_band = {}
+
+    def add(self, doc_id, sig):
+        self.by_hash.setdefault(sig["hash"], doc_id)
+        for band in sig["bands"]:
+            self.by_band.setdefault(band, []).append((doc_id, sig["minhash"]))
+
+    def match(self, sig):
+        if sig["hash"] in self.by_hash:
+            return self.by_hash[sig["hash"]]
+        close = [
+            doc_id for band in sig["bands"] for doc_id, value in self.by_band.get(band, [])
+            if similarity(value, sig["minhash"]) >= Config.DEDUP_THRESHOLD
+        ]
+        return min(close) if close else None
+
+
+def assign_clusters(collection, mode="incremental", progress=None, ids=None):
+    # Articles are clustered in _id order, so the earliest copy of a story is its cluster's canonical article
+    if mode not in DEDUP_MODES:
+        raise ValueError("Invalid mode specified")
+    ensure_indexes(collection)
+    query = {} if mode == "full" else {"dedup": {"$exists": False}}
+    if ids is not None:
+        query["_id"] = {"$in": ids}
+    total = collection.count_documents(query)
+    done = 0
+    duplicates = 0
+    # Set when an article already counted by the rollups changes between canonical and duplicate
+    counts_changed = False
+    # Set when any article changes between canonical and duplicate, which changes the topic model corpus
+    corpus_changed = False
+    projection = {"actual_text": 1, "text": 1, "title": 1, "dedup": 1, "sentiment": 1, "ner": 1}
+    documents = collection.find(query, projection).sort("_id", ASCENDING).batch_size(Config.DEDUP_BATCH_SIZE)
+    with BulkWriter(collection) as writer:
+        for docs in utils.batched(documents, Config.DEDUP_BATCH_SIZE):
+            with metrics.timer("dedup_signature"):
+                signatures = [signature(doc) for doc in docs]
+            hashes = list({sig["hash"] for sig in signatures if sig})
+            band_values = list({band for sig in signatures if sig for band in sig["bands"]})
+            canonicals = _Canonicals()
+            earlier = collection.find(
+                {"dedup.canonical": True, "_id": {"$lt": docs[-1]["_id"], "$nin": [doc["_id"] for doc in docs]}, "$or": [{"dedup.hash": {"$in": hashes}}, {"dedup.bands": {"$in": band_values}}]},
+                {"dedup": 1}
+            )
+            for doc in earlier:
+                canonicals.add(doc["_id"], doc["dedup"])
+            for doc, sig in zip(docs, signatures):
+                cluster = canonicals.match(sig) if sig else None
+                dedup = {"hash": None, "minhash": None, "bands": [], "cluster": doc["_id"], "canonical": True}
+                if sig:
+                    dedup.update(sig)
+                    if cluster is None:
+                        canonicals.add(doc["_id"], sig)
+                    else:
+                        dedup.update(cluster=cluster, canonical=False)
+                        duplicates += 1
+                was_canonical = (doc.get("dedup") or {}).get("canonical") is not False
+                if was_canonical != dedup["canonical"]:
+                    corpus_changed = True
+                    if "sentiment" in doc or "ner" in doc:
+                        counts_changed = True
+                writer.update_one({"_id": doc["_id"]}, {"$set": {"dedup": dedup}})
+            writer.flush()
+            done += len(docs)
+            if progress:
+                progress(done, total)
+    if corpus_changed:
+        rollups.bump_corpus_version(collection)
+    return {"processed": done, "duplicates": duplicates, "counts_changed": counts_changed}
@@ -0,0 +1,185 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+import app.backfill as backfill
+from app.config import Config
+import app.metrics as metrics
+
+WORKER_STATE = "enrichment_worker"
+ENRICH_MODES = ["auto", "stream", "poll"]
+STREAM = "stream"
+POLL = "poll"
+# $changeStream on a standalone mongod
+NOT_REPLICA_SET = 40573
+# The resume token has fallen off the oplog
+HISTORY_LOST = [280, 286]
+INSERTS = [{"$match": {"operationType": "insert"}}, {"$project": {"documentKey": 1}}]
+PENDING = {"$or": [{"sentiment": {"$exists": False}}, {"ner": {"$exists": False}}]}
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+class EnrichmentWorker:
+    def __init__(self):
+        self.news = None
+        self.state = None
+        self.mode = None
+        self.last_id = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._stream_supported = True
+        self.stats = {"batches": 0, "documents": 0, "last_batch_at": None, "last_lag_seconds": None, "error": None}
+
+    def start(self, collection):
+        if Config.ENRICH_MODE not in ENRICH_MODES:
+            raise ValueError("Invalid ENRICH_MODE specified")
+        self.news = collection
+        self.state = collection.database[Config.STATE_COLLECTION]
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="enrichment", daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        self._stop.set()
+        if self._thread is not None:
+            # A batch cut short is not acknowledged, so it is enriched again on the next start
+            self._thread.join(timeout=Config.ENRICH_BATCH_WAIT + 5)
+            self._thread = None
+
+    def status(self):
+        saved = self.state.find_one({"_id": WORKER_STATE}) if self.state is not None else None
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "mode": self.mode,
+            "last_id": str(self.last_id) if self.last_id is not None else None,
+            "resumable": bool(saved and saved.get("resume_token")),
+            **self.stats,
+        }
+
+    def _saved(self):
+        return self.state.find_one({"_id": WORKER_STATE}) or {}
+
+    def _save(self, **fields):
+        self.state.update_one(
+            {"_id": WORKER_STATE},
+            {"$set": {"last_id": self.last_id, "mode": self.mode, "updated_at": _now(), **fields}},
+            upsert=True
+        )
+
+    def _run(self):
+        saved = self._saved()
+        self.last_id = saved.get("last_id")
+        if self.last_id is None:
+            # A first start tails from the newest article; anything older than ENRICH_POLL_LOOKBACK is left to the backfill jobs
+            newest = self.news.find_one({}, {"_id": 1}, sort=[("_id", DESCENDING)])
+            self.last_id = newest["_id"] if newest else None
+            self.mode = POLL if Config.ENRICH_MODE == POLL else STREAM
+            self._save()
+        while not self._stop.is_set():
+            try:
+                if Config.ENRICH_MODE != POLL and self._stream_supported:
+                    self._watch()
+                else:
+                    self._poll()
+            except OperationFailure as e:
+                if e.code == NOT_REPLICA_SET and Config.ENRICH_MODE == "auto":
+                    print("Change streams need a replica set, the enrichment worker is polling instead")
+                    self._stream_supported = False
+                elif e.code in HISTORY_LOST:
+                    print("Enrichment resume token is no longer in the oplog, catching up from the last article")
+                    self._save(resume_token=None)
+                else:
+                    self._failed(e)
+            except Exception as e:
+                self._failed(e)
+
+    def _failed(self, e):
+        print(f"Enrichment worker failed, retrying in {Config.ENRICH_RETRY_DELAY}s: {e}")
+        self.stats["error"] = str(e)
+        self._stop.wait(Config.ENRICH_RETRY_DELAY)
+
+    def _enrich(self, ids):
+        ids = list(dict.fromkeys(ids))
+        metrics.observe_batch("enrich", len(ids))
+        with metrics.timer("enrich"):
+            result = backfill.enrich_documents(self.news, ids, fetch=Config.ENRICH_FETCH)
+        newest = max(ids)
+        if self.last_id is None or newest > self.last_id:
+            self.last_id = newest
+        self.stats["batches"] += 1
+        self.stats["documents"] += result["found"]
+        self.stats["last_batch_at"] = _now()
+        self.stats["error"] = None
+        oldest = min(ids)
+        if isinstance(oldest, ObjectId):
+            # ObjectIds carry their insert time
+            self.stats["last_lag_seconds"] = round((_now() - oldest.generation_time).total_seconds(), 1)
+        print(f"Enriched {result['found']} new articles: {result['sentiment']} sentiment, {result['ner']} ner, {result['fetched']} fetched, {result['skipped']} without text")
+        return result
+
+    def _floor(self):
+        # Inserts from several clients do not arrive in strict _id order, so a poll looks back a little
+        if isinstance(self.last_id, ObjectId):
+            return ObjectId.from_datetime(self.last_id.generation_time - timedelta(seconds=Config.ENRICH_POLL_LOOKBACK))
+        return self.last_id
+
+    def _poll_once(self):
+        query = {"$and": [PENDING, backfill.enrich_due(_now())]}
+        floor = self._floor()
+        if floor is not None:
+            query["_id"] = {"$gt": floor}
+        ids = [doc["_id"] for doc in self.news.find(query, {"_id": 1}).sort("_id", ASCENDING).limit(Config.ENRICH_BATCH_SIZE)]
+        if ids:
+            self._enrich(ids)
+            self._save()
+        return len(ids)
+
+    def _poll_more(self):
+        # A full batch means there may be more; articles that stay pending must not keep the loop spinning
+        before = self.last_id
+        return self._poll_once() >= Config.ENRICH_BATCH_SIZE and self.last_id != before
+
+    def _catch_up(self):
+        while not self._stop.is_set() and self._poll_more():
+            pass
+
+    def _poll(self):
+        self.mode = POLL
+        while not self._stop.is_set():
+            if not self._poll_more():
+                self._stop.wait(Config.ENRICH_POLL_INTERVAL)
+
+    def _watch(self):
+        token = self._saved().get("resume_token")
+        wait_ms = max(int(Config.ENRICH_BATCH_WAIT * 1000), 1)
+        with self.news.watch(INSERTS, resume_after=token, max_await_time_ms=wait_ms) as stream:
+            self.mode = STREAM
+            if token is None:
+                # The stream is already open, so nothing inserted during the catch up is missed
+                self._catch_up()
+            ids = []
+            deadline = None
+            saved_at = time.monotonic()
+            while not self._stop.is_set():
+                change = stream.try_next()
+                if change is not None:
+                    ids.append(change["documentKey"]["_id"])
+                    deadline = deadline or time.monotonic() + Config.ENRICH_BATCH_WAIT
+                    if len(ids) < Config.ENRICH_BATCH_SIZE and time.monotonic() < deadline:
+                        continue
+                if ids:
+                    self._enrich(ids)
+                    ids, deadline = [], None
+                elif time.monotonic() - saved_at < Config.ENRICH_TOKEN_SAVE_INTERVAL:
+                    continue
+                # Acknowledged only once the batch is written; an unacknowledged batch is delivered again
+                self._save(resume_token=stream.resume_token)
+                saved_at = time.monotonic()
+
+
+worker = EnrichmentWorker()
@@ -0,0 +1,135 @@
+import re
+import unicodedata
+from datetime import datetime, timezone
+from pymongo import ASCENDING, DeleteMany, UpdateOne
+from app.config import Config
+from app.writer import BulkWriter
+import app.utils as utils
+from app.rollups import parse_date
+
+ENTITY_INDEX_STATE = "entity_index"
+# Bumped when mentions change shape, so startup rebuilds an index built by an older version
+ENTITY_INDEX_VERSION = 2
+
+
+def mentions_collection(news):
+    return news.database[Config.ENTITY_COLLECTION]
+
+
+def _state(news):
+    return news.database[Config.STATE_COLLECTION]
+
+
+def canonical_entity(name):
+    # "U.S.", "u.s" and " US " all become "us"
+    name = unicodedata.normalize("NFKC", str(name)).casefold().replace(".", "")
+    return re.sub(r"\s+", " ", name).strip()
+
+
+def mention_operations(doc, ner_dict):
+    article_id = doc.get("_id")
+    operations = []
+    seen = set()
+    for label, names in (ner_dict or {}).items():
+        for name in names or []:
+            entity = canonical_entity(name)
+            if not entity or (label, entity) in seen:
+                continue
+            seen.add((label, entity))
+            operations.append(UpdateOne(
+                {"label": label, "entity": entity, "article_id": article_id},
+                {"$set": {"name": name, "publishedDate": parse_date(doc.get("publishedDate"))}},
+                upsert=True
+            ))
+    # Unordered bulk writes may run the delete after the upserts, so it must not match what is kept
+    stale = {"article_id": article_id}
+    if seen:
+        stale["$nor"] = [{"label": label, "entity": entity} for label, entity in seen]
+    operations.append(DeleteMany(stale))
+    return operations
+
+
+class EntityIndexWriter:
+    def __init__(self, news):
+        self.writer = BulkWriter(mentions_collection(news))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+
+    def ner(self, doc, ner_dict):
+        for operation in mention_operations(doc, ner_dict):
+            self.writer.add(operation)
+
+    def flush(self):
+        self.writer.flush()
+
+
+def record_ner(news, doc, ner_dict):
+    with EntityIndexWriter(news) as index:
+        index.ner(doc, ner_dict)
+
+
+def ensure_indexes(news):
+    mentions = mentions_collection(news)
+    mentions.create_index([("label", ASCENDING), ("entity", ASCENDING), ("article_id", ASCENDING)], name="label_entity_article", unique=True)
+    mentions.create_index([("label", ASCENDING), ("entity", ASCENDING), ("publishedDate", ASCENDING), ("_id", ASCENDING)], name="label_entity_published")
+    mentions.create_index([("article_id", ASCENDING)], name="article_id")
+
+
+def index_ready(news):
+    return _state(news).find_one({"_id": ENTITY_INDEX_STATE, "built_at": {"$exists": True}, "version": ENTITY_INDEX_VERSION}) is not None
+
+
+def rebuild_index(news, progress=None):
+    ensure_indexes(news)
+    _state(news).delete_one({"_id": ENTITY_INDEX_STATE})
+    mentions_collection(news).delete_many({})
+    query = {"ner": {"$type": "object"}}
+    total = news.count_documents(query)
+    done = 0
+    with EntityIndexWriter(news) as index:
+        documents = news.find(query, {"ner": 1, "publishedDate": 1}).batch_size(Config.BULK_WRITE_SIZE)
+        for docs in utils.batched(documents, Config.BULK_WRITE_SIZE):
+            for doc in docs:
+                index.ner(doc, doc.get("ner"))
+            done += len(docs)
+            if progress:
+                progress(done, total)
+    _state(news).update_one({"_id": ENTITY_INDEX_STATE}, {"$set": {"built_at": datetime.now(timezone.utc), "version": ENTITY_INDEX_VERSION}}, upsert=True)
+    return {"articles": done, "mentions": mentions_collection(news).estimated_document_count()}
+
+
+def find_mentions(news, label, name, start=None, end=None, page_size=100, cursor=None):
+    query = {"label": label, "entity": canonical_entity(name)}
+    if start is not None or end is not None:
+        query["publishedDate"] = {}
+        if start is not None:
+            query["publishedDate"]["$gte"] = start
+        if end is not None:
+            query["publishedDate"]["$lt"] = end
+    if cursor is not None:
+        query = {"$and": [query, utils.cursor_query(cursor, "publishedDate")]}
+
+    mentions = list(mentions_collection(news).find(query).sort(utils.cursor_sort("publishedDate")).limit(page_size + 1))
+    next_cursor = None
+    if len(mentions) > page_size:
+        mentions = mentions[:page_size]
+        next_cursor = utils.encode_cursor(mentions[-1], "publishedDate")
+
+    articles = {
+        doc["_id"]: doc for doc in news.find({"_id": {"$in": [mention["article_id"] for mention in mentions]}}, {"title": 1, "url": 1})
+    }
+    data = []
+    for mention in mentions:
+        article = articles.get(mention["article_id"], {})
+        data.append({
+            "article_id": str(mention["article_id"]),
+            "publishedDate": mention.get("publishedDate"),
+            "name": mention.get("name"),
+            "title": article.get("title"),
+            "url": article.get("url"),
+        })
+    return {"label": label, "entity": canonical_entity(name), "data": data, "next_cursor": next_cursor}
@@ -0,0 +1,191 @@
+import asyncio
+import random
+from collections import Counter
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+import httpx
+from newspaper import Article
+from app.config import Config
+from app.writer import BulkWriter
+import app.rollups as rollups
+import app.metrics as metrics
+
+FETCH_MODES = ["missing", "refresh"]
+# "NA" is what the earlier one-article-at-a-time fetch stored when it failed
+MISSING_TEXT = [None, "", "NA"]
+
+OK = "ok"
+NOT_MODIFIED = "not_modified"
+# Failure classes recorded in fetch.status
+INVALID_URL = "invalid_url"
+TIMEOUT = "timeout"
+CONNECTION_ERROR = "connection_error"
+HTTP_CLIENT_ERROR = "http_client_error"
+HTTP_SERVER_ERROR = "http_server_error"
+# A RETRY_STATUSES response that was still failing after the retries
+HTTP_RETRYABLE_ERROR = "http_retryable_error"
+PARSE_ERROR = "parse_error"
+EMPTY_TEXT = "empty_text"
+# Not tried again by later runs unless retry_failed is set
+PERMANENT_FAILURES = [INVALID_URL, HTTP_CLIENT_ERROR, PARSE_ERROR, EMPTY_TEXT]
+RETRY_STATUSES = [408, 429, 500, 502, 503, 504]
+
+
+def new_client():
+    return httpx.AsyncClient(
+        headers={"User-Agent": Config.FETCH_USER_AGENT},
+        # Waiting for a pooled connection is bounded by the semaphores, not by a timeout
+        timeout=httpx.Timeout(Config.FETCH_TIMEOUT, pool=None),
+        limits=httpx.Limits(max_connections=Config.FETCH_CONCURRENCY, max_keepalive_connections=Config.FETCH_CONCURRENCY),
+        follow_redirects=True,
+    )
+
+
+class HostLimiter:
+    def __init__(self, per_host=None):
+        self.per_host = per_host or Config.FETCH_PER_HOST
+        self._semaphores = {}
+
+    def __call__(self, url):
+        host = urlsplit(url).hostname or ""
+        if host not in self._semaphores:
+            self._semaphores[host] = asyncio.Semaphore(self.per_host)
+        return self._semaphores[host]
+
+
+def _backoff(attempt, retry_after=None):
+    if retry_after is not None and retry_after.isdigit():
+        return min(float(retry_after), Config.FETCH_MAX_BACKOFF)
+    delay = Config.FETCH_BACKOFF * (2 ** attempt)
+    return min(delay + random.uniform(0, delay), Config.FETCH_MAX_BACKOFF)
+
+
+async def fetch_url(client, url, etag=None, last_modified=None):
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    result = {"status": None, "http_status": None, "attempts": 0, "error": None}
+    for attempt in range(Config.FETCH_RETRIES + 1):
+        result["attempts"] = attempt + 1
+        retry_after = None
+        try:
+            response = await client.get(url, headers=headers)
+        except (httpx.InvalidURL, httpx.UnsupportedProtocol) as e:
+            return {**result, "status": INVALID_URL, "error": str(e)}
+        except httpx.TimeoutException as e:
+            result.update(status=TIMEOUT, error=str(e) or type(e).__name__)
+        except httpx.TransportError as e:
+            result.update(status=CONNECTION_ERROR, error=str(e) or type(e).__name__)
+        else:
+            status = response.status_code
+            result["http_status"] = status
+            if status == 304:
+                return {**result, "status": NOT_MODIFIED, "error": None}
+            if status < 400:
+                return {
+                    **result,
+                    "status": OK,
+                    "error": None,
+                    "html": response.text,
+                    "etag": response.headers.get("etag"),
+                    "last_modified": response.headers.get("last-modified"),
+                }
+            if status not in RETRY_STATUSES:
+                return {**result, "status": HTTP_CLIENT_ERROR if status < 500 else HTTP_SERVER_ERROR, "error": f"HTTP {status}"}
+            result.update(status=HTTP_RETRYABLE_ERROR, error=f"HTTP {status}")
+            retry_after = response.headers.get("retry-after")
+        if attempt < Config.FETCH_RETRIES:
+            await asyncio.sleep(_backoff(attempt, retry_after))
+    return result
+
+
+@metrics.timed("parse_article")
+def parse_article(url, html):
+    # Only the body text is needed; Article.nlp() (keywords and summary) is skipped
+    article = Article(url)
+    article.set_html(html)
+    article.parse()
+    return article.text
+
+
+async def fetch_document(client, limiter, slots, doc, conditional=False):
+    url = doc.get("url")
+    previous = doc.get("fetch") or {}
+    # The host comes first: a task queued behind a busy host must not hold a slot other hosts could use
+    async with limiter(url), slots:
+        result = await fetch_url(
+            client,
+            url,
+            etag=previous.get("etag") if conditional else None,
+            last_modified=previous.get("last_modified") if conditional else None,
+        )
+    html = result.pop("html", None)
+    if result["status"] == OK:
+        try:
+            text = await asyncio.to_thread(parse_article, url, html)
+        except Exception as e:
+            return {**result, "status": PARSE_ERROR, "error": str(e)}, None
+        if not text.strip():
+            return {**result, "status": EMPTY_TEXT}, None
+        return result, text
+    return result, None
+
+
+def fetch_query(mode="missing", retry_failed=False):
+    query = {"url": {"$nin": [None, ""]}}
+    if mode == "missing":
+        query["actual_text"] = {"$in": MISSING_TEXT}
+        if not retry_failed:
+            query["fetch.status"] = {"$nin": PERMANENT_FAILURES}
+    return query
+
+
+def _fetch_update(result, text):
+    update = {f"fetch.{field}": result.get(field) for field in ["status", "http_status", "attempts", "error"]}
+    update["fetch.fetched_at"] = datetime.now(timezone.utc)
+    if result["status"] == OK:
+        update["fetch.etag"] = result.get("etag")
+        update["fetch.last_modified"] = result.get("last_modified")
+        update["actual_text"] = text
+    return {"$set": update}
+
+
+async def fetch_documents(collection, mode="missing", retry_failed=False, progress=None, client=None, ids=None):
+    if mode not in FETCH_MODES:
+        raise ValueError("Invalid mode specified")
+    query = fetch_query(mode, retry_failed)
+    if ids is not None:
+        query["_id"] = {"$in": ids}
+    total = collection.count_documents(query)
+    counts = Counter()
+    done = 0
+    last_id = None
+    owns_client = client is None
+    client = client or new_client()
+    limiter = HostLimiter()
+    slots = asyncio.Semaphore(Config.FETCH_CONCURRENCY)
+    try:
+        with BulkWriter(collection) as writer:
+            while True:
+                # Keyset batches: no cursor is held open while a batch of slow hosts is being fetched
+                batch_query = query if last_id is None else {"$and": [query, {"_id": {"$gt": last_id}}]}
+                docs = list(collection.find(batch_query, {"url": 1, "fetch": 1}).sort("_id", 1).limit(Config.FETCH_BATCH_SIZE))
+                if not docs:
+                    break
+                results = await asyncio.gather(*[fetch_document(client, limiter, slots, doc, conditional=mode == "refresh") for doc in docs])
+                for doc, (result, text) in zip(docs, results):
+                    counts[result["status"]] += 1
+                    writer.update_one({"_id": doc["_id"]}, _fetch_update(result, text))
+                writer.flush()
+                if any(result["status"] == OK for result, _ in results):
+                    rollups.bump_corpus_version(collection)
+                last_id = docs[-1]["_id"]
+                done += len(docs)
+                if progress:
+                    progress(done, total)
+    finally:
+        if owns_client:
+            await client.aclose()
+    return {"total": total, "fetched": counts[OK], "not_modified": counts[NOT_MODIFIED], "failed": {status: count for status, count in counts.items() if status not in [OK, NOT_MODIFIED]}}
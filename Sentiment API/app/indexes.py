@@ -0,0 +1,98 @@
+import re
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import ASCENDING, TEXT, IndexModel
+from pymongo.collation import Collation
+from pymongo.errors import OperationFailure
+
+# strength=2 compares case-insensitively; queries must pass the same collation to use these indexes
+CASE_INSENSITIVE = Collation(locale="en", strength=2)
+
+EQUALITY_COLUMNS = ["disruptionType", "severity", "location"]
+PREFIX_COLUMNS = ["url", "imageUrl"]
+TEXT_COLUMNS = ["title", "text", "actual_text"]
+NUMERIC_COLUMNS = ["lat", "lng", "radius"]
+
+NEWS_INDEXES = [
+    IndexModel([("publishedDate", ASCENDING)], name="publishedDate_1"),
+    IndexModel([("disruptionType", ASCENDING), ("publishedDate", ASCENDING)], name="disruptionType_publishedDate_ci", collation=CASE_INSENSITIVE),
+    IndexModel([("severity", ASCENDING), ("publishedDate", ASCENDING)], name="severity_publishedDate_ci", collation=CASE_INSENSITIVE),
+    IndexModel([("location", ASCENDING), ("publishedDate", ASCENDING)], name="location_publishedDate_ci", collation=CASE_INSENSITIVE),
+    IndexModel([("url", ASCENDING)], name="url_ci", collation=CASE_INSENSITIVE),
+    IndexModel([("imageUrl", ASCENDING)], name="imageUrl_ci", collation=CASE_INSENSITIVE),
+    IndexModel(
+        [("title", TEXT), ("text", TEXT), ("actual_text", TEXT)],
+        name="news_text",
+        weights={"title": 10, "text": 5, "actual_text": 1},
+        default_language="english",
+    ),
+]
+
+
+def ensure_indexes(collection):
+    created = []
+    for index in NEWS_INDEXES:
+        try:
+            created.extend(collection.create_indexes([index]))
+        except OperationFailure as e:
+            # e.g. an index with the same keys but other options already exists; leave it alone
+            print(f"Could not create index {index.document.get('name')}: {e}")
+    return created
+
+
+def index_report(collection):
+    existing = collection.index_information()
+    return {
+        "present": [index.document.get("name") for index in NEWS_INDEXES if index.document.get("name") in existing],
+        "missing": [index.document.get("name") for index in NEWS_INDEXES if index.document.get("name") not in existing],
+        "all": sorted(existing.keys()),
+    }
+
+
+def _date_range(value):
+    # Accepts 2024, 2024-12 or 2024-12-17 and matches the whole year, month or day
+    if re.fullmatch(r"\d{4}", value):
+        start = datetime(int(value), 1, 1)
+        return start, datetime(start.year + 1, 1, 1)
+    if re.fullmatch(r"\d{4}-\d{2}", value):
+        start = datetime.strptime(value, "%Y-%m")
+        return start, (start + timedelta(days=32)).replace(day=1)
+    if re.fullmatch(r"\d{4}-\d{2}-\d{2}", value):
+        start = datetime.strptime(value, "%Y-%m-%d")
+        return start, start + timedelta(days=1)
+    start = datetime.fromisoformat(value.replace("Z", ""))
+    return start, start + timedelta(seconds=1)
+
+
+def column_filter(column, value):
+    # (query, collation) for value in column: the cheapest index-backed match that stays case-insensitive
+    if column == "_id":
+        return {column: ObjectId(value)}, None
+    if column in EQUALITY_COLUMNS:
+        return {column: value}, CASE_INSENSITIVE
+    if column in PREFIX_COLUMNS:
+        # A range over a case-insensitive index is an anchored, case-insensitive prefix match
+        return {column: {"$gte": value, "$lt": value + "\uffff"}}, CASE_INSENSITIVE
+    if column in TEXT_COLUMNS:
+        # Quoted so the text index matches the phrase, not any of its words
+        phrase = value.replace('"', " ")
+        return {"$text": {"$search": f'"{phrase}"'}}, None
+    if column in NUMERIC_COLUMNS:
+        try:
+            return {column: float(value)}, None
+        except ValueError:
+            pass
+    if column == "isdeleted" and value.lower() in ["true", "false"]:
+        return {column: value.lower() == "true"}, None
+    if column == "publishedDate":
+        try:
+            start, end = _date_range(value)
+        except ValueError:
+            pass
+        else:
+            # The ingest stores ISO strings, so they are matched by prefix; dates stored as datetimes by range
+            return {"$or": [
+                {column: {"$gte": value, "$lt": value + "\uffff"}},
+                {column: {"$gte": start, "$lt": end}},
+            ]}, None
+    return {column: {'$regex': value, '$options': 'i'}}, None
@@ -0,0 +1,274 @@
+import threading
+from collections import deque
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pymongo import DESCENDING
+import app.backfill as backfill
+import app.rollups as rollups
+import app.entities as entities
+import app.topics as topics
+from app.config import Config
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+ACTIVE_STATUSES = [QUEUED, RUNNING]
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _sentiment_job(collection, progress):
+    return backfill.backfill_sentiment(collection, progress=progress)
+
+
+def _ner_job(collection, progress, mode="incremental", verify_hash=False, restart=False):
+    if mode not in backfill.NER_MODES:
+        raise ValueError("Invalid mode specified")
+    return backfill.backfill_ner(collection, mode=mode, verify_hash=verify_hash, restart=restart, progress=progress)
+
+
+def _topic_model_job(collection, progress, num_topics, relevant_terms=10, online=False, coherence="sample", visual="background"):
+    # Already in the background, so deferred work is done here rather than in another job
+    coherence = "full" if coherence == "background" else coherence
+    visual = "now" if visual == "background" else visual
+    score_data, topics_data, _ = backfill.train_topic_model(
+        collection, int(num_topics), int(relevant_terms), progress=progress, online=bool(online), coherence=coherence, visual=visual
+    )
+    return {"score": score_data, "data": topics_data}
+
+
+def _topic_extras_job(collection, progress, num_topics, online=False, coherence=True, visual=True):
+    return topics.topic_extras(collection, int(num_topics), online=bool(online), coherence=bool(coherence), visual=bool(visual), progress=progress)
+
+
+def _fetch_job(collection, progress, mode="missing", retry_failed=False):
+    return backfill.backfill_actual_text(collection, mode=mode, retry_failed=bool(retry_failed), progress=progress)
+
+
+def _dedup_job(collection, progress, mode="incremental"):
+    return backfill.dedup_documents(collection, mode=mode, progress=progress)
+
+
+def _rollups_job(collection, progress):
+    return rollups.rebuild_rollups(collection, progress=progress)
+
+
+def _entity_index_job(collection, progress):
+    return entities.rebuild_index(collection, progress=progress)
+
+
+# kind -> (function, accepted params, required params)
+JOB_KINDS = {
+    "sentiment": (_sentiment_job, [], []),
+    "ner": (_ner_job, ["mode", "verify_hash", "restart"], []),
+    "topic_model": (_topic_model_job, ["num_topics", "relevant_terms", "online", "coherence", "visual"], ["num_topics"]),
+    "topic_extras": (_topic_extras_job, ["num_topics", "online", "coherence", "visual"], ["num_topics"]),
+    "fetch": (_fetch_job, ["mode", "retry_failed"], []),
+    "dedup": (_dedup_job, ["mode"], []),
+    "rollups": (_rollups_job, [], []),
+    "entity_index": (_entity_index_job, [], []),
+}
+
+
+class JobProgress:
+    def __init__(self, manager, job_id):
+        self.manager = manager
+        self.job_id = job_id
+        self.started = time.monotonic()
+        self.last_write = 0.0
+
+    def __call__(self, done, total=None):
+        if self.manager.cancel_requested(self.job_id):
+            raise JobCancelled()
+        now = time.monotonic()
+        # Progress is written at most once per interval, and always when a job finishes
+        if now - self.last_write < Config.JOB_PROGRESS_INTERVAL and done != total:
+            return
+        self.last_write = now
+        elapsed = max(now - self.started, 1e-6)
+        rate = done / elapsed
+        eta = (total - done) / rate if total and rate > 0 else None
+        self.manager.jobs.update_one(
+            {"_id": self.job_id},
+            {"$set": {
+                "done": done,
+                "total": total,
+                "docs_per_second": round(rate, 2),
+                "eta_seconds": round(eta, 1) if eta is not None else None,
+                "updated_at": _now(),
+            }}
+        )
+
+
+class JobManager:
+    def __init__(self):
+        self.news = None
+        self.jobs = None
+        self._executor = None
+        self._cancelled = set()
+        self._lock = threading.Lock()
+        self._kind_slots = {}
+        # Queued jobs whose kind has no free slot, handed to the executor once one frees up
+        self._waiting = {}
+
+    def start(self, collection):
+        self.news = collection
+        self.jobs = collection.database[Config.JOBS_COLLECTION]
+        self.jobs.create_index([("created_at", DESCENDING)])
+        self._executor = ThreadPoolExecutor(max_workers=Config.JOB_WORKERS, thread_name_prefix="job")
+        self._kind_slots = {kind: threading.BoundedSemaphore(Config.JOB_KIND_LIMIT) for kind in JOB_KINDS}
+        self._waiting = {kind: deque() for kind in JOB_KINDS}
+        # Jobs that were queued or running when the process stopped are picked up again;
+        # the backfills continue from their saved cursors
+        for job in self.jobs.find({"status": {"$in": ACTIVE_STATUSES}}):
+            if job.get("cancel_requested"):
+                self._finish(job["_id"], CANCELLED)
+                continue
+            print(f"Requeueing job {job['_id']} ({job.get('kind')}) after restart")
+            update = {"status": QUEUED}
+            if job.get("started_at") and job.get("params", {}).get("restart"):
+                # The saved cursor was already discarded on the first attempt; keep the progress made since
+                update["params.restart"] = False
+            self.jobs.update_one({"_id": job["_id"]}, {"$set": update, "$inc": {"restarts": 1}})
+            self._executor.submit(self._run, job["_id"])
+
+    def shutdown(self):
+        if self._executor is not None:
+            # Running jobs stay marked as running and are requeued on the next start
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def submit(self, kind, params=None):
+        params = params or {}
+        if kind not in JOB_KINDS:
+            raise ValueError("Invalid job kind specified")
+        _, accepted, required = JOB_KINDS[kind]
+        unexpected = [key for key in params if key not in accepted]
+        if unexpected:
+            raise ValueError(f"Unexpected job parameter: {', '.join(unexpected)}")
+        missing = [key for key in required if params.get(key) is None]
+        if missing:
+            raise ValueError(f"Job parameter not specified: {', '.join(missing)}")
+
+        job = {
+            "_id": uuid.uuid4().hex,
+            "kind": kind,
+            "params": params,
+            "status": QUEUED,
+            "cancel_requested": False,
+            "restarts": 0,
+            "done": 0,
+            "total": None,
+            "docs_per_second": None,
+            "eta_seconds": None,
+            "result": None,
+            "error": None,
+            "created_at": _now(),
+            "started_at": None,
+            "finished_at": None,
+        }
+        self.jobs.insert_one(job)
+        self._executor.submit(self._run, job["_id"])
+        return job
+
+    def active(self, kind, params=None):
+        # params narrows the match to jobs submitted with those values, e.g. the same num_topics
+        query = {"kind": kind, "status": {"$in": ACTIVE_STATUSES}}
+        for key, value in (params or {}).items():
+            query[f"params.{key}"] = value
+        return self.jobs.find_one(query)
+
+    def get(self, job_id):
+        return self.jobs.find_one({"_id": job_id})
+
+    def list(self, limit=20, status=None):
+        query = {} if status is None else {"status": status}
+        return list(self.jobs.find(query).sort("created_at", DESCENDING).limit(limit))
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None or job.get("status") not in ACTIVE_STATUSES:
+            return job
+        with self._lock:
+            self._cancelled.add(job_id)
+        self.jobs.update_one({"_id": job_id}, {"$set": {"cancel_requested": True}})
+        # Queued jobs never get to a progress check, so they are cancelled right away
+        self.jobs.update_one({"_id": job_id, "status": QUEUED}, {"$set": {"status": CANCELLED, "finished_at": _now()}})
+        return self.get(job_id)
+
+    def cancel_requested(self, job_id):
+        with self._lock:
+            return job_id in self._cancelled
+
+    def _finish(self, job_id, status, result=None, error=None):
+        with self._lock:
+            self._cancelled.discard(job_id)
+        self.jobs.update_one(
+            {"_id": job_id},
+            {"$set": {"status": status, "result": result, "error": error, "finished_at": _now(), "eta_seconds": None}}
+        )
+
+    def _release(self, kind):
+        self._kind_slots[kind].release()
+        self._dispatch(kind)
+
+    def _dispatch(self, kind):
+        with self._lock:
+            if not self._waiting[kind] or self._executor is None:
+                return
+            if not self._kind_slots[kind].acquire(blocking=False):
+                return
+            job_id = self._waiting[kind].popleft()
+        try:
+            self._executor.submit(self._run, job_id, kind)
+        except RuntimeError:
+            # Shutting down; the job is still queued in Mongo and is picked up on the next start
+            self._kind_slots[kind].release()
+
+    def _run(self, job_id, slot_kind=None):
+        # slot_kind is set when _dispatch already took a slot of that kind for this job
+        job = self.get(job_id)
+        if job is None or job.get("status") != QUEUED:
+            with self._lock:
+                self._cancelled.discard(job_id)
+            if slot_kind is not None:
+                self._release(slot_kind)
+            return
+        kind = job["kind"]
+        if slot_kind is None and not self._kind_slots[kind].acquire(blocking=False):
+            # Blocking here would tie up a worker thread that jobs of other kinds could use
+            with self._lock:
+                self._waiting[kind].append(job_id)
+            # The running job may have released its slot before the append
+            self._dispatch(kind)
+            return
+        func, _, _ = JOB_KINDS[kind]
+        try:
+            if self.cancel_requested(job_id):
+                self._finish(job_id, CANCELLED)
+                return
+            self.jobs.update_one({"_id": job_id}, {"$set": {"status": RUNNING, "started_at": _now()}})
+            try:
+                result = func(self.news, JobProgress(self, job_id), **job.get("params", {}))
+                self._finish(job_id, COMPLETED, result=result)
+            except JobCancelled:
+                print(f"Job {job_id} cancelled")
+                self._finish(job_id, CANCELLED)
+            except Exception as e:
+                print(f"Job {job_id} failed: {e}")
+                self._finish(job_id, FAILED, error=str(e))
+        finally:
+            self._release(kind)
+
+
+manager = JobManager()
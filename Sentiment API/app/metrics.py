@@ -0,0 +1,183 @@
+import contextvars
+import functools
+import inspect
+import time
+from contextlib import contextmanager
+from fastapi.routing import APIRoute
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+from pymongo import monitoring
+from app.config import Config
+
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, float("inf"))
+
+REQUEST_SECONDS = Histogram("api_request_seconds", "Time to answer a request", ["method", "route", "status"])
+ENDPOINT_SECONDS = Histogram("api_endpoint_seconds", "Time spent in the route function", ["route"])
+SERIALIZE_SECONDS = Histogram("api_serialize_seconds", "Time spent outside the route function: parameter validation and response serialization", ["route"])
+STAGE_SECONDS = Histogram("pipeline_stage_seconds", "Time spent in a pipeline stage", ["stage"])
+BATCH_SIZE = Histogram("pipeline_batch_size", "Items handed to a pipeline stage per call", ["stage"], buckets=SIZE_BUCKETS)
+MONGO_SECONDS = Histogram("mongo_command_seconds", "Round trip time of MongoDB commands", ["command", "collection"])
+MONGO_DOCUMENTS = Histogram("mongo_documents_returned", "Documents returned per find, aggregate or getMore batch", ["command", "collection"], buckets=SIZE_BUCKETS)
+MONGO_FAILURES = Counter("mongo_command_failures_total", "Failed MongoDB commands", ["command", "collection"])
+
+# (stage, seconds) of the current request, only collected when tracing is on
+_spans = contextvars.ContextVar("spans", default=None)
+# Seconds spent in the current route function, to tell it apart from serialization
+_endpoint = contextvars.ContextVar("endpoint", default=None)
+
+
+def _span(stage, seconds):
+    spans = _spans.get()
+    if spans is not None:
+        spans.append((stage, seconds))
+
+
+@contextmanager
+def timer(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(stage).observe(elapsed)
+        _span(stage, elapsed)
+
+
+def timed(stage):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def observe_batch(stage, size):
+    BATCH_SIZE.labels(stage).observe(size)
+
+
+def _collection(command_name, command):
+    if command_name == "getMore":
+        return command.get("collection")
+    value = command.get(command_name)
+    return value if isinstance(value, str) else None
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    # Server side scan counts are only in explain output, so documents returned stand in for documents scanned
+    def __init__(self):
+        self._collections = {}
+
+    def started(self, event):
+        collection = _collection(event.command_name, event.command)
+        if collection is not None:
+            self._collections[(event.connection_id, event.request_id)] = collection
+
+    def succeeded(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), None)
+        if collection is None:
+            return
+        seconds = event.duration_micros / 1e6
+        MONGO_SECONDS.labels(event.command_name, collection).observe(seconds)
+        _span("mongo", seconds)
+        cursor = event.reply.get("cursor") if isinstance(event.reply, dict) else None
+        if cursor:
+            batch = cursor.get("firstBatch", cursor.get("nextBatch"))
+            if batch is not None:
+                MONGO_DOCUMENTS.labels(event.command_name, collection).observe(len(batch))
+
+    def failed(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), None)
+        if collection is not None:
+            MONGO_FAILURES.labels(event.command_name, collection).inc()
+
+
+def _endpoint_timer(endpoint):
+    # Keeps the signature (functools.wraps) and the sync/async kind FastAPI dispatches on
+    if getattr(endpoint, "timed_endpoint", False):
+        # include_router builds the route again from the already wrapped endpoint
+        return endpoint
+
+    def record(start):
+        elapsed = time.perf_counter() - start
+        spent = _endpoint.get()
+        if spent is not None:
+            spent.append(elapsed)
+
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def async_wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                record(start)
+        async_wrapper.timed_endpoint = True
+        return async_wrapper
+
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            record(start)
+    wrapper.timed_endpoint = True
+    return wrapper
+
+
+class TimedRoute(APIRoute):
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, _endpoint_timer(endpoint), **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        route = self.path
+
+        async def timed_handler(request):
+            spent = []
+            token = _endpoint.set(spent)
+            start = time.perf_counter()
+            try:
+                return await handler(request)
+            finally:
+                total = time.perf_counter() - start
+                _endpoint.reset(token)
+                endpoint = sum(spent)
+                ENDPOINT_SECONDS.labels(route).observe(endpoint)
+                SERIALIZE_SECONDS.labels(route).observe(max(total - endpoint, 0.0))
+                _span("endpoint", endpoint)
+                _span("serialize", max(total - endpoint, 0.0))
+
+        return timed_handler
+
+
+def server_timing(spans):
+    totals = {}
+    for stage, seconds in spans:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ", ".join(f"{stage.replace('.', '_')};dur={seconds * 1000:.1f}" for stage, seconds in totals.items())
+
+
+async def metrics_middleware(request, call_next):
+    spans = [] if Config.METRICS_TRACE else None
+    token = _spans.set(spans)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        if spans:
+            # One entry per stage, summed over the request, e.g. mongo;dur=12.5, gliner;dur=840.1
+            response.headers["Server-Timing"] = server_timing(spans)
+        return response
+    finally:
+        _spans.reset(token)
+        matched = request.scope.get("route")
+        # Route templates, not raw paths, so ids in the path do not create a series each
+        route = matched.path if matched is not None else "unmatched"
+        REQUEST_SECONDS.labels(request.method, route, str(status)).observe(time.perf_counter() - start)
+
+
+def latest():
+    return generate_latest(), CONTENT_TYPE_LATEST
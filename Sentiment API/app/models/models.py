@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, HttpUrl
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Any
 from datetime import datetime
 
 class news(BaseModel):
@@ -21,6 +21,25 @@ class news(BaseModel):
     sentiment: Optional[float] = None
     ner: Optional[Dict[str, List[str]]] = None
 
+class news_fields(BaseModel):
+    id: Optional[str] = Field(default=None, alias="_id")
+    url: Optional[str] = None
+    disruptionType: Optional[str] = None
+    imageUrl: Optional[HttpUrl] = None
+    isdeleted: Optional[bool] = None
+    lat: Optional[float] = None
+    lng: Optional[float] = None
+    location: Optional[str] = None
+    publishedDate: Optional[datetime] = None
+    radius: Optional[float] = None
+    raw_text: Optional[str] = None
+    severity: Optional[str] = None
+    text: Optional[str] = None
+    title: Optional[str] = None
+    actual_text: Optional[str] = None
+    sentiment: Optional[float] = None
+    ner: Optional[Dict[str, List[str]]] = None
+
 class update_sentiment_response(BaseModel):
     update: bool
     id: Optional[str] = Field(default_factory=str, alias="_id")
@@ -29,6 +48,15 @@ class update_sentiment_response(BaseModel):
 class SentimentUpdateRequest(BaseModel):
     id: str
 
+class SentimentBatchUpdateRequest(BaseModel):
+    ids: List[str] = Field(..., min_length=1, description="Document ids to score")
+
+class update_sentiment_batch_response(BaseModel):
+    update: bool
+    found: int
+    modified: int
+    sentiments: Dict[str, float] = Field(default_factory=dict)
+
 class TimeSeriesData(BaseModel):
     data: Dict[datetime, float] = Field(..., description="Mapping of datetime strings to integer values")
 
@@ -36,9 +64,50 @@ class TimeSeriesData(BaseModel):
 class TimeSeriesData_Dict(BaseModel):
     data: Dict[str, Dict[str, List[str]]]= Field(default_factory=dict)
 
+class TimeSeriesData_Counts(BaseModel):
+    data: Dict[str, Dict[str, Dict[str, int]]] = Field(
+        default_factory=dict,
+        description="Mapping of date to label to the top entities and the number of articles mentioning them"
+    )
+
+class entity_mention(BaseModel):
+    article_id: str
+    publishedDate: Optional[datetime] = None
+    name: Optional[str] = Field(default=None, description="The entity as written in the article")
+    title: Optional[str] = None
+    url: Optional[str] = None
+
+class entity_mentions_page(BaseModel):
+    label: str
+    entity: str
+    data: List[entity_mention] = Field(default_factory=list)
+    next_cursor: Optional[str] = None
+
 class Topic_Modelling_pyLDAvis(BaseModel):
     score:  Dict[str, float]
     data: Dict[str, str] = Field(
         ..., 
         description="The relevant terms related to each topic."
     )
+
+
+class JobSubmitRequest(BaseModel):
+    kind: str = Field(..., description="One of sentiment, ner, fetch, dedup, topic_model, topic_extras, rollups, entity_index")
+    params: Dict[str, Any] = Field(default_factory=dict)
+
+class job_status(BaseModel):
+    id: str = Field(..., alias="_id")
+    kind: str
+    params: Dict[str, Any] = Field(default_factory=dict)
+    status: str
+    cancel_requested: bool = False
+    restarts: int = 0
+    done: int = 0
+    total: Optional[int] = None
+    docs_per_second: Optional[float] = None
+    eta_seconds: Optional[float] = None
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
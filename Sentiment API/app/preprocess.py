@@ -0,0 +1,130 @@
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+import nltk
+from gensim.utils import simple_preprocess
+from app.config import Config
+from app.writer import BulkWriter
+import app.metrics as metrics
+
+# Bump whenever tokenize changes what a document turns into; cached tokens and topic models are keyed on it
+PREPROCESS_VERSION = 2
+TOKEN_FIELDS = ["lda_tokens", "lda_tokens_hash"]
+EXTRA_STOP_WORDS = ['from', 'subject', 're', 'edu', 'use']
+
+_stop_words = None
+
+
+def stop_words():
+    global _stop_words
+    if _stop_words is None:
+        nltk.download('stopwords', quiet=True)
+        from nltk.corpus import stopwords
+        _stop_words = frozenset(stopwords.words('english') + EXTRA_STOP_WORDS)
+    return _stop_words
+
+
+def tokenize(text):
+    # deacc=True removes punctuations
+    stop = stop_words()
+    return [word for word in simple_preprocess(str(text), deacc=True) if word not in stop]
+
+
+def tokenize_chunk(texts):
+    return [tokenize(text) for text in texts]
+
+
+def token_hash(text):
+    return hashlib.sha1(f"{PREPROCESS_VERSION}:{text}".encode("utf-8")).hexdigest()
+
+
+class Tokenizer:
+    def __init__(self, workers: int = None, chunk_size: int = None):
+        self.workers = workers or Config.TOKENIZE_WORKERS or os.cpu_count() or 1
+        self.chunk_size = chunk_size or Config.TOKENIZE_CHUNK_SIZE
+        self._executor = None
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=stop_words)
+        return self._executor
+
+    @metrics.timed("tokenize")
+    def tokenize(self, texts):
+        texts = list(texts)
+        metrics.observe_batch("tokenize", len(texts))
+        if self.workers <= 1 or len(texts) <= self.chunk_size:
+            return tokenize_chunk(texts)
+        chunks = [texts[i:i + self.chunk_size] for i in range(0, len(texts), self.chunk_size)]
+        tokens = []
+        for chunk_tokens in self._pool().map(tokenize_chunk, chunks):
+            tokens.extend(chunk_tokens)
+        return tokens
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+tokenizer = Tokenizer()
+
+
+def iter_tokens(collection, query=None, progress=None):
+    # (_id, tokens) for every article in _id order; tokens are cached on the article until its text changes
+    total = collection.count_documents(query or {}) if progress else None
+    done = 0
+    projection = {"actual_text": 1, **{field: 1 for field in TOKEN_FIELDS}}
+    documents = collection.find(query or {}, projection).sort("_id", 1).batch_size(Config.TOKENIZE_DOC_BATCH_SIZE)
+    with BulkWriter(collection) as writer:
+        batch = []
+        for doc in documents:
+            batch.append(doc)
+            if len(batch) >= Config.TOKENIZE_DOC_BATCH_SIZE:
+                yield from _batch_tokens(batch, writer)
+                done += len(batch)
+                batch = []
+                if progress:
+                    progress(done, total)
+        if batch:
+            yield from _batch_tokens(batch, writer)
+            done += len(batch)
+            if progress:
+                progress(done, total)
+
+
+def _batch_tokens(docs, writer):
+    hashes = [token_hash(doc.get("actual_text")) for doc in docs]
+    stale = [i for i, doc in enumerate(docs) if doc.get("lda_tokens_hash") != hashes[i]]
+    fresh = tokenizer.tokenize([docs[i].get("actual_text") for i in stale])
+    for i, tokens in zip(stale, fresh):
+        docs[i]["lda_tokens"] = tokens
+        writer.update_one({"_id": docs[i]["_id"]}, {"$set": {"lda_tokens": tokens, "lda_tokens_hash": hashes[i]}})
+    writer.flush()
+    for doc in docs:
+        yield doc["_id"], doc.get("lda_tokens") or []
+
+
+class TokenStream:
+    # Re-iterable token lists for gensim; the first pass refreshes the token cache, later passes only read it
+    def __init__(self, collection, query=None, progress=None):
+        self.collection = collection
+        self.query = query or {}
+        self.progress = progress
+        self.refreshed = False
+
+    def __iter__(self):
+        if not self.refreshed:
+            for _, tokens in iter_tokens(self.collection, self.query, progress=self.progress):
+                yield tokens
+            self.refreshed = True
+            return
+        documents = self.collection.find(self.query, {"lda_tokens": 1}).sort("_id", 1).batch_size(Config.TOKENIZE_DOC_BATCH_SIZE)
+        for doc in documents:
+            yield doc.get("lda_tokens") or []
+
+
+def sample_tokens(collection, query=None, size=1000):
+    # Cached tokens of a random sample of articles, e.g. for a cheaper coherence estimate
+    pipeline = [{"$match": query or {}}, {"$sample": {"size": size}}, {"$project": {"lda_tokens": 1}}]
+    return [doc.get("lda_tokens") or [] for doc in collection.aggregate(pipeline, allowDiskUse=True)]
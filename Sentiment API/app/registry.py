@@ -0,0 +1,69 @@
+import threading
+import time
+from gliner import GLiNER
+import torch
+from app.config import Config
+
+
+def _rss_bytes():
+    # Resident set size from /proc, falls back to 0 where it is unavailable (e.g. Windows)
+    try:
+        import resource
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize()
+    except Exception:
+        return 0
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._models = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def get_gliner(self, name: str = None):
+        name = name or Config.GLINER_MODEL
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        with self._lock:
+            # Another thread may have finished loading while we waited
+            if name not in self._models:
+                self._models[name] = self._load_gliner(name)
+        return self._models[name]
+
+    def _load_gliner(self, name: str):
+        if Config.MODEL_THREADS > 0:
+            torch.set_num_threads(Config.MODEL_THREADS)
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+        model = GLiNER.from_pretrained(name)
+        model.eval()
+        load_seconds = time.perf_counter() - start
+        param_bytes = sum(p.numel() * p.element_size() for p in model.parameters())
+        self._stats[name] = {
+            "model": name,
+            "load_seconds": round(load_seconds, 3),
+            "parameter_bytes": param_bytes,
+            "rss_delta_bytes": max(_rss_bytes() - rss_before, 0),
+            "loaded_at": time.time(),
+        }
+        print(f"Loaded {name} in {load_seconds:.2f}s")
+        return model
+
+    def warm(self):
+        self.get_gliner()
+
+    def stats(self):
+        return {
+            "default_model": Config.GLINER_MODEL,
+            "labels": Config.GLINER_LABELS,
+            "threshold": Config.GLINER_THRESHOLD,
+            "threads": torch.get_num_threads(),
+            "rss_bytes": _rss_bytes(),
+            "models": list(self._stats.values()),
+        }
+
+
+registry = ModelRegistry()
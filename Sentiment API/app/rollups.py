@@ -0,0 +1,248 @@
+from collections import Counter
+from datetime import datetime, timezone
+from pymongo import ASCENDING
+from app.config import Config
+from app.writer import BulkWriter
+
+ROLLUP_STATE = "rollups"
+CORPUS_VERSION = "corpus_version"
+DIMENSIONS = ["disruptionType", "location"]
+# Fields a document must be read with before its sentiment or NER is rewritten
+ROLLUP_FIELDS = {"publishedDate": 1, "disruptionType": 1, "location": 1, "sentiment": 1, "ner": 1, "dedup.canonical": 1}
+# Near-duplicate copies of a story (see app.dedup) are left out of every count
+COUNTED = {"dedup.canonical": {"$ne": False}}
+
+
+def day_rollups(news):
+    return news.database[Config.ROLLUP_COLLECTION]
+
+
+def entity_rollups(news):
+    return news.database[Config.ENTITY_ROLLUP_COLLECTION]
+
+
+def _state(news):
+    return news.database[Config.STATE_COLLECTION]
+
+
+def corpus_version(news):
+    state = _state(news).find_one({"_id": CORPUS_VERSION})
+    return state.get("version", 0) if state else 0
+
+
+def bump_corpus_version(news):
+    # Called by writes that change article text or which articles are counted, so caches keyed on the corpus can tell without scanning it
+    _state(news).update_one({"_id": CORPUS_VERSION}, {"$inc": {"version": 1}}, upsert=True)
+
+
+def parse_date(published):
+    # The ingest stores ISO strings such as 2024-12-17T08:23:49Z
+    if isinstance(published, str):
+        try:
+            published = datetime.fromisoformat(published.replace("Z", ""))
+        except ValueError:
+            return None
+    return published if isinstance(published, datetime) else None
+
+
+def day_of(published):
+    published = parse_date(published)
+    if published is None:
+        return None
+    return datetime(published.year, published.month, published.day)
+
+
+def rollup_keys(doc):
+    # Every document counts towards the overall series and one series per dimension value
+    day = day_of(doc.get("publishedDate"))
+    if day is None or (doc.get("dedup") or {}).get("canonical") is False:
+        return []
+    keys = [{"day": day, "dim": "all", "value": ""}]
+    for dim in DIMENSIONS:
+        value = doc.get(dim)
+        if value:
+            keys.append({"day": day, "dim": dim, "value": str(value).lower()})
+    return keys
+
+
+def _sentiment_inc(score, sign):
+    if score is None:
+        return {}
+    inc = {"sentiment_sum": sign * score, "sentiment_count": sign}
+    if score > 0:
+        inc["positive_count"] = sign
+    elif score < 0:
+        inc["negative_count"] = sign
+    return inc
+
+
+def _entities(ner_dict):
+    entities = Counter()
+    for label, values in (ner_dict or {}).items():
+        for value in set(values or []):
+            entities[(label, value)] += 1
+    return entities
+
+
+class RollupWriter:
+    def __init__(self, news):
+        self.days = BulkWriter(day_rollups(news))
+        self.entities = BulkWriter(entity_rollups(news))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+
+    def sentiment(self, doc, score):
+        inc = Counter(_sentiment_inc(doc.get("sentiment"), -1))
+        inc.update(_sentiment_inc(score, 1))
+        inc = {field: value for field, value in inc.items() if value}
+        if not inc:
+            return
+        for key in rollup_keys(doc):
+            self.days.update_one({"_id": key}, {"$inc": inc}, upsert=True)
+
+    def ner(self, doc, ner_dict):
+        delta = _entities(ner_dict)
+        delta.subtract(_entities(doc.get("ner")))
+        for key in rollup_keys(doc):
+            if "ner" not in doc:
+                self.days.update_one({"_id": key}, {"$inc": {"ner_docs": 1}}, upsert=True)
+            for (label, entity), count in delta.items():
+                if count:
+                    self.entities.update_one({"_id": {**key, "label": label, "entity": entity}}, {"$inc": {"count": count}}, upsert=True)
+
+    def flush(self):
+        self.days.flush()
+        self.entities.flush()
+
+
+def record_sentiment(news, doc, score):
+    with RollupWriter(news) as rollup:
+        rollup.sentiment(doc, score)
+
+
+def record_ner(news, doc, ner_dict):
+    with RollupWriter(news) as rollup:
+        rollup.ner(doc, ner_dict)
+
+
+def ensure_indexes(news):
+    for collection in [day_rollups(news), entity_rollups(news)]:
+        collection.create_index([("_id.dim", ASCENDING), ("_id.value", ASCENDING), ("_id.day", ASCENDING)], name="dim_value_day")
+
+
+def rollups_ready(news):
+    return _state(news).find_one({"_id": ROLLUP_STATE, "built_at": {"$exists": True}}) is not None
+
+
+def _day_expr():
+    return {"$dateTrunc": {"date": {"$toDate": "$publishedDate"}, "unit": "day"}}
+
+
+def _value_expr(dim):
+    return "" if dim == "all" else {"$toLower": f"${dim}"}
+
+
+def rebuild_rollups(news, progress=None):
+    ensure_indexes(news)
+    _state(news).delete_one({"_id": ROLLUP_STATE})
+    day_rollups(news).delete_many({})
+    entity_rollups(news).delete_many({})
+    dims = ["all"] + DIMENSIONS
+    days = 0
+    entities = 0
+    for step, dim in enumerate(dims):
+        match = {"publishedDate": {"$ne": None}, **COUNTED}
+        if dim != "all":
+            match[dim] = {"$nin": [None, ""]}
+        projection = {"publishedDate": 1, "sentiment": 1, "ner": 1}
+        if dim != "all":
+            projection[dim] = 1
+        has_sentiment = {"$isNumber": "$sentiment"}
+        day_pipeline = [
+            {"$match": match},
+            {"$project": projection},
+            {"$group": {
+                "_id": {"day": _day_expr(), "dim": dim, "value": _value_expr(dim)},
+                "sentiment_sum": {"$sum": {"$cond": [has_sentiment, "$sentiment", 0]}},
+                "sentiment_count": {"$sum": {"$cond": [has_sentiment, 1, 0]}},
+                "positive_count": {"$sum": {"$cond": [{"$and": [has_sentiment, {"$gt": ["$sentiment", 0]}]}, 1, 0]}},
+                "negative_count": {"$sum": {"$cond": [{"$and": [has_sentiment, {"$lt": ["$sentiment", 0]}]}, 1, 0]}},
+                "ner_docs": {"$sum": {"$cond": [{"$eq": [{"$type": "$ner"}, "missing"]}, 0, 1]}},
+            }},
+        ]
+        with BulkWriter(day_rollups(news)) as writer:
+            for row in news.aggregate(day_pipeline, allowDiskUse=True):
+                writer.update_one({"_id": row.pop("_id")}, {"$set": row}, upsert=True)
+                days += 1
+
+        entity_pipeline = [
+            {"$match": {**match, "ner": {"$type": "object"}}},
+            {"$project": {"day": _day_expr(), "value": _value_expr(dim), "ner": {"$objectToArray": "$ner"}}},
+            {"$unwind": "$ner"},
+            {"$unwind": "$ner.v"},
+            {"$group": {"_id": {"day": "$day", "dim": dim, "value": "$value", "label": "$ner.k", "entity": "$ner.v"}, "count": {"$sum": 1}}},
+        ]
+        with BulkWriter(entity_rollups(news)) as writer:
+            for row in news.aggregate(entity_pipeline, allowDiskUse=True):
+                writer.update_one({"_id": row.get("_id")}, {"$set": {"count": row.get("count")}}, upsert=True)
+                entities += 1
+        if progress:
+            progress(step + 1, len(dims))
+
+    _state(news).update_one({"_id": ROLLUP_STATE}, {"$set": {"built_at": datetime.now(timezone.utc)}}, upsert=True)
+    return {"days": days, "entities": entities}
+
+
+def rollup_query(dim, value):
+    if dim is None:
+        return {"_id.dim": "all", "_id.value": ""}
+    return {"_id.dim": dim, "_id.value": str(value).lower()}
+
+
+def sentiment_series(news, aggregate, dim=None, value=None):
+    series = {}
+    for row in day_rollups(news).find(rollup_query(dim, value)).sort("_id.day", ASCENDING):
+        count = row.get("sentiment_count", 0)
+        if count <= 0:
+            continue
+        day = row["_id"]["day"]
+        if aggregate == "sum":
+            series[day] = row.get("sentiment_sum", 0)
+        elif aggregate == "average":
+            series[day] = row.get("sentiment_sum", 0) / count
+        elif aggregate == "positive_count":
+            if row.get("positive_count", 0) > 0:
+                series[day] = row.get("positive_count")
+        elif aggregate == "negative_count":
+            if row.get("negative_count", 0) > 0:
+                series[day] = row.get("negative_count")
+        else:
+            series[day] = count
+    return series
+
+
+def ner_count_series(news, dim=None, value=None, top_k=10):
+    counts = {}
+    for row in entity_rollups(news).find({**rollup_query(dim, value), "count": {"$gt": 0}}):
+        key = row["_id"]
+        counts.setdefault((key["day"].isoformat(), key["label"]), Counter())[key["entity"]] = row.get("count")
+    series = {}
+    for (day, label), entities in sorted(counts.items()):
+        series.setdefault(day, {})[label] = dict(entities.most_common(top_k))
+    return series
+
+
+def ner_series(news, dim=None, value=None):
+    # Same shape as the per-document /get_ner output: an entity appears once per article mentioning it
+    series = {}
+    for row in day_rollups(news).find({**rollup_query(dim, value), "ner_docs": {"$gt": 0}}).sort("_id.day", ASCENDING):
+        series[row["_id"]["day"].isoformat()] = {}
+    for row in entity_rollups(news).find({**rollup_query(dim, value), "count": {"$gt": 0}}).sort("_id.day", ASCENDING):
+        key = row["_id"]
+        labels = series.setdefault(key["day"].isoformat(), {})
+        labels.setdefault(key["label"], []).extend([key["entity"]] * row.get("count"))
+    return series
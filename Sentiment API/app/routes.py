@@ -1,15 +1,68 @@
 from fastapi import APIRouter, HTTPException, Request, Query
-from typing import Optional, List, Dict
+from fastapi.routing import APIRoute
+from typing import Optional, List, Dict, Union
 import app.utils as utils
+import app.backfill as backfill
+import app.concurrency as concurrency
+import app.indexes as indexes
+import app.rollups as rollups
+import app.entities as entities
+import app.topics as topics
+import app.preprocess as preprocess
+import app.fetcher as fetcher
+import app.dedup as dedup
+import app.metrics as metrics
 import app.models.models as mod
+from app.registry import registry
+from app.jobs import manager as job_manager
+from app.enrichment import worker as enrichment_worker
+from app.config import Config
 from bson import ObjectId
 from datetime import datetime
-from fastapi.responses import FileResponse
-import os
-import pickle 
-import pyLDAvis
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from email.utils import formatdate, parsedate_to_datetime
 
-router = APIRouter()
+router = APIRouter(route_class=metrics.TimedRoute if Config.METRICS_ENABLED else APIRoute)
+
+NEWS_COLUMNS = ["_id", "url", "disruptionType", "imageUrl", "isdeleted", "lat", "lng", "location", "publishedDate", "radius", "raw_text", "severity", "text", "title", "actual_text"]
+NEWS_FIELDS = NEWS_COLUMNS + ["sentiment", "ner"]
+
+def news_projection(fields):
+    if fields is None:
+        return None
+    selected = [field.strip() for field in fields.split(",") if field.strip()]
+    invalid = [field for field in selected if field not in NEWS_FIELDS]
+    if not selected or invalid:
+        raise HTTPException(status_code=400, detail="Invalid field specified")
+    return {field: 1 for field in selected}
+
+def stored_projection(projection):
+    # Cached topic model tokens live on the article but are never returned
+    if projection is None:
+        return {field: 0 for field in preprocess.TOKEN_FIELDS}
+    return projection
+
+def news_item(item, projection=None):
+    item["_id"] = str(item.get("_id"))
+    if item.get("imageUrl") == "No Image" or item.get("imageUrl") == "":
+        item["imageUrl"] = None
+    if projection is None:
+        return mod.news(**item)
+    return mod.news_fields(**item)
+
+def news_json(item, projection=None):
+    return news_item(item, projection).model_dump(mode="json", by_alias=True, exclude_unset=projection is not None)
+
+def news_documents(response, projection=None):
+    if projection is None:
+        return [news_item(item) for item in response]
+    # Partial documents skip the full news response model
+    return JSONResponse(content=[news_json(item, projection) for item in response])
+
+def news_ndjson(documents, projection=None):
+    for item in documents:
+        yield news_item(item, projection).model_dump_json(by_alias=True, exclude_unset=projection is not None) + "\n"
 
 @router.get("/",
     summary="Default",
@@ -29,9 +82,126 @@ router = APIRouter()
 def root():
     return {"message": "Default Page: Please specify route for relevant output"}
 
+@router.get("/stats/models",
+    summary="Model registry statistics",
+    description="Shows the NER models loaded in this process, their load time and memory footprint, and the configured labels, threshold and thread count.",
+    response_description="Model registry statistics",
+    responses={
+        200: {
+            "content": {
+                "application/json": {
+                    "example": {
+                        "default_model": "urchade/gliner_medium-v2.1",
+                        "labels": ["person", "organisation", "country"],
+                        "threshold": 0.5,
+                        "threads": 4,
+                        "rss_bytes": 1843200000,
+                        "models": [
+                            {
+                                "model": "urchade/gliner_medium-v2.1",
+                                "load_seconds": 7.412,
+                                "parameter_bytes": 836000000,
+                                "rss_delta_bytes": 1204000000,
+                                "loaded_at": 1734424000.0
+                            }
+                        ]
+                    }
+                }
+            },
+        },
+    },)
+def model_stats():
+    return registry.stats()
+
+@router.get("/stats/indexes",
+    summary="Index status",
+    description="Lists which of the indexes the service relies on exist on the news collection, and every index currently on it.",
+    response_description="Index status",
+    responses={
+        200: {
+            "content": {
+                "application/json": {
+                    "example": {
+                        "present": ["publishedDate_1", "severity_publishedDate_ci", "news_text"],
+                        "missing": ["url_ci"],
+                        "all": ["_id_", "news_text", "publishedDate_1", "severity_publishedDate_ci"]
+                    }
+                }
+            },
+        },
+    },)
+def index_stats(request: Request):
+    return indexes.index_report(request.app.news)
+
+@router.get("/stats/topic_models",
+    summary="Topic model cache statistics",
+    description="Shows how many trained topic models are cached on disk and how much space they use, including their serialized corpora (corpus_bytes). Models are reused while the corpus and num_topics are unchanged, and evicted by age and total size.",
+    response_description="Topic model cache statistics",
+    responses={
+        200: {
+            "content": {
+                "application/json": {
+                    "example": {
+                        "entries": 3,
+                        "bytes": 48213504,
+                        "corpus_bytes": 31457280,
+                        "max_bytes": 1073741824
+                    }
+                }
+            },
+        },
+    },)
+def topic_model_stats():
+    return topics.cache_stats()
+
+@router.get("/stats/enrichment",
+    summary="Enrichment worker status",
+    description="Shows how the enrichment worker picks up new articles (stream for a MongoDB change stream, poll on a standalone mongod), the newest article it has enriched, and last_lag_seconds, the time between the insert and the enrichment of the oldest article in its last batch.",
+    response_description="Enrichment worker status",
+    responses={
+        200: {
+            "content": {
+                "application/json": {
+                    "example": {
+                        "running": True,
+                        "mode": "stream",
+                        "last_id": "67628aa0422c93410a6a1314",
+                        "resumable": True,
+                        "batches": 42,
+                        "documents": 311,
+                        "last_batch_at": "2024-12-18T10:02:11.512000+00:00",
+                        "last_lag_seconds": 3.4,
+                        "error": None
+                    }
+                }
+            },
+        },
+    },)
+def enrichment_stats():
+    return enrichment_worker.status()
+
+@router.get("/metrics",
+    summary="Prometheus metrics",
+    description="Histograms in the Prometheus text format: request latency per route (api_request_seconds), time in the route function (api_endpoint_seconds) and around it for validation and serialization (api_serialize_seconds), MongoDB round trips and documents returned per batch (mongo_command_seconds, mongo_documents_returned), and time and batch sizes per pipeline stage such as vader, gliner, tokenize and lda_train (pipeline_stage_seconds, pipeline_batch_size).",
+    response_description="Metrics in the Prometheus text format",
+    responses={
+        200: {
+            "content": {
+                "text/plain": {
+                    "example": 'pipeline_stage_seconds_bucket{le="0.5",stage="gliner"} 12.0'
+                }
+            },
+        },
+    },)
+def get_metrics():
+    body, content_type = metrics.latest()
+    return Response(content=body, media_type=content_type)
+
 @router.get("/data/all",
     summary="Finds all data from database",
-    description="All data from database. You can input limit=integer to show only documents up to limit. If not specified, all documents will show.",
+    description="""All data from database. You can input limit=integer to show only documents up to limit. If not specified, all documents will show. Specify fields= as a comma separated list (e.g. fields=lat,lng,severity,title) to only return those fields; _id is always returned.
+    Specify page_size= to page through the data; the response is then {"data": [...], "next_cursor": ...} and the next page is requested with cursor=next_cursor. Pages are ordered by sort= (_id or publishedDate, Default is _id).
+    Specify stream=True to receive every document as newline delimited JSON (application/x-ndjson) instead of one JSON list.""",
     response_description="List of data from database",
     responses={
         200: {
@@ -69,32 +239,62 @@ def root():
         },
     },
 )
-async def get_alldata(request: Request, limits: Optional[int] = Query(None, ge=int(1)))-> List[mod.news]:
-    allowed_params = ["limits"]
+def get_alldata(request: Request, limits: Optional[int] = Query(None, ge=int(1)), fields: Optional[str] = None,
+                page_size: Optional[int] = Query(None, ge=1, le=Config.MAX_PAGE_SIZE), cursor: Optional[str] = None,
+                sort: str = "_id", stream: bool = False)-> List[mod.news]:
+    allowed_params = ["limits", "fields", "page_size", "cursor", "sort", "stream"]
     extra_params = [key for key in request.query_params if key not in allowed_params]
 
     if extra_params:
         raise HTTPException(status_code=404, detail="Unexpected query parameter")
+
+    if sort not in utils.CURSOR_SORTS:
+        raise HTTPException(status_code=400, detail="Invalid sort specified")
     
+    projection = news_projection(fields)
     db = request.app.news
 
+    query = {}
+    if cursor is not None:
+        try:
+            query = utils.cursor_query(cursor, sort)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor specified")
+    paged = page_size is not None or cursor is not None
+
+    if stream:
+        documents = db.find(query, stored_projection(projection)).sort(utils.cursor_sort(sort)).batch_size(Config.STREAM_BATCH_SIZE)
+        if limits is not None:
+            documents = documents.limit(limits)
+        return StreamingResponse(news_ndjson(documents, projection), media_type="application/x-ndjson")
+
+    if paged:
+        page_size = page_size or Config.DEFAULT_PAGE_SIZE
+        read = projection
+        if projection is not None and sort != "_id" and sort not in projection:
+            # The cursor is built from the sort key, so it has to be read even when not requested; _id always is
+            read = {**projection, sort: 1}
+        # One extra document tells us whether there is a next page
+        response = list(db.find(query, stored_projection(read)).sort(utils.cursor_sort(sort)).limit(page_size + 1))
+        next_cursor = None
+        if len(response) > page_size:
+            response = response[:page_size]
+            next_cursor = utils.encode_cursor(response[-1], sort)
+        if read is not projection:
+            for item in response:
+                item.pop(sort, None)
+        return JSONResponse(content={"data": [news_json(item, projection) for item in response], "next_cursor": next_cursor})
+
     if limits is None:
-        response = list(db.find({}))
+        response = list(db.find({}, stored_projection(projection)))
 
     else:
-        response = list(db.find({}).limit(limits))
-    documents = []
-    for item in response:
-        item["_id"] = str(item.get("_id"))
-        if item.get("imageUrl") == "No Image" or item.get("imageUrl") == "":
-            item["imageUrl"] = None
-
-        documents.append(mod.news(**item))
-    return documents
+        response = list(db.find({}, stored_projection(projection)).limit(limits))
+    return news_documents(response, projection)
 
 @router.get("/data",
     summary="Finds data from database based on column and specified value",
-    description="Finds data from database based on column and specified value. Specify column with column=, and specify value with value= . If value not specified, all data is shown. Search query is case insensitive.",
+    description="Finds data from database based on column and specified value. Specify column with column=, and specify value with value= . If value not specified, all data is shown. Search query is case insensitive: disruptionType, severity and location match the whole value, url and imageUrl match from the start, title, text and actual_text use full-text search for the phrase, publishedDate accepts 2024, 2024-12 or 2024-12-17, and other columns match anywhere in the value. Specify fields= as a comma separated list (e.g. fields=lat,lng,severity,title) to only return those fields; _id is always returned.",
     response_description="List of data from database",
     responses={
         200: {
@@ -140,36 +340,25 @@ async def get_alldata(request: Request, limits: Optional[int] = Query(None, ge=i
         },
     },
 )
-async def get_filtereddata(request: Request, column: str, value: str = "") -> List[mod.news]:
-    allowed_params = ["column", "value"]
+def get_filtereddata(request: Request, column: str, value: str = "", fields: Optional[str] = None) -> List[mod.news]:
+    allowed_params = ["column", "value", "fields"]
     extra_params = [key for key in request.query_params if key not in allowed_params]
 
     if extra_params:
         raise HTTPException(status_code=404, detail="Unexpected query parameter")
     
-    valid_columns = ["_id", "url", "disruptionType", "imageUrl", "isdeleted", "lat", "lng", "location", "publishedDate", "radius", "raw_text", "severity", "text", "title", "actual_text"]
-    if column not in valid_columns:
+    if column not in NEWS_COLUMNS:
         raise HTTPException(status_code=400, detail="Invalid column specified")
 
+    projection = news_projection(fields)
     db = request.app.news
     if value == "":
-        response = list(db.find({}))
+        response = list(db.find({}, stored_projection(projection)))
     else: 
-        if column == "_id":
-            response = list(db.find({column: ObjectId(value)}))
-        else:
-            regex = {'$regex': value, '$options': 'i'}
-            response = list(db.find({column: regex}))
+        query, collation = indexes.column_filter(column, value)
+        response = list(db.find(query, stored_projection(projection), collation=collation))
 
-    documents = []
-    for item in response:
-        item["_id"] = str(item.get("_id"))
-        if item.get("imageUrl") == "No Image" or item.get("imageUrl") == "":
-            item["imageUrl"] = None
-
-        documents.append(mod.news(**item))
-
-    return documents
+    return news_documents(response, projection)
 
 #SENTIMENTS
 @router.put("/update/sentiments",
@@ -198,7 +387,7 @@ async def get_filtereddata(request: Request, column: str, value: str = "") -> Li
         }
     },
 )
-async def update_sentiment(request: Request, _id: str = Query(..., alias="_id")):
+def update_sentiment(request: Request, _id: str = Query(..., alias="_id")):
     allowed_params = ["id", "_id"]
     extra_params = [key for key in request.query_params if key not in allowed_params]
 
@@ -221,6 +410,7 @@ async def update_sentiment(request: Request, _id: str = Query(..., alias="_id"))
             else:
                 raise HTTPException(status_code=404, detail="Field unchanged")
         else:
+            rollups.record_sentiment(db, document, score)
             update_doc = db.find_one({"_id": object_id})
             return {"update": True, "id": str(update_doc["_id"]), "sentiment": update_doc.get("sentiment", None)}
     except Exception as e:
@@ -228,7 +418,7 @@ async def update_sentiment(request: Request, _id: str = Query(..., alias="_id"))
 
 @router.put("/update/sentiments/all",
     summary="Updates sentiment for all docs without sentiments",
-    description="Finds data from database where sentiment has not been updated. The sentiment scores are then calculated and added. When completed, output will return True. If all data has sentiments, update will return False. refer to example on GitHub README on how to pull the info",
+    description="Finds data from database where sentiment has not been updated. The sentiment scores are then calculated and added. When completed, output will return True. If all data has sentiments, update will return False. Specify background=True to run it as a job and get the job back immediately (see /jobs/{job_id}). refer to example on GitHub README on how to pull the info",
     response_description="Confirmation that all docs is updated with Sentiment Score, or that update is not required as all data has sentiment scores",
     responses={
         200: {
@@ -258,28 +448,22 @@ async def update_sentiment(request: Request, _id: str = Query(..., alias="_id"))
         }
     },
 )
-async def update_all_sentiment(request: Request):
+async def update_all_sentiment(request: Request, background: bool = False):
     db = request.app.news
-    allowed_params = []
+    allowed_params = ["background"]
     extra_params = [key for key in request.query_params if key not in allowed_params]
 
     if extra_params:
         raise HTTPException(status_code=404, detail="Unexpected query parameter")
+
+    if background:
+        return await submit_job("sentiment", {})
     try:
-        document = db.find({"sentiment": {"$exists": False}}) 
-        to_modify= db.count_documents({"sentiment": {"$exists": False}})
-        modified = 0
+        result = await concurrency.run_model(backfill.backfill_sentiment, db)
+        to_modify = result.get("to_modify")
+        modified = result.get("modified")
         if to_modify==0:
             return {'update': False}
-        for doc in document:
-            text = doc.get("actual_text", "None")
-            score = utils.input_sentiments_vader(text)
-            result = db.update_one(
-                {"_id": doc.get("_id")},
-                {"$set": {"sentiment": score}}
-            )
-            if result.modified_count != 0:
-                modified += 1
 
         if modified/to_modify <= 0:
             raise HTTPException(status_code=500, detail=f"{to_modify-modified}/{to_modify} sentiment unchanged")
@@ -287,14 +471,69 @@ async def update_all_sentiment(request: Request):
             return {"update": True}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
-    
+
+@router.put("/update/sentiments/batch",
+    response_model=mod.update_sentiment_batch_response,
+    summary="Updates sentiment for a list of docs",
+    description="Scores and updates sentiment for every doc whose _id is listed in the request body as ids. Docs are scored together in the sentiment worker pool. refer to example on GitHub README on how to pull the info",
+    response_description="Confirmation that the docs are updated, with the sentiment per doc id",
+    responses={
+        200: {
+            "content": {
+                "application/json": {
+                    "example": {
+                        "update": "True",
+                        "found": 2,
+                        "modified": 2,
+                        "sentiments": {
+                            "67628aa0422c93410a6a1314": 0.997,
+                            "67628aa0422c93410a6a1315": -0.421,
+                        }
+                    }
+                }
+            },
+        },
+        400: {
+            "description": "Invalid _id specified",
+            "content": {
+                "application/json": {
+                    "example": {"message": "Invalid _id specified"}
+                }
+            },
+        },
+        404: {
+            "description": "No documents found",
+            "content": {
+                "application/json": {
+                    "example": {"message": "Documents not found"}
+                }
+            },
+        },
+    },
+)
+async def update_sentiment_batch(request: Request, body: mod.SentimentBatchUpdateRequest) -> mod.update_sentiment_batch_response:
+    if request.query_params:
+        raise HTTPException(status_code=404, detail="Unexpected query parameter")
+
+    db = request.app.news
+    try:
+        object_ids = [ObjectId(_id) for _id in body.ids]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid _id specified")
+
+    result = await concurrency.run_model(backfill.update_sentiment_by_ids, db, object_ids)
+    if result.get("found") == 0:
+        raise HTTPException(status_code=404, detail="Documents not found")
+    return mod.update_sentiment_batch_response(update=result.get("modified") > 0, **result)
+
 @router.get("/get_sentiment",
     response_model=mod.TimeSeriesData, 
     summary="Provides sentiment by date",
     description="""Provides sentiment by date. Sentiment score is aggregated based on specification. 
     Please input either sum/average/positive_count/negative_count/total_count using query: aggregate= . 
-    Specify date_only=True so that the aggregation is by date and not the exact time.
-    Specify filter_column= and filter_value= to filter data by, ensure that column is written in proper casing. Value is not case sensitive""",
+    Specify date_only=True so that the aggregation is by date and not the exact time. Daily results, unfiltered or filtered by disruptionType or location, are read from precomputed daily rollups.
+    Specify filter_column= and filter_value= to filter data by, ensure that column is written in proper casing. Value is not case sensitive.
+    disruptionType, severity and location match the whole value, url and imageUrl match from the start, title, text and actual_text use full-text search for the phrase, and publishedDate accepts 2024, 2024-12 or 2024-12-17""",
     response_description="Provides sentiment by date given type of aggregation",
     responses={
         200: {
@@ -333,7 +572,7 @@ async def update_all_sentiment(request: Request):
         },
     },
 )
-async def get_sentiment(request: Request, aggregate: str, date_only: bool = False, filter_column:str = None , filter_value:str = None) -> mod.TimeSeriesData:
+def get_sentiment(request: Request, aggregate: str, date_only: bool = False, filter_column:str = None , filter_value:str = None) -> mod.TimeSeriesData:
     allowed_params = ["aggregate", "date_only", "filter_column", "filter_value"]
     extra_params = [key for key in request.query_params if key not in allowed_params]
 
@@ -349,58 +588,17 @@ async def get_sentiment(request: Request, aggregate: str, date_only: bool = Fals
             raise HTTPException(status_code=422, detail="Filter value not specified")
 
     db = request.app.news
-    if filter_column == None:
-        documents = db.find({"sentiment": {"$exists": True}})
-    else:
-        regex = {'$regex': filter_value, '$options': 'i'}
-        documents = db.find({
-            "ner": {"$exists": True},
-            filter_column: regex
-        })
-    tracker_averaging = {}
+    if utils.use_rollups(db, date_only, filter_column):
+        return {"data": rollups.sentiment_series(db, aggregate, filter_column, filter_value)}
+
+    match, collation = {}, None
+    if filter_column != None:
+        match, collation = indexes.column_filter(filter_column, filter_value)
+    pipeline = utils.sentiment_pipeline(aggregate, date_only, match)
     sentiment_per_date = {}
-    for doc in documents:
-        if date_only == True:
-            date = str(doc.get("publishedDate"))[:10]
-        else:
-            date = str(doc.get("publishedDate"))
-        sentiment = doc.get("sentiment")
-        if aggregate == "sum":
-            if date not in sentiment_per_date:
-                sentiment_per_date[date] = sentiment
-            else:
-                sentiment_per_date[date] = sentiment_per_date.get(date) + sentiment
-        elif aggregate == "average":
-            if date not in sentiment_per_date:
-                tracker_averaging[date] = {
-                    "sum": sentiment,
-                    "count": 1,
-                }
-            else:
-                tracker_averaging[date]["sum"] = (tracker_averaging.get(date)).get("sum") + sentiment
-                tracker_averaging[date]["count"] = (tracker_averaging.get(date)).get("count") + 1
-        else:
-            if aggregate == "positive_count":
-                if sentiment > 0:
-                    if date not in sentiment_per_date:
-                        sentiment_per_date[date] = 1
-                    else:
-                        sentiment_per_date[date] = sentiment_per_date.get(date) + 1
-            elif aggregate == "negative_count":
-                if sentiment < 0:
-                    if date not in sentiment_per_date:
-                        sentiment_per_date[date] = 1
-                    else:
-                        sentiment_per_date[date] = sentiment_per_date.get(date) + 1
-            else:
-                if date not in sentiment_per_date:
-                    sentiment_per_date[date] = 1
-                else:
-                    sentiment_per_date[date] = sentiment_per_date.get(date) + 1
-    
-    if aggregate == "average":
-        for key, value in tracker_averaging.items():
-            sentiment_per_date[key] = value.get("sum")/value.get("count")
+    for row in db.aggregate(pipeline, allowDiskUse=True, collation=collation):
+        if row.get("_id") is not None:
+            sentiment_per_date[row.get("_id")] = row.get("value")
     return {"data": sentiment_per_date}
 
 #NER
@@ -443,18 +641,15 @@ async def update_ner(request: Request, _id: str = Query(..., alias="_id")):
     db = request.app.news
     try:
         object_id = ObjectId(_id)
-        document = db.find_one({"_id": object_id})
-        text = document.get("actual_text")
-        if text == "":
-            text = document.get("text")
-            if text == "":
-                text = document.get("title", "")
-        ner_dict = utils.gliner_ner(text)
+        document = await concurrency.run_io(db.find_one, {"_id": object_id})
+        text = utils.ner_text(document)
+        ner_dict = await concurrency.run_model(utils.gliner_ner, text)
         print(ner_dict)
 
-        result = db.update_one(
+        result = await concurrency.run_io(
+            db.update_one,
             {"_id": object_id},
-            {"$set": {"ner": ner_dict}}
+            {"$set": {"ner": ner_dict, "ner_text_hash": utils.text_hash(text)}, "$unset": {"ner_stale": ""}}
         )
         if result.modified_count == 0:
             if not document:
@@ -462,14 +657,20 @@ async def update_ner(request: Request, _id: str = Query(..., alias="_id")):
             else:
                 raise HTTPException(status_code=404, detail="Field unchanged")
         else:
-            update_doc = db.find_one({"_id": object_id})
+            await concurrency.run_io(rollups.record_ner, db, document, ner_dict)
+            await concurrency.run_io(entities.record_ner, db, document, ner_dict)
+            update_doc = await concurrency.run_io(db.find_one, {"_id": object_id})
             return {"update": True, "id": str(update_doc["_id"]), "ner": update_doc.get("ner", None)}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.put("/update/ner/all",
     summary="Updates NER for all docs without NER",
-    description="Finds data from database where NER has not been updated. The NER values are then calculated and added. When completed, output will return True. If all data has NER, update will return False. refer to example on GitHub README on how to pull the info",
+    description="""Finds data from database where NER has not been updated. The NER values are then calculated and added. When completed, output will return True. If all data has NER, update will return False. refer to example on GitHub README on how to pull the info.
+    mode=incremental (default) only processes docs without NER, mode=full reprocesses every doc.
+    Specify verify_hash=True to also reprocess docs whose text changed since their NER was extracted.
+    An interrupted run resumes where it stopped; specify restart=True to discard the saved position.
+    Specify background=True to run it as a job and get the job back immediately (see /jobs/{job_id}).""",
     response_description="Confirmation that all docs is updated with NER, or that update is not required as all data has NER values",
     responses={
         200: {
@@ -499,33 +700,25 @@ async def update_ner(request: Request, _id: str = Query(..., alias="_id")):
         }
     },
 )
-async def update_all_ner(request: Request):
+async def update_all_ner(request: Request, mode: str = "incremental", verify_hash: bool = False, restart: bool = False, background: bool = False):
     db = request.app.news
-    allowed_params = []
+    allowed_params = ["mode", "verify_hash", "restart", "background"]
     extra_params = [key for key in request.query_params if key not in allowed_params]
 
     if extra_params:
         raise HTTPException(status_code=404, detail="Unexpected query parameter")
+
+    if mode not in backfill.NER_MODES:
+        raise HTTPException(status_code=400, detail="Invalid mode specified")
+
+    if background:
+        return await submit_job("ner", {"mode": mode, "verify_hash": verify_hash, "restart": restart})
     try:
-        document = db.find({"ner": {"$exists": True}}) 
-        to_modify= db.count_documents({"ner": {"$exists": True}})
-        modified = 0
+        result = await concurrency.run_model(backfill.backfill_ner, db, mode=mode, verify_hash=verify_hash, restart=restart)
+        to_modify = result.get("to_modify")
+        modified = result.get("modified")
         if to_modify==0:
             return {'update': False}
-        document = db.find()
-        for doc in document:
-            text = doc.get("actual_text")
-            if text == "":
-                text = doc.get("text")
-                if text == "":
-                    text = doc.get("title")
-            ner_dict = utils.gliner_ner(text)
-            result = db.update_one(
-                {"_id": doc.get("_id")},
-                {"$set": {"ner": ner_dict}}
-            )
-            if result.modified_count != 0:
-                modified += 1
 
         if modified/to_modify <= 0:
             raise HTTPException(status_code=500, detail=f"{to_modify-modified}/{to_modify} NER unchanged")
@@ -534,12 +727,122 @@ async def update_all_ner(request: Request):
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
     
+@router.put("/update/actual_text/all",
+    summary="Fetches article text for all docs without it",
+    description="""Downloads the article at each doc's url and stores its body text as actual_text, for docs where it is missing (or "NA" from a failed fetch).
+    mode=missing (default) only fetches docs without text, mode=refresh refetches every doc, sending the saved ETag / Last-Modified so unchanged articles are skipped.
+    Failures are recorded per doc in fetch.status (timeout, connection_error, http_client_error, http_server_error, http_retryable_error, invalid_url, parse_error, empty_text); invalid urls, 4xx responses and unparseable pages are not retried by later runs unless retry_failed=True.
+    Specify background=True to run it as a job and get the job back immediately (see /jobs/{job_id}).""",
+    response_description="Number of docs fetched, unchanged, and failed per failure class",
+    responses={
+        200: {
+            "content": {
+                "application/json": {
+                    "example": {
+                        "total": 120,
+                        "fetched": 112,
+                        "not_modified": 0,
+                        "failed": {"timeout": 3, "http_client_error": 5}
+                    }
+                }
+            },
+        },
+        400: {
+            "description": "Invalid mode specified",
+            "content": {
+                "application/json": {
+                    "example": {"message": "Invalid mode specified"}
+                }
+            },
+        },
+        404: {
+            "description": "Invalid query specified",
+            "content": {
+                "application/json": {
+                    "example": {"message": "Unexpected query parameter"}
+                }
+            },
+        },
+    },
+)
+async def update_all_actual_text(request: Request, mode: str = "missing", retry_failed: bool = False, background: bool = False):
+    allowed_params = ["mode", "retry_failed", "background"]
+    extra_params = [key for key in request.query_params if key not in allowed_params]
+
+    if extra_params:
+        raise HTTPException(status_code=404, detail="Unexpected query parameter")
+
+    if mode not in fetcher.FETCH_MODES:
+        raise HTTPException(status_code=400, detail="Invalid mode specified")
+
+    if background:
+        return await submit_job("fetch", {"mode": mode, "retry_failed": retry_failed})
+
+    db = request.app.news
+    return await concurrency.run_io(backfill.backfill_actual_text, db, mode=mode, retry_failed=retry_failed)
+
+@router.put("/update/dedup/all",
+    summary="Clusters duplicate copies of the same story",
+    description="""Fingerprints each doc's text (a hash of the normalised text plus a MinHash of its word shingles) and clusters exact and near duplicate copies of a story, e.g. syndicated articles under different urls.
+    The earliest doc of a cluster is its canonical article: sentiment and NER are computed once per cluster and copied to the others, and copies are left out of /get_sentiment, /get_ner and topic models.
+    mode=incremental (default) only fingerprints new docs, mode=full reclusters every doc. The sentiment and NER backfills run the incremental mode first.
+    Specify background=True to run it as a job and get the job back immediately (see /jobs/{job_id}).""",
+    response_description="Number of docs fingerprinted and found to be duplicates",
+    responses={
+        200: {
+            "content": {
+                "application/json": {
+                    "example": {
+                        "processed": 250,
+                        "duplicates": 31,
+                        "counts_changed": False,
+                        "rollups_rebuilt": False
+                    }
+                }
+            },
+        },
+        400: {
+            "description": "Invalid mode specified",
+            "content": {
+                "application/json": {
+                    "example": {"message": "Invalid mode specified"}
+                }
+            },
+        },
+        404: {
+            "description": "Invalid query specified",
+            "content": {
+                "application/json": {
+                    "example": {"message": "Unexpected query parameter"}
+                }
+            },
+        },
+    },
+)
+async def update_all_dedup(request: Request, mode: str = "incremental", background: bool = False):
+    allowed_params = ["mode", "background"]
+    extra_params = [key for key in request.query_params if key not in allowed_params]
+
+    if extra_params:
+        raise HTTPException(status_code=404, detail="Unexpected query parameter")
+
+    if mode not in dedup.DEDUP_MODES:
+        raise HTTPException(status_code=400, detail="Invalid mode specified")
+
+    if background:
+        return await submit_job("dedup", {"mode": mode})
+
+    db = request.app.news
+    return await concurrency.run_model(backfill.dedup_documents, db, mode=mode)
+
 @router.get("/get_ner",
-    response_model=mod.TimeSeriesData_Dict, 
+    response_model=Union[mod.TimeSeriesData_Dict, mod.TimeSeriesData_Counts], 
     summary="Provides sentiment by date",
     description="""Provides sentiment by date. Sentiment score is aggregated based on specification. 
-    Specify date_only=True so that the aggregation is by date and not the exact time.
-    Specify filter_column= and filter_value= to filter data by, ensure that column is written in proper casing. Value is not case sensitive""",
+    Specify mode=count to get the top_k= (Default is 10) most mentioned entities per label per date with the number of articles mentioning each, instead of every entity of every article.
+    Specify date_only=True so that the aggregation is by date and not the exact time. Daily results, unfiltered or filtered by disruptionType or location, are read from precomputed daily rollups.
+    Specify filter_column= and filter_value= to filter data by, ensure that column is written in proper casing. Value is not case sensitive.
+    disruptionType, severity and location match the whole value, url and imageUrl match from the start, title, text and actual_text use full-text search for the phrase, and publishedDate accepts 2024, 2024-12 or 2024-12-17""",
     response_description="Provides sentiment by date given type of aggregation",
     responses={
         200: {
@@ -570,8 +873,9 @@ async def update_all_ner(request: Request):
         },
     },
 )
-async def get_ner(request: Request, date_only: bool = False, filter_column:str = None , filter_value:str = None) -> mod.TimeSeriesData_Dict:
-    allowed_params = ["date_only", "filter_column", "filter_value"]
+def get_ner(request: Request, date_only: bool = False, filter_column:str = None , filter_value:str = None,
+            mode: str = "list", top_k: int = Query(10, ge=1, le=1000)) -> Union[mod.TimeSeriesData_Dict, mod.TimeSeriesData_Counts]:
+    allowed_params = ["date_only", "filter_column", "filter_value", "mode", "top_k"]
     extra_params = [key for key in request.query_params if key not in allowed_params]
 
     if extra_params:
@@ -581,42 +885,126 @@ async def get_ner(request: Request, date_only: bool = False, filter_column:str =
         if filter_value == None:
             raise HTTPException(status_code=422, detail="Filter value not specified")
 
+    if mode not in ["list", "count"]:
+        raise HTTPException(status_code=400, detail="Invalid mode specified")
+
     db = request.app.news
+    if mode == "count":
+        if utils.use_rollups(db, date_only, filter_column):
+            return mod.TimeSeriesData_Counts(data=rollups.ner_count_series(db, filter_column, filter_value, top_k))
+        match, collation = {}, None
+        if filter_column != None:
+            match, collation = indexes.column_filter(filter_column, filter_value)
+        rows = db.aggregate(utils.ner_count_pipeline(match, date_only, top_k), allowDiskUse=True, collation=collation)
+        return mod.TimeSeriesData_Counts(data=utils.ner_counts(rows))
+
+    if utils.use_rollups(db, date_only, filter_column):
+        return mod.TimeSeriesData_Dict(data=rollups.ner_series(db, filter_column, filter_value))
+
+    projection = {"publishedDate": 1, "ner": 1}
     if filter_column == None:
-        documents = db.find({"ner": {"$exists": True}})
+        documents = db.find({"ner": {"$exists": True}, **rollups.COUNTED}, projection)
     else:
-        regex = {'$regex': filter_value, '$options': 'i'}
+        query, collation = indexes.column_filter(filter_column, filter_value)
         documents = db.find({
             "ner": {"$exists": True},
-            filter_column: regex
-        })
+            **rollups.COUNTED,
+            **query
+        }, projection, collation=collation)
 
     ner_per_date: Dict[str, Dict[str, list]] = {}
-    for doc in documents:
-        date = str(doc.get("publishedDate"))
-        if date_only == True:
-            date = date[:10]
-        date_obj = datetime.fromisoformat(date.replace("Z", ""))
-        date_key = str(date_obj.isoformat())
-        if date_key not in ner_per_date:
-            ner_per_date[date_key] = {}
-        ner_dict = doc.get("ner")
-        if not ner_dict: 
-            continue
-        else:
-            for key, value in ner_dict.items():
-                if key not in ner_per_date[date_key]:
-                    ner_per_date[date_key][key] = []
-                for val in value:
-                    ner_per_date[date_key][key].append(val)
+    # Includes the getMore round trips of the cursor; those are also counted under mongo
+    with metrics.timer("ner_group"):
+        for doc in documents:
+            date = str(doc.get("publishedDate"))
+            if date_only == True:
+                date = date[:10]
+            date_obj = datetime.fromisoformat(date.replace("Z", ""))
+            date_key = str(date_obj.isoformat())
+            if date_key not in ner_per_date:
+                ner_per_date[date_key] = {}
+            ner_dict = doc.get("ner")
+            if not ner_dict: 
+                continue
+            else:
+                for key, value in ner_dict.items():
+                    if key not in ner_per_date[date_key]:
+                        ner_per_date[date_key][key] = []
+                    for val in value:
+                        ner_per_date[date_key][key].append(val)
 
     return mod.TimeSeriesData_Dict(data=ner_per_date)
 
 
+@router.get("/entities/{label}/{name}",
+    response_model=mod.entity_mentions_page,
+    summary="Finds articles mentioning an entity",
+    description="""Finds the articles whose NER output contains the entity name under label (e.g. /entities/organisation/CISA). Names are matched case-insensitively and ignoring dots, so U.S. and us are the same entity.
+    Specify start= and end= to only include articles published in that range. Results are ordered by publishedDate, page_size= (Default is 100) per page; pass next_cursor back as cursor= for the next page.""",
+    response_description="Articles mentioning the entity",
+    responses={
+        200: {
+            "content": {
+                "application/json": {
+                    "example": {
+                        "label": "organisation",
+                        "entity": "cisa",
+                        "data": [
+                            {
+                                "article_id": "67628aa0422c93410a6a1314",
+                                "publishedDate": "2024-12-17T08:23:49Z",
+                                "name": "CISA",
+                                "title": "U.S. CISA adds Microsoft Windows Kernel-Mode Driver and Adobe ColdFusion flaws to its Known Exploited Vulnerabilities catalog",
+                                "url": "https://securityaffairs.com/172059/security/u-s-cisa-adds-microsoft-windows-kernel-mode-driver-and-adobe-coldfusion-flaws-to-its-known-exploited-vulnerabilities-catalog.html"
+                            }
+                        ],
+                        "next_cursor": None
+                    }
+                }
+            },
+        },
+        400: {
+            "description": "Invalid cursor specified",
+            "content": {
+                "application/json": {
+                    "example": {"message": "Invalid cursor specified"}
+                }
+            },
+        },
+        404: {
+            "description": "Invalid query specified",
+            "content": {
+                "application/json": {
+                    "example": {"message": "Unexpected query parameter"}
+                }
+            },
+        },
+    },
+)
+def get_entity_mentions(request: Request, label: str, name: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                        page_size: int = Query(100, ge=1, le=Config.MAX_PAGE_SIZE), cursor: Optional[str] = None) -> mod.entity_mentions_page:
+    allowed_params = ["start", "end", "page_size", "cursor"]
+    extra_params = [key for key in request.query_params if key not in allowed_params]
+
+    if extra_params:
+        raise HTTPException(status_code=404, detail="Unexpected query parameter")
+
+    db = request.app.news
+    try:
+        result = entities.find_mentions(db, label, name, start=start, end=end, page_size=page_size, cursor=cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor specified")
+    return mod.entity_mentions_page(**result)
+
+
 @router.get("/get_topic_model_pyLDAvis",
     response_model=mod.Topic_Modelling_pyLDAvis, 
     summary="Provides topic modelling data from pyLDAvis",
-    description="""Provides the top few relevant terms associated with each grouped topic. Provide number of topics to group be with num_topics= , provide number of relevant terms to include with relevant_terms= (Default is 10)""",
+    description="""Provides the top few relevant terms associated with each grouped topic. Provide number of topics to group be with num_topics= , provide number of relevant terms to include with relevant_terms= (Default is 10). Specify background=True to train as a job and get the job back immediately (see /jobs/{job_id}).
+    Trained models are cached until the corpus changes, so repeated requests for the same num_topics do not retrain.
+    Specify online=True to keep one model per num_topics and only fold in the articles added since it was last trained; it is fully retrained periodically.
+    Specify coherence= as full, sample (Default, c_v coherence over a random sample of articles), skip, or background (scored by a topic_extras job after the response and returned by later requests).
+    Specify visual= as now, background (Default, prepared by a topic_extras job for /get_topic_model_pyLDAvis/visual) or skip.""",
     response_description="Provides the relevant terms associated with each grouped topic",
     responses={
         200: {
@@ -647,8 +1035,9 @@ async def get_ner(request: Request, date_only: bool = False, filter_column:str =
         },
     },
 )
-async def get_pyLDAvis_data(request: Request, num_topics: int = None, relevant_terms: int = 10) -> mod.Topic_Modelling_pyLDAvis:
-    allowed_params = ["num_topics", "relevant_terms"]
+async def get_pyLDAvis_data(request: Request, num_topics: int = None, relevant_terms: int = 10, background: bool = False, online: bool = False,
+                            coherence: str = "sample", visual: str = "background") -> mod.Topic_Modelling_pyLDAvis:
+    allowed_params = ["num_topics", "relevant_terms", "background", "online", "coherence", "visual"]
     extra_params = [key for key in request.query_params if key not in allowed_params]
 
     if extra_params:
@@ -657,23 +1046,41 @@ async def get_pyLDAvis_data(request: Request, num_topics: int = None, relevant_t
     if num_topics == None:
         raise HTTPException(status_code=422, detail="Number of topics value not specified")
 
+    if coherence not in topics.COHERENCE_MODES:
+        raise HTTPException(status_code=400, detail="Invalid coherence specified")
+
+    if visual not in topics.VISUAL_MODES:
+        raise HTTPException(status_code=400, detail="Invalid visual specified")
+
+    if background:
+        return await submit_job("topic_model", {"num_topics": num_topics, "relevant_terms": relevant_terms, "online": online, "coherence": coherence, "visual": visual})
+
     db = request.app.news
-    documents = db.find()
 
     topics_data: Dict[str, str] = {}
-    text = []
-    for doc in documents:
-        text.append(doc.get("actual_text"))
-    score_data, topics_data = utils.generate_pyLDAvis_topics(text, num_topics, relevant_terms)
+    score_data, topics_data, pending = await concurrency.run_model(
+        backfill.train_topic_model, db, num_topics, relevant_terms, online=online, coherence=coherence, visual=visual
+    )
+    if pending:
+        # An extras job already queued for this model and covering every pending step makes another one redundant
+        covering = {"num_topics": num_topics, "online": online, **{step: True for step in pending}}
+        if await concurrency.run_io(job_manager.active, "topic_extras", covering) is None:
+            params = {"num_topics": num_topics, "online": online, "coherence": "coherence" in pending, "visual": "visual" in pending}
+            await concurrency.run_io(job_manager.submit, "topic_extras", params)
         
     return mod.Topic_Modelling_pyLDAvis(score= score_data, data=topics_data)
 
 
 @router.get("/get_topic_model_pyLDAvis/visual",
     summary="Provides topic modelling graphics",
-    description="""Provides the pyLDAvis visualisations as a downloadable file. Provide path to download if a volume is mounted with docker container (Otherwise default downloaded to download file)""",
+    description="""Provides the pyLDAvis visualisations as a downloadable file. Provide path to download if a volume is mounted with docker container (Otherwise default downloaded to download file)
+    The visualisation is for the current topic model with num_topics= (online=True for the online model); if it was not prepared yet it is prepared now. Until the model is trained again after new articles arrive, the most recently used model for num_topics is served.
+    Pages are rendered once per model and sent with an ETag and Last-Modified, gzip compressed when the client accepts it.""",
     response_description="NA",
     responses={
+        304: {
+            "description": "The page matching If-None-Match / If-Modified-Since has not changed",
+        },
         404: {
             "description": "Invalid query specified",
             "content": {
@@ -692,8 +1099,8 @@ async def get_pyLDAvis_data(request: Request, num_topics: int = None, relevant_t
         },
     },
 )
-async def get_pyLDAvis_visual(request: Request, download_path:str = None,  num_topics: int = None) -> mod.Topic_Modelling_pyLDAvis:
-    allowed_params = ["download_path", "num_topics"]
+async def get_pyLDAvis_visual(request: Request, download_path:str = None,  num_topics: int = None, online: bool = False):
+    allowed_params = ["download_path", "num_topics", "online"]
     extra_params = [key for key in request.query_params if key not in allowed_params]
 
     if extra_params:
@@ -702,13 +1109,185 @@ async def get_pyLDAvis_visual(request: Request, download_path:str = None,  num_t
     if num_topics == None:
         raise HTTPException(status_code=422, detail="Number of topics value not specified")
 
-    LDAvis_data_filepath = os.path.join('./LDA_visual_Latest/ldavis_prepared_'+str(num_topics))
+    db = request.app.news
+    # A rendered page is only read from disk; preparing one is model work and queues with the rest of it
+    page = await concurrency.run_io(topics.visual_page, db, num_topics, online, prepare=False)
+    if page is None:
+        page = await concurrency.run_model(topics.visual_page, db, num_topics, online)
+    if page is None:
+        raise HTTPException(status_code=404, detail="Topic model not trained for num_topics")
 
-    with open(LDAvis_data_filepath, 'rb') as f:
-        vis_data = pickle.load(f)
-    
-    html_path = "lda_vis.html"
-    pyLDAvis.save_html(vis_data, html_path)
-    
-    return FileResponse(html_path, media_type='text/html', filename="lda_vis.html")
+    etag = f'"{page["etag"]}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(page["last_modified"], usegmt=True),
+        "Vary": "Accept-Encoding",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_none_match is not None:
+        if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+            return Response(status_code=304, headers=headers)
+    elif if_modified_since is not None:
+        try:
+            if int(page["last_modified"]) <= parsedate_to_datetime(if_modified_since).timestamp():
+                return Response(status_code=304, headers=headers)
+        except (TypeError, ValueError):
+            pass
+
+    headers["Content-Disposition"] = 'attachment; filename="lda_vis.html"'
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=page["gzip"], media_type="text/html", headers=headers)
+    return Response(content=page["html"], media_type="text/html", headers=headers)
+
+
+#JOBS
+async def submit_job(kind, params):
+    try:
+        # Inserting the job document is a Mongo round trip, kept off the event loop
+        job = await concurrency.run_io(job_manager.submit, kind, params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse(status_code=202, content=jsonable_encoder(mod.job_status(**job)))
+
+JOB_EXAMPLE = {
+    "_id": "3f2b8c0e9d8a4b6f9b1c2d3e4f5a6b7c",
+    "kind": "ner",
+    "params": {"mode": "incremental"},
+    "status": "running",
+    "cancel_requested": False,
+    "restarts": 0,
+    "done": 1280,
+    "total": 5000,
+    "docs_per_second": 21.4,
+    "eta_seconds": 173.8,
+    "result": None,
+    "error": None,
+    "created_at": "2024-12-17T08:23:49Z",
+    "started_at": "2024-12-17T08:23:50Z",
+    "finished_at": None,
+}
+
+@router.post("/jobs",
+    status_code=202,
+    response_model=mod.job_status,
+    summary="Submits a background job",
+    description="""Submits a long running job and returns it immediately. Specify kind as one of sentiment, ner, fetch, dedup, topic_model, topic_extras, rollups, entity_index in the request body, with params for the job.
+    ner accepts mode, verify_hash and restart. fetch accepts mode and retry_failed. dedup accepts mode. topic_model requires num_topics and accepts relevant_terms, online, coherence and visual. topic_extras requires num_topics and accepts online, coherence and visual. Poll /jobs/{job_id} for progress and the result.""",
+    response_description="The queued job",
+    responses={
+        202: {
+            "content": {
+                "application/json": {
+                    "example": {**JOB_EXAMPLE, "status": "queued", "done": 0, "total": None, "docs_per_second": None, "eta_seconds": None, "started_at": None}
+                }
+            },
+        },
+        400: {
+            "description": "Invalid job specified",
+            "content": {
+                "application/json": {
+                    "example": {"message": "Invalid job kind specified"}
+                }
+            },
+        },
+    },
+)
+async def create_job(request: Request, body: mod.JobSubmitRequest):
+    if request.query_params:
+        raise HTTPException(status_code=404, detail="Unexpected query parameter")
+    return await submit_job(body.kind, body.params)
+
+@router.get("/jobs",
+    response_model=List[mod.job_status],
+    summary="Lists recent jobs",
+    description="Lists the most recent jobs, newest first. Specify limit= to change how many are shown (Default is 20) and status= to only show jobs in that status.",
+    response_description="List of jobs",
+    responses={
+        200: {
+            "content": {
+                "application/json": {
+                    "example": [JOB_EXAMPLE]
+                }
+            },
+        },
+        404: {
+            "description": "Invalid query specified",
+            "content": {
+                "application/json": {
+                    "example": {"message": "Unexpected query parameter"}
+                }
+            },
+        },
+    },
+)
+def list_jobs(request: Request, limit: int = Query(20, ge=1, le=200), status: Optional[str] = None) -> List[mod.job_status]:
+    allowed_params = ["limit", "status"]
+    extra_params = [key for key in request.query_params if key not in allowed_params]
+
+    if extra_params:
+        raise HTTPException(status_code=404, detail="Unexpected query parameter")
+    return [mod.job_status(**job) for job in job_manager.list(limit=limit, status=status)]
 
+@router.get("/jobs/{job_id}",
+    response_model=mod.job_status,
+    summary="Shows a job",
+    description="Shows the status, progress (done/total, docs_per_second, eta_seconds) and, once finished, the result or error of a job.",
+    response_description="The job",
+    responses={
+        200: {
+            "content": {
+                "application/json": {
+                    "example": JOB_EXAMPLE
+                }
+            },
+        },
+        404: {
+            "description": "Job not found",
+            "content": {
+                "application/json": {
+                    "example": {"message": "Job not found"}
+                }
+            },
+        },
+    },
+)
+def get_job(request: Request, job_id: str) -> mod.job_status:
+    if request.query_params:
+        raise HTTPException(status_code=404, detail="Unexpected query parameter")
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return mod.job_status(**job)
+
+@router.delete("/jobs/{job_id}",
+    response_model=mod.job_status,
+    summary="Cancels a job",
+    description="Cancels a queued or running job. Running backfills stop after their current batch and keep the work already written.",
+    response_description="The job after the cancellation request",
+    responses={
+        200: {
+            "content": {
+                "application/json": {
+                    "example": {**JOB_EXAMPLE, "cancel_requested": True}
+                }
+            },
+        },
+        404: {
+            "description": "Job not found",
+            "content": {
+                "application/json": {
+                    "example": {"message": "Job not found"}
+                }
+            },
+        },
+    },
+)
+def cancel_job(request: Request, job_id: str) -> mod.job_status:
+    if request.query_params:
+        raise HTTPException(status_code=404, detail="Unexpected query parameter")
+    job = job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return mod.job_status(**job)
@@ -0,0 +1,59 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import nltk
+from nltk.sentiment.vader import SentimentIntensityAnalyzer
+from app.config import Config
+import app.metrics as metrics
+
+# One analyzer per process; building it parses the whole VADER lexicon
+_analyzer = None
+
+
+def get_analyzer():
+    global _analyzer
+    if _analyzer is None:
+        nltk.download('vader_lexicon', quiet=True)
+        _analyzer = SentimentIntensityAnalyzer()
+    return _analyzer
+
+
+def score_text(text):
+    return get_analyzer().polarity_scores(str(text)).get("compound")
+
+
+def score_chunk(texts):
+    analyzer = get_analyzer()
+    return [analyzer.polarity_scores(str(text)).get("compound") for text in texts]
+
+
+class SentimentEngine:
+    def __init__(self, workers: int = None, chunk_size: int = None):
+        self.workers = workers or Config.SENTIMENT_WORKERS or os.cpu_count() or 1
+        self.chunk_size = chunk_size or Config.SENTIMENT_CHUNK_SIZE
+        self._executor = None
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=get_analyzer)
+        return self._executor
+
+    @metrics.timed("vader")
+    def score(self, texts):
+        texts = list(texts)
+        metrics.observe_batch("vader", len(texts))
+        # Small inputs are not worth the pickling round trip to the pool
+        if self.workers <= 1 or len(texts) <= self.chunk_size:
+            return score_chunk(texts)
+        chunks = [texts[i:i + self.chunk_size] for i in range(0, len(texts), self.chunk_size)]
+        scores = []
+        for chunk_scores in self._pool().map(score_chunk, chunks):
+            scores.extend(chunk_scores)
+        return scores
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+engine = SentimentEngine()
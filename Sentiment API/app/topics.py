@@ -0,0 +1,415 @@
+import glob
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+import gensim
+import gensim.corpora as corpora
+from bson import ObjectId
+from app.config import Config
+from app.preprocess import PREPROCESS_VERSION
+import app.preprocess as preprocess
+import app.rollups as rollups
+import app.utils as utils
+
+CORPUS_FILE = "corpus.mm"
+VISUAL_FILE = "ldavis.json"
+# skip leaves the score out; background computes it in a topic_extras job after the response
+COHERENCE_MODES = ["full", "sample", "skip", "background"]
+VISUAL_MODES = ["now", "background", "skip"]
+
+_locks = {}
+_locks_guard = threading.Lock()
+# etag -> rendered page, most recently used last
+_pages = OrderedDict()
+_pages_lock = threading.Lock()
+
+
+def corpus_fingerprint(collection):
+    # Read on every topic request, so only from metadata and indexes: changes when articles are added or removed,
+    # and through the corpus version when their text is fetched or dedup changes which ones are counted
+    last = collection.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+    return {
+        "count": collection.estimated_document_count(),
+        "last_id": str(last["_id"]) if last else None,
+        "version": rollups.corpus_version(collection),
+    }
+
+
+def cache_key(fingerprint, num_topics):
+    key = json.dumps({"corpus": fingerprint, "num_topics": num_topics, "preprocess": PREPROCESS_VERSION}, sort_keys=True)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:20]
+
+
+def _entry_path(key):
+    return os.path.join(Config.TOPIC_CACHE_DIR, key)
+
+
+def _key_lock(key):
+    with _locks_guard:
+        return _locks.setdefault(key, threading.Lock())
+
+
+def load_entry(key):
+    path = _entry_path(key)
+    meta_path = os.path.join(path, "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        lda_model = gensim.models.LdaModel.load(os.path.join(path, "lda.model"))
+        id2word = corpora.Dictionary.load(os.path.join(path, "lda.dict"))
+    except Exception as e:
+        print(f"Discarding unreadable topic model cache entry {key}: {e}")
+        shutil.rmtree(path, ignore_errors=True)
+        return None
+    # Entries are evicted least recently used first
+    os.utime(meta_path)
+    return lda_model, id2word, meta
+
+
+def _staging_path(key):
+    return f"{_entry_path(key)}.tmp{os.getpid()}"
+
+
+def save_entry(key, lda_model, id2word, meta, staging=None):
+    # staging may already hold files written during training, e.g. the serialized corpus
+    path = _entry_path(key)
+    if staging is None:
+        staging = _staging_path(key)
+        shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging, exist_ok=True)
+    lda_model.save(os.path.join(staging, "lda.model"))
+    id2word.save(os.path.join(staging, "lda.dict"))
+    with open(os.path.join(staging, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(staging, path)
+
+
+def save_meta(key, meta):
+    meta_path = os.path.join(_entry_path(key), "meta.json")
+    with open(f"{meta_path}.tmp", "w") as f:
+        json.dump(meta, f)
+    os.replace(f"{meta_path}.tmp", meta_path)
+
+
+def _entry_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def cache_entries():
+    if not os.path.isdir(Config.TOPIC_CACHE_DIR):
+        return []
+    entries = []
+    for key in os.listdir(Config.TOPIC_CACHE_DIR):
+        meta_path = os.path.join(_entry_path(key), "meta.json")
+        if os.path.exists(meta_path):
+            corpus_path = os.path.join(_entry_path(key), CORPUS_FILE)
+            entries.append({
+                "key": key,
+                "last_used": os.path.getmtime(meta_path),
+                "bytes": _entry_size(_entry_path(key)),
+                "corpus_bytes": os.path.getsize(corpus_path) if os.path.exists(corpus_path) else 0,
+            })
+    return sorted(entries, key=lambda entry: entry["last_used"])
+
+
+def evict(keep=None):
+    now = time.time()
+    entries = cache_entries()
+    total = sum(entry["bytes"] for entry in entries)
+    evicted = []
+    for entry in entries:
+        if entry["key"] == keep:
+            continue
+        if now - entry["last_used"] > Config.TOPIC_CACHE_MAX_AGE or total > Config.TOPIC_CACHE_MAX_BYTES:
+            shutil.rmtree(_entry_path(entry["key"]), ignore_errors=True)
+            total -= entry["bytes"]
+            evicted.append(entry["key"])
+    return evicted
+
+
+def cache_stats():
+    entries = cache_entries()
+    return {
+        "entries": len(entries),
+        "bytes": sum(entry["bytes"] for entry in entries),
+        "corpus_bytes": sum(entry["corpus_bytes"] for entry in entries),
+        "max_bytes": Config.TOPIC_CACHE_MAX_BYTES,
+    }
+
+
+def _train(collection, key, num_topics, last_id, progress=None):
+    # Tokens are streamed from Mongo and the bag of words from disk, so memory does not grow with the corpus
+    query = {**rollups.COUNTED} if last_id is None else {"_id": {"$lte": last_id}, **rollups.COUNTED}
+    data_words = preprocess.TokenStream(collection, query, progress=progress)
+    staging = _staging_path(key)
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    corpus_path = os.path.join(staging, CORPUS_FILE) if Config.TOPIC_STREAM_CORPUS else None
+    try:
+        lda_model, id2word, score_data = utils.train_lda(data_words, num_topics, corpus_path=corpus_path)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return lda_model, id2word, score_data, staging
+
+
+def topic_model(collection, num_topics, relevant_terms=10, progress=None, coherence="sample", visual="background"):
+    fingerprint = corpus_fingerprint(collection)
+    key = cache_key(fingerprint, num_topics)
+    with _key_lock(key):
+        entry = load_entry(key)
+        if entry is None:
+            # The fingerprint's last _id pins the snapshot every pass over the corpus reads
+            last_id = ObjectId(fingerprint["last_id"]) if fingerprint["last_id"] else None
+            lda_model, id2word, score_data, staging = _train(collection, key, num_topics, last_id, progress=progress)
+            meta = {
+                "num_topics": num_topics,
+                "preprocess": PREPROCESS_VERSION,
+                "documents": id2word.num_docs,
+                "score": score_data,
+                "last_id": str(last_id) if last_id else None,
+                "trained_at": time.time(),
+            }
+            save_entry(key, lda_model, id2word, meta, staging=staging)
+            evict(keep=key)
+        else:
+            lda_model, id2word, meta = entry
+        meta, pending = _extras(collection, key, lda_model, id2word, meta, coherence, visual)
+    return meta["score"], utils.topic_terms(lda_model, relevant_terms), pending
+
+
+def online_key(num_topics):
+    return f"online_{num_topics}_v{PREPROCESS_VERSION}"
+
+
+def _needs_full_train(meta):
+    if meta is None:
+        return True
+    if meta.get("updates", 0) >= Config.TOPIC_ONLINE_RETRAIN_UPDATES:
+        return True
+    if time.time() - meta.get("full_trained_at", 0) > Config.TOPIC_ONLINE_RETRAIN_AGE:
+        return True
+    # The model's vocabulary is fixed at the full train; new words are dropped until the next one
+    new_tokens = meta.get("new_tokens", 0)
+    return new_tokens > 0 and meta.get("oov_tokens", 0) / new_tokens > Config.TOPIC_ONLINE_MAX_OOV
+
+
+def _full_train(collection, key, num_topics, progress=None):
+    last = collection.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+    last_id = last["_id"] if last else None
+    lda_model, id2word, score_data, staging = _train(collection, key, num_topics, last_id, progress=progress)
+    meta = {
+        "num_topics": num_topics,
+        "preprocess": PREPROCESS_VERSION,
+        "documents": id2word.num_docs,
+        "score": score_data,
+        "last_id": str(last_id) if last_id else None,
+        "updates": 0,
+        "new_tokens": 0,
+        "oov_tokens": 0,
+        "full_trained_at": time.time(),
+        "trained_at": time.time(),
+    }
+    save_entry(key, lda_model, id2word, meta, staging=staging)
+    return lda_model, id2word, meta
+
+
+def _fold_in(collection, key, lda_model, id2word, meta, progress=None):
+    query = {**rollups.COUNTED} if meta.get("last_id") is None else {"_id": {"$gt": ObjectId(meta["last_id"])}, **rollups.COUNTED}
+    docs = list(preprocess.iter_tokens(collection, query, progress=progress))
+    if not docs:
+        return meta
+    data_words = [tokens for _, tokens in docs]
+    tokens = sum(len(words) for words in data_words)
+    oov = sum(1 for words in data_words for word in words if word not in id2word.token2id)
+    corpus = [id2word.doc2bow(words) for words in data_words]
+    lda_model.update(corpus)
+    meta = {
+        **meta,
+        "documents": meta.get("documents", 0) + len(docs),
+        "last_id": str(docs[-1][0]),
+        "updates": meta.get("updates", 0) + 1,
+        "new_tokens": meta.get("new_tokens", 0) + tokens,
+        "oov_tokens": meta.get("oov_tokens", 0) + oov,
+        # Coherence and the visualisation describe the model before the update until they are recomputed
+        "score": {**meta["score"], "Persplexity": lda_model.log_perplexity(corpus)},
+        "coherence": None,
+        "trained_at": time.time(),
+    }
+    save_entry(key, lda_model, id2word, meta)
+    return meta
+
+
+def online_topic_model(collection, num_topics, relevant_terms=10, progress=None, coherence="sample", visual="background"):
+    key = online_key(num_topics)
+    with _key_lock(key):
+        entry = load_entry(key)
+        meta = entry[2] if entry is not None else None
+        if _needs_full_train(meta):
+            lda_model, id2word, meta = _full_train(collection, key, num_topics, progress=progress)
+        else:
+            lda_model, id2word, meta = entry
+            meta = _fold_in(collection, key, lda_model, id2word, meta, progress=progress)
+        evict(keep=key)
+        meta, pending = _extras(collection, key, lda_model, id2word, meta, coherence, visual)
+    return meta["score"], utils.topic_terms(lda_model, relevant_terms), pending
+
+
+def _snapshot_query(meta):
+    # Duplicate copies of a story would weight it several times over
+    if meta.get("last_id") is None:
+        return {**rollups.COUNTED}
+    return {"_id": {"$lte": ObjectId(meta["last_id"])}, **rollups.COUNTED}
+
+
+def _corpus(collection, key, id2word, meta):
+    path = os.path.join(_entry_path(key), CORPUS_FILE)
+    if os.path.exists(path):
+        return corpora.MmCorpus(path)
+    return [id2word.doc2bow(tokens) for tokens in preprocess.TokenStream(collection, _snapshot_query(meta))]
+
+
+def ensure_coherence(collection, key, lda_model, id2word, meta, mode):
+    # A full score also answers a request for a sampled one
+    if meta.get("coherence") in ["full", mode]:
+        return meta
+    if mode == "sample":
+        texts = preprocess.sample_tokens(collection, _snapshot_query(meta), Config.TOPIC_COHERENCE_SAMPLE)
+    else:
+        texts = preprocess.TokenStream(collection, _snapshot_query(meta))
+    meta = {**meta, "coherence": mode, "score": {**meta["score"], "Coherence": utils.lda_coherence(lda_model, texts, id2word)}}
+    save_meta(key, meta)
+    return meta
+
+
+def ensure_visual(collection, key, lda_model, id2word, meta):
+    path = os.path.join(_entry_path(key), VISUAL_FILE)
+    if not os.path.exists(path):
+        utils.prepare_pyLDAvis(lda_model, _corpus(collection, key, id2word, meta), id2word, f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+    return path
+
+
+def _extras(collection, key, lda_model, id2word, meta, coherence, visual):
+    pending = []
+    if coherence in ["full", "sample"]:
+        meta = ensure_coherence(collection, key, lda_model, id2word, meta, coherence)
+    elif coherence == "background" and meta.get("coherence") != "full":
+        pending.append("coherence")
+    if coherence == "skip" or meta.get("coherence") is None:
+        meta = {**meta, "score": {name: value for name, value in meta["score"].items() if name != "Coherence"}}
+    visual_ready = os.path.exists(os.path.join(_entry_path(key), VISUAL_FILE))
+    if visual == "now":
+        ensure_visual(collection, key, lda_model, id2word, meta)
+    elif visual == "background" and not visual_ready:
+        pending.append("visual")
+    return meta, pending
+
+
+def current_key(collection, num_topics, online=False):
+    if online:
+        return online_key(num_topics)
+    return cache_key(corpus_fingerprint(collection), num_topics)
+
+
+def topic_extras(collection, num_topics, online=False, coherence=True, visual=True, progress=None):
+    # Runs the scoring and visualisation work a request deferred with coherence=background / visual=background
+    key = current_key(collection, num_topics, online)
+    with _key_lock(key):
+        entry = load_entry(key)
+        if entry is None:
+            raise ValueError("Topic model not trained for num_topics")
+        lda_model, id2word, meta = entry
+        steps = int(bool(coherence)) + int(bool(visual))
+        if coherence:
+            meta = ensure_coherence(collection, key, lda_model, id2word, meta, "full")
+            if progress:
+                progress(1, steps)
+        if visual:
+            ensure_visual(collection, key, lda_model, id2word, meta)
+            if progress:
+                progress(steps, steps)
+    return {"key": key, "score": meta["score"], "visual": bool(visual)}
+
+
+def _render_page(key, json_path):
+    with open(json_path, encoding="utf-8") as f:
+        payload = f.read()
+    # Named after the prepared data, so a page is only rendered once per prepared model
+    digest = hashlib.sha1(payload.encode("utf-8")).hexdigest()[:20]
+    html_path = os.path.join(_entry_path(key), f"ldavis-{digest}.html")
+    html = utils.render_pyLDAvis(payload).encode("utf-8")
+    for path, content in [(f"{html_path}.gz", gzip.compress(html)), (html_path, html)]:
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(content)
+        os.replace(f"{path}.tmp", path)
+    return html_path
+
+
+def latest_key(num_topics):
+    # Most recently used full model for num_topics, whichever corpus it was trained on
+    for entry in reversed(cache_entries()):
+        key = entry["key"]
+        if key.startswith("online_") or ".tmp" in key:
+            continue
+        try:
+            with open(os.path.join(_entry_path(key), "meta.json")) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if meta.get("num_topics") == num_topics and meta.get("preprocess") == PREPROCESS_VERSION:
+            return key
+    return None
+
+
+def visual_page(collection, num_topics, online=False, prepare=True):
+    # Rendered pyLDAvis HTML for the current model: {etag, last_modified, html, gzip}, or None if it was never trained.
+    # prepare=False only serves pages already rendered and returns None when one would have to be prepared first
+    key = current_key(collection, num_topics, online)
+    page = _visual_page(collection, key, prepare)
+    if page is None and not online and not os.path.exists(os.path.join(_entry_path(key), "meta.json")):
+        # Any new article changes the corpus fingerprint; until the model is retrained the last one trained is served
+        fallback = latest_key(num_topics)
+        if fallback is not None and fallback != key:
+            page = _visual_page(collection, fallback, prepare)
+    return page
+
+
+def _visual_page(collection, key, prepare=True):
+    with _key_lock(key):
+        rendered = glob.glob(os.path.join(_entry_path(key), "ldavis-*.html"))
+        if rendered:
+            html_path = rendered[0]
+            os.utime(os.path.join(_entry_path(key), "meta.json"))
+        elif not prepare:
+            return None
+        else:
+            entry = load_entry(key)
+            if entry is None:
+                return None
+            lda_model, id2word, meta = entry
+            html_path = _render_page(key, ensure_visual(collection, key, lda_model, id2word, meta))
+    etag = os.path.basename(html_path)[len("ldavis-"):-len(".html")]
+    with _pages_lock:
+        page = _pages.get(etag)
+        if page is not None:
+            _pages.move_to_end(etag)
+            return page
+    with open(html_path, "rb") as f:
+        html = f.read()
+    with open(f"{html_path}.gz", "rb") as f:
+        compressed = f.read()
+    page = {"etag": etag, "last_modified": os.path.getmtime(html_path), "html": html, "gzip": compressed}
+    with _pages_lock:
+        _pages[etag] = page
+        while len(_pages) > Config.VISUAL_PAGE_CACHE_SIZE:
+            _pages.popitem(last=False)
+    return page
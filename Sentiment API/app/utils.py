@@ -1,99 +1,248 @@
 from dotenv import load_dotenv
-import requests
-from newspaper import Article
-import requests
 import nltk
-from nltk.sentiment.vader import SentimentIntensityAnalyzer
-nltk.download('vader_lexicon', quiet=True)
-from gliner import GLiNER
 from app.config import Config
+from app.sentiment import score_text
+from app.registry import registry
+import app.metrics as metrics
+import app.rollups as rollups
 from typing import Optional, Dict
 import gensim
-from gensim.utils import simple_preprocess
 from gensim.models import CoherenceModel
-import nltk
-nltk.download('stopwords', quiet=True)
-from nltk.corpus import stopwords
 import gensim.corpora as corpora
 import os
-import pickle 
+import hashlib
+import base64
+import json
+from datetime import datetime
+from bson import ObjectId
 import pyLDAvis.gensim
 import pyLDAvis
 
 load_dotenv()
 
-model = GLiNER.from_pretrained("urchade/gliner_medium-v2.1")
-
+@metrics.timed("vader")
 def input_sentiments_vader(data):
-    sent = SentimentIntensityAnalyzer()
-    polarity = sent.polarity_scores(data)
-    return polarity.get("compound")
+    return score_text(data)
 
 def gliner_ner(data):
+    return gliner_ner_batch([data])[0]
+
+def ner_text(doc):
+    text = doc.get("actual_text")
+    if text == "":
+        text = doc.get("text")
+        if text == "":
+            text = doc.get("title", "")
+    return text
+
+def text_hash(text):
+    return hashlib.sha1(str(text or "").encode("utf-8")).hexdigest()
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def split_text_windows(text, window_words=None, overlap_words=None):
+    # GLiNER truncates anything past its context, so long articles are cut into overlapping word windows
+    window_words = window_words or Config.NER_WINDOW_WORDS
+    overlap_words = min(overlap_words if overlap_words is not None else Config.NER_WINDOW_OVERLAP, window_words - 1)
+    words = str(text or "").split()
+    if len(words) <= window_words:
+        return [" ".join(words)]
+    windows = []
+    step = window_words - overlap_words
+    for start in range(0, len(words), step):
+        windows.append(" ".join(words[start:start + window_words]))
+        if start + window_words >= len(words):
+            break
+    return windows
+
+def merge_entities(entity_lists):
     ner_dict = {}
-    model = GLiNER.from_pretrained("urchade/gliner_medium-v2.1")
-    labels = ["person", "nationality", "religious group", "political group", "facility", "organisation", "country", "city", "state"]
-    entities = model.predict_entities(data, labels, threshold=0.5)
-    if not entities:
+    for entities in entity_lists:
+        for entity in entities:
+            if entity["label"] not in ner_dict:
+                ner_dict[entity["label"]] = [entity["text"]]
+            else:
+                if entity["text"] not in ner_dict.get(entity["label"]):
+                    ner_dict[entity["label"]].append(entity["text"])
+    if not ner_dict:
         return None
-    for entity in entities:
-        if entity["label"] not in ner_dict:
-            ner_dict[entity["label"]] = [entity["text"]]
+    return ner_dict
+
+@metrics.timed("gliner")
+def gliner_ner_batch(texts, batch_size=None):
+    model = registry.get_gliner()
+    batch_size = batch_size or Config.NER_BATCH_SIZE
+    windows = []
+    for doc_index, text in enumerate(texts):
+        for window in split_text_windows(text):
+            if window:
+                windows.append((doc_index, window))
+    # Similar lengths in a batch keep padding, and therefore wasted compute, low
+    windows.sort(key=lambda item: len(item[1]))
+
+    entities_per_doc = [[] for _ in texts]
+    for batch in batched(windows, batch_size):
+        metrics.observe_batch("gliner", len(batch))
+        predictions = model.batch_predict_entities([window for _, window in batch], Config.GLINER_LABELS, threshold=Config.GLINER_THRESHOLD)
+        for (doc_index, _), entities in zip(batch, predictions):
+            entities_per_doc[doc_index].append(entities)
+
+    return [merge_entities(entity_lists) for entity_lists in entities_per_doc]
+
+
+CURSOR_SORTS = ["_id", "publishedDate"]
+
+def cursor_sort(sort):
+    if sort == "_id":
+        return [("_id", 1)]
+    return [(sort, 1), ("_id", 1)]
+
+def encode_cursor(doc, sort="_id"):
+    payload = {"s": sort, "id": str(doc.get("_id"))}
+    if sort != "_id":
+        value = doc.get(sort)
+        if isinstance(value, datetime):
+            payload["v"] = value.isoformat()
+            payload["t"] = "date"
         else:
-            if entity["text"] not in ner_dict.get(entity["label"]):
-                ner_dict[entity["label"]].append(entity["text"])
+            payload["v"] = value
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
 
-    return ner_dict
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(raw)
+        payload["id"] = ObjectId(payload["id"])
+        if payload.get("t") == "date":
+            payload["v"] = datetime.fromisoformat(payload["v"])
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return payload
+
+def cursor_query(token, sort="_id"):
+    payload = decode_cursor(token)
+    if payload.get("s") != sort:
+        raise ValueError("Cursor was issued for a different sort")
+    if sort == "_id":
+        return {"_id": {"$gt": payload["id"]}}
+    value = payload.get("v")
+    if value is None:
+        # Nulls and missing values sort first and $gt null matches nothing, so every dated document comes after them
+        return {"$or": [{sort: {"$ne": None}}, {sort: None, "_id": {"$gt": payload["id"]}}]}
+    return {"$or": [{sort: {"$gt": value}}, {sort: value, "_id": {"$gt": payload["id"]}}]}
+
+def use_rollups(collection, date_only, filter_column=None):
+    # Daily rollups only hold whole days, split by nothing, disruptionType or location
+    if not date_only or filter_column not in [None] + rollups.DIMENSIONS:
+        return False
+    return rollups.rollups_ready(collection)
 
+def ner_count_pipeline(match=None, date_only=False, top_k=10):
+    published = {"$toDate": "$publishedDate"}
+    if date_only:
+        published = {"$dateTrunc": {"date": published, "unit": "day"}}
+    return [
+        {"$match": {**(match or {}), **rollups.COUNTED, "ner": {"$type": "object"}}},
+        {"$project": {"_id": 0, "date": published, "ner": {"$objectToArray": "$ner"}}},
+        {"$unwind": "$ner"},
+        {"$unwind": "$ner.v"},
+        {"$group": {"_id": {"date": "$date", "label": "$ner.k", "entity": "$ner.v"}, "count": {"$sum": 1}}},
+        {"$sort": {"count": -1, "_id.entity": 1}},
+        {"$group": {"_id": {"date": "$_id.date", "label": "$_id.label"}, "entities": {"$push": {"entity": "$_id.entity", "count": "$count"}}}},
+        {"$project": {"entities": {"$slice": ["$entities", top_k]}}},
+    ]
 
-def extract_actual_text(url):
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
-    }
-    try: 
-        response = requests.get(url, headers=headers, timeout=30)
-        article = Article(url)
-        article.set_html(response.text)
-
-        article.parse()
-        article.nlp()
-        return article.text
-    except: 
-        return "NA"
-    
-
-def sent_to_words(sentences):
-    for sentence in sentences:
-        # deacc=True removes punctuations
-        yield(gensim.utils.simple_preprocess(str(sentence), deacc=True))
-
-def remove_stopwords(texts):
-    stop_words = stopwords.words('english')
-    stop_words.extend(['from', 'subject', 're', 'edu', 'use'])
-    return [[word for word in simple_preprocess(str(doc)) 
-             if word not in stop_words] for doc in texts]
-
-def generate_pyLDAvis_topics(text, num_topics, num_terms):
-    data_words = list(sent_to_words(text))
-    data_words = remove_stopwords(data_words)
+@metrics.timed("ner_counts")
+def ner_counts(rows):
+    counts = {}
+    for row in rows:
+        date = row["_id"]["date"]
+        if date is None:
+            continue
+        labels = counts.setdefault(date.isoformat(), {})
+        labels[row["_id"]["label"]] = {item["entity"]: item["count"] for item in row["entities"]}
+    return counts
+
+SENTIMENT_ACCUMULATORS = {
+    "sum": {"$sum": "$sentiment"},
+    "average": {"$avg": "$sentiment"},
+    "positive_count": {"$sum": 1},
+    "negative_count": {"$sum": 1},
+    "total_count": {"$sum": 1},
+}
+
+def sentiment_pipeline(aggregate, date_only=False, match=None):
+    sentiment_match = {"$exists": True, "$ne": None}
+    # Dates without a single positive/negative doc are left out, so filter before grouping
+    if aggregate == "positive_count":
+        sentiment_match["$gt"] = 0
+    elif aggregate == "negative_count":
+        sentiment_match["$lt"] = 0
+    published = {"$toDate": "$publishedDate"}
+    if date_only:
+        published = {"$dateTrunc": {"date": published, "unit": "day"}}
+    return [
+        {"$match": {**(match or {}), **rollups.COUNTED, "sentiment": sentiment_match}},
+        {"$project": {"_id": 0, "publishedDate": 1, "sentiment": 1}},
+        {"$group": {"_id": published, "value": SENTIMENT_ACCUMULATORS[aggregate]}},
+        {"$sort": {"_id": 1}},
+    ]
+
+
+@metrics.timed("lda_train")
+def train_lda(data_words, num_topics, corpus_path=None):
     id2word = corpora.Dictionary(data_words)
     texts = data_words
-    corpus = [id2word.doc2bow(text) for text in texts]
+    corpus = (id2word.doc2bow(text) for text in texts)
+    if corpus_path is None:
+        corpus = list(corpus)
+    else:
+        # Every later pass streams the bag of words from disk instead of holding it in memory
+        corpora.MmCorpus.serialize(corpus_path, corpus)
+        corpus = corpora.MmCorpus(corpus_path)
     lda_model = gensim.models.LdaMulticore(corpus=corpus,
                                        id2word=id2word,
                                        num_topics=num_topics)
-    topics_data: Dict[str, str] = {}
-    for topic_num, topic in lda_model.print_topics(num_words=num_terms):
-        topics_data[f"Topic {topic_num}"] = str(topic)
 
-    LDAvis_data_filepath = os.path.join('./LDA_visual_Latest/ldavis_prepared_'+str(num_topics))
+    score_data = {}
+    score_data["Persplexity"] = lda_model.log_perplexity(corpus)
+    return lda_model, id2word, score_data
+
+@metrics.timed("lda_coherence")
+def lda_coherence(lda_model, texts, id2word):
+    coherence_model_lda = CoherenceModel(model=lda_model, texts=texts, dictionary=id2word, coherence='c_v')
+    return coherence_model_lda.get_coherence()
+
+class PreparedJSON:
+    # pyLDAvis only needs to_json() to render, so the prepared data can be kept as JSON instead of a pickle
+    def __init__(self, payload):
+        self.payload = payload
+
+    def to_json(self):
+        return self.payload
 
+@metrics.timed("pyldavis_prepare")
+def prepare_pyLDAvis(lda_model, corpus, id2word, path):
     LDAvis_prepared = pyLDAvis.gensim.prepare(lda_model, corpus, id2word)
-    with open(LDAvis_data_filepath, 'wb') as f:
-        pickle.dump(LDAvis_prepared, f)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(LDAvis_prepared.to_json())
+    return LDAvis_prepared
 
-    score_data = {}
-    score_data["Persplexity"] = lda_model.log_perplexity(corpus)
-    coherence_model_lda = CoherenceModel(model=lda_model, texts=data_words, dictionary=id2word, coherence='c_v')
-    score_data["Coherence"] = coherence_model_lda.get_coherence()
-    return score_data, topics_data
+@metrics.timed("pyldavis_render")
+def render_pyLDAvis(payload):
+    return pyLDAvis.prepared_data_to_html(PreparedJSON(payload))
+
+def topic_terms(lda_model, num_terms):
+    topics_data: Dict[str, str] = {}
+    for topic_num, topic in lda_model.print_topics(num_words=num_terms):
+        topics_data[f"Topic {topic_num}"] = str(topic)
+    return topics_data
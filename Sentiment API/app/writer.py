@@ -0,0 +1,68 @@
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from app.config import Config
+
+
+class BulkWriter:
+    def __init__(self, collection, chunk_size: int = None):
+        self.collection = collection
+        self.chunk_size = chunk_size or Config.BULK_WRITE_SIZE
+        self.operations = []
+        self.matched = 0
+        self.modified = 0
+        self.upserted = 0
+        self.errors = 0
+        self.flushes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+
+    def add(self, operation):
+        self.operations.append(operation)
+        if len(self.operations) >= self.chunk_size:
+            self.flush()
+
+    def update_one(self, filter, update, upsert=False):
+        self.add(UpdateOne(filter, update, upsert=upsert))
+
+    def flush(self):
+        if not self.operations:
+            return {"matched": 0, "modified": 0, "upserted": 0, "errors": 0}
+        operations, self.operations = self.operations, []
+        try:
+            result = self.collection.bulk_write(operations, ordered=False)
+            counts = {
+                "matched": result.matched_count,
+                "modified": result.modified_count,
+                "upserted": result.upserted_count,
+                "errors": 0,
+            }
+        except BulkWriteError as e:
+            # Unordered writes keep going past failures, so the successful part still counts
+            details = e.details
+            counts = {
+                "matched": details.get("nMatched", 0),
+                "modified": details.get("nModified", 0),
+                "upserted": details.get("nUpserted", 0),
+                "errors": len(details.get("writeErrors", [])),
+            }
+            print(f"Bulk write to {self.collection.name} had {counts['errors']} errors: {details.get('writeErrors', [])[:3]}")
+
+        self.matched += counts["matched"]
+        self.modified += counts["modified"]
+        self.upserted += counts["upserted"]
+        self.errors += counts["errors"]
+        self.flushes += 1
+        return counts
+
+    def totals(self):
+        return {
+            "matched": self.matched,
+            "modified": self.modified,
+            "upserted": self.upserted,
+            "errors": self.errors,
+            "flushes": self.flushes,
+        }
@@ -0,0 +1,105 @@
+import random
+from datetime import datetime, timedelta
+
+DISRUPTION_TYPES = ["Political", "Natural Disaster", "Economic", "Cyber Attack", "Logistics", "Labor Strike", "Health"]
+SEVERITIES = ["Low", "Medium", "High"]
+LOCATIONS = {
+    "United States": (38.79, -106.53),
+    "China": (35.86, 104.19),
+    "Germany": (51.16, 10.45),
+    "India": (20.59, 78.96),
+    "Brazil": (-14.23, -51.92),
+    "Japan": (36.20, 138.25),
+    "Nigeria": (9.08, 8.67),
+    "Australia": (-25.27, 133.77),
+}
+ENTITIES = {
+    "organisation": ["CISA", "Maersk", "World Bank", "Foxconn", "Red Cross", "OPEC", "Samsung", "FedEx"],
+    "country": list(LOCATIONS),
+    "city": ["Shanghai", "Rotterdam", "Los Angeles", "Hamburg", "Mumbai", "Lagos", "Osaka", "Santos"],
+    "person": ["Jane Doe", "John Smith", "Maria Silva", "Wei Chen", "Amara Okafor", "Kenji Sato"],
+}
+WORDS = (
+    "supply chain port shipping container delay shortage factory strike storm flood earthquake cyber attack "
+    "ransomware tariff sanction export import freight rail truck warehouse inventory demand price market "
+    "semiconductor chip energy fuel oil gas power outage network system government policy trade border "
+    "customs vessel canal route capacity backlog logistics carrier airline cargo production plant worker "
+    "union wage negotiation recovery forecast risk impact disruption global regional local industry sector"
+).split()
+TONE = "good strong growth recovered improved stable safe bad weak losses damaged worst crisis severe".split()
+START = datetime(2024, 1, 1)
+
+
+def parse_scale(value):
+    value = str(value).strip().lower()
+    for suffix, factor in [("k", 1_000), ("m", 1_000_000)]:
+        if value.endswith(suffix):
+            return int(float(value[:-1]) * factor)
+    return int(value)
+
+
+def _paragraph(rng, words):
+    return " ".join(rng.choice(TONE) if rng.random() < 0.05 else rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _article(rng, entities, words):
+    sentences = []
+    while words > 0:
+        length = min(rng.randint(12, 30), words)
+        sentence = _paragraph(rng, length)
+        if rng.random() < 0.3:
+            sentence = f"{rng.choice(entities)} said {sentence[0].lower()}{sentence[1:]}"
+        sentences.append(sentence)
+        words -= length
+    return " ".join(sentences)
+
+
+def document(i, rng):
+    # Shaped like the documents the backend ingest writes, plus sentiment and ner as the backfills leave them
+    location = rng.choice(list(LOCATIONS))
+    lat, lng = LOCATIONS[location]
+    ner = {label: rng.sample(values, rng.randint(1, 3)) for label, values in ENTITIES.items() if rng.random() < 0.7}
+    names = [name for values in ner.values() for name in values] or [location]
+    published = START + timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+    actual_text = _article(rng, names, rng.randint(150, 400))
+    return {
+        "title": _paragraph(rng, rng.randint(6, 12)),
+        "disruptionType": rng.choice(DISRUPTION_TYPES),
+        "url": f"https://news.example.com/articles/{i}",
+        "imageUrl": f"https://news.example.com/images/{i}.jpg" if rng.random() < 0.8 else "No Image",
+        "publishedDate": published.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "raw_text": actual_text[:200],
+        "text": _paragraph(rng, rng.randint(30, 60)),
+        "location": location,
+        "lat": lat + rng.uniform(-2, 2),
+        "lng": lng + rng.uniform(-2, 2),
+        "radius": rng.uniform(0, 5000),
+        "severity": rng.choice(SEVERITIES),
+        "isdeleted": False,
+        "actual_text": actual_text,
+        "sentiment": round(rng.uniform(-1, 1), 4),
+        "ner": ner or None,
+    }
+
+
+def documents(count, seed=42):
+    rng = random.Random(seed)
+    for i in range(count):
+        yield document(i, rng)
+
+
+def load(collection, count, seed=42, batch_size=5000):
+    collection.drop()
+    batch = []
+    for doc in documents(count, seed):
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+    return collection.estimated_document_count()
+
+
+def sample_texts(count, seed=42):
+    return [doc["actual_text"] for doc in documents(count, seed)]
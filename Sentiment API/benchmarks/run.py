@@ -0,0 +1,331 @@
+import argparse
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import benchmarks.corpus as corpus
+from benchmarks.stubs import StubGLiNER
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+# Metrics where a higher value is a regression, and where a lower value is
+HIGHER_IS_WORSE = ["p50_ms", "p95_ms", "peak_rss_mb"]
+LOWER_IS_WORSE = ["throughput"]
+
+ENDPOINTS = [
+    ("data_all_limit", "/data/all?limits=1000"),
+    ("data_all_page", "/data/all?page_size=500&sort=publishedDate"),
+    ("data_all_fields", "/data/all?limits=1000&fields=lat,lng,severity,title"),
+    ("data_filter", "/data?column=disruptionType&value=political"),
+    ("data_filter_date", "/data?column=publishedDate&value=2024-06"),
+    ("sentiment_average", "/get_sentiment?aggregate=average"),
+    ("sentiment_daily", "/get_sentiment?aggregate=total_count&date_only=true"),
+    ("sentiment_filtered", "/get_sentiment?aggregate=average&date_only=true&filter_column=location&filter_value=germany"),
+    ("ner_list", "/get_ner?date_only=true"),
+    ("ner_count", "/get_ner?mode=count&date_only=true&top_k=10"),
+    ("entity_mentions", "/entities/organisation/Maersk?page_size=100"),
+    ("entity_mentions_range", "/entities/organisation/Maersk?start=2024-03-01T00:00:00&end=2024-09-01T00:00:00&page_size=100"),
+]
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        import resource
+        # High-water mark of the whole process; kilobytes on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class PeakRSS:
+    # Samples the resident set size while a case runs, so each case gets its own peak
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, rss_bytes())
+
+    def __enter__(self):
+        self.peak = rss_bytes()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_bytes())
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
+
+
+def summary(seconds, throughput, peak):
+    return {
+        "runs": len(seconds),
+        "p50_ms": round(percentile(seconds, 50) * 1000, 3),
+        "p95_ms": round(percentile(seconds, 95) * 1000, 3),
+        "p99_ms": round(percentile(seconds, 99) * 1000, 3),
+        "throughput": round(throughput, 3),
+        "peak_rss_mb": round(peak / (1024 * 1024), 1),
+    }
+
+
+def bench_endpoint(client, path, repeat, concurrency):
+    def request():
+        start = time.perf_counter()
+        response = client.get(path)
+        elapsed = time.perf_counter() - start
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} returned {response.status_code}: {response.text[:200]}")
+        return elapsed
+
+    # The first request pays for imports and lazy setup
+    request()
+    with PeakRSS() as rss:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            seconds = list(pool.map(lambda _: request(), range(repeat)))
+        wall = time.perf_counter() - start
+    # Requests per second
+    return summary(seconds, repeat / wall, rss.peak)
+
+
+def bench_stage(func, items, repeat):
+    seconds = []
+    with PeakRSS() as rss:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func(items)
+            seconds.append(time.perf_counter() - start)
+    # Documents per second at the median run
+    return summary(seconds, len(items) / percentile(seconds, 50), rss.peak)
+
+
+def sentiment_stage(texts):
+    from app.sentiment import engine
+    engine.score(texts)
+
+
+def ner_stage(texts):
+    import app.utils as utils
+    utils.gliner_ner_batch(texts)
+
+
+def bench_topics(collection, num_topics, repeat, warm):
+    import app.topics as topics
+    from app.config import Config
+    from app.preprocess import TOKEN_FIELDS
+    count = collection.estimated_document_count()
+    cache_dir = Config.TOPIC_CACHE_DIR
+    seconds = []
+    # The repo's own model cache is never read or written
+    with tempfile.TemporaryDirectory() as tmp:
+        Config.TOPIC_CACHE_DIR = tmp
+        try:
+            if warm:
+                # Trained once up front, so every timed run loads the model from the cache
+                topics.topic_model(collection, num_topics)
+            with PeakRSS() as rss:
+                for i in range(repeat):
+                    if not warm:
+                        # An empty cache directory and no cached tokens, so every run tokenizes and trains from scratch
+                        Config.TOPIC_CACHE_DIR = os.path.join(tmp, str(i))
+                        collection.update_many({}, {"$unset": {field: "" for field in TOKEN_FIELDS}})
+                    start = time.perf_counter()
+                    topics.topic_model(collection, num_topics)
+                    seconds.append(time.perf_counter() - start)
+        finally:
+            Config.TOPIC_CACHE_DIR = cache_dir
+    # Documents per second at the median run
+    return summary(seconds, count / percentile(seconds, 50), rss.peak)
+
+
+def news_collection(args):
+    if args.mongo_uri:
+        from pymongo import MongoClient
+        return MongoClient(args.mongo_uri)[args.database]["news"]
+    try:
+        import mongomock
+    except ImportError:
+        raise SystemExit("mongomock is not installed; pip install mongomock or pass --mongo-uri")
+    return mongomock.MongoClient()[args.database]["news"]
+
+
+def prepare(collection, args):
+    if args.reuse and collection.estimated_document_count() == args.scale:
+        print(f"Reusing {args.scale} documents in {collection.full_name}")
+    else:
+        if args.scale >= 100_000 and not args.mongo_uri:
+            print("mongomock keeps every document in memory; use --mongo-uri for 100k and more if this runs out")
+        start = time.perf_counter()
+        count = corpus.load(collection, args.scale, seed=args.seed)
+        print(f"Loaded {count} documents in {time.perf_counter() - start:.1f}s")
+    import app.indexes as indexes
+    import app.rollups as rollups
+    import app.entities as entities
+    builds = [("indexes", indexes.ensure_indexes), ("entity index", entities.rebuild_index)]
+    if args.rollups:
+        builds.append(("rollups", rollups.rebuild_rollups))
+    for name, build in builds:
+        try:
+            build(collection)
+        except Exception as e:
+            # mongomock lacks collations and some aggregation operators; the affected endpoints then report errors
+            print(f"Could not build {name} on this backend: {type(e).__name__}: {e}")
+
+
+def selected(name, cases):
+    return not cases or any(name == case or name.startswith(case + ".") for case in cases)
+
+
+def run(args):
+    from app.registry import registry
+    # NER runs against a stub; the real model would dominate every number and needs a download
+    registry.get_gliner = lambda name=None: StubGLiNER()
+    collection = news_collection(args)
+    results = {
+        "meta": {
+            "scale": args.scale,
+            "backend": "mongod" if args.mongo_uri else "mongomock",
+            "seed": args.seed,
+            "rollups": args.rollups,
+            "repeat": args.repeat,
+            "concurrency": args.concurrency,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        },
+        "cases": {},
+    }
+
+    endpoints = [(f"endpoint.{name}", path) for name, path in ENDPOINTS if selected(f"endpoint.{name}", args.cases)]
+    topic_cases = [(name, warm) for name, warm in [("stage.lda.cold", False), ("stage.lda.warm", True)] if selected(name, args.cases)]
+    if endpoints or topic_cases:
+        prepare(collection, args)
+    if endpoints:
+        from fastapi.testclient import TestClient
+        from app import app
+        # The lifespan (startup jobs, enrichment worker) is skipped; requests only need the collection
+        app.news = collection
+        client = TestClient(app)
+        for name, path in endpoints:
+            results["cases"][name] = _run_case(name, lambda: bench_endpoint(client, path, args.repeat, args.concurrency))
+
+    texts = corpus.sample_texts(min(args.scale, args.stage_docs), seed=args.seed)
+    stages = [
+        ("stage.sentiment", sentiment_stage, texts),
+        ("stage.ner", ner_stage, texts[:args.ner_docs]),
+    ]
+    for name, func, items in stages:
+        if selected(name, args.cases):
+            results["cases"][name] = _run_case(name, lambda: bench_stage(func, items, args.stage_repeat))
+    # The topic model trains on the whole loaded corpus, as the API does
+    for name, warm in topic_cases:
+        results["cases"][name] = _run_case(name, lambda: bench_topics(collection, args.num_topics, args.stage_repeat, warm))
+    return results
+
+
+def _run_case(name, func):
+    try:
+        result = func()
+        print(f"{name}: p50 {result['p50_ms']}ms, p95 {result['p95_ms']}ms, {result['throughput']}/s, peak RSS {result['peak_rss_mb']}MB")
+        return result
+    except Exception as e:
+        print(f"{name} failed: {type(e).__name__}: {e}")
+        return {"error": f"{type(e).__name__}: {e}"}
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, case in results["cases"].items():
+        base = baseline.get("cases", {}).get(name)
+        if not base or "error" in base:
+            continue
+        if "error" in case:
+            # A case that used to run and now fails is the worst regression of all
+            regressions.append((name, "error", "ok", case["error"]))
+            continue
+        for metric in HIGHER_IS_WORSE:
+            if base.get(metric) and case[metric] > base[metric] * (1 + threshold):
+                regressions.append((name, metric, base[metric], case[metric]))
+        for metric in LOWER_IS_WORSE:
+            if base.get(metric) and case[metric] < base[metric] / (1 + threshold):
+                regressions.append((name, metric, base[metric], case[metric]))
+    return regressions
+
+
+def baseline_path(args):
+    if args.baseline:
+        return args.baseline
+    return os.path.join(BASELINE_DIR, f"{'mongod' if args.mongo_uri else 'mongomock'}-{args.scale}.json")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks the API endpoints and pipeline stages on a synthetic news corpus.")
+    parser.add_argument("--scale", type=corpus.parse_scale, default="1k", help="Documents in the corpus: 1k, 100k, 1M or a number (Default is 1k)")
+    parser.add_argument("--mongo-uri", default=None, help="Benchmark against this mongod instead of mongomock")
+    parser.add_argument("--database", default="sentiment_benchmark", help="Database the corpus is loaded into; its news collection is dropped first")
+    parser.add_argument("--reuse", action="store_true", help="Keep an already loaded corpus of the same size")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--rollups", action="store_true", help="Build the daily rollups, so date_only requests are answered from them")
+    parser.add_argument("--cases", default="", help="Comma separated cases or groups to run, e.g. endpoint,stage.ner (Default is all)")
+    parser.add_argument("--repeat", type=int, default=20, help="Requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=1, help="Requests in flight per endpoint")
+    parser.add_argument("--stage-repeat", type=int, default=3, help="Runs per pipeline stage")
+    parser.add_argument("--stage-docs", type=int, default=10_000, help="Texts scored by the sentiment stage")
+    parser.add_argument("--ner-docs", type=int, default=2_000, help="Texts run through the NER stage")
+    parser.add_argument("--num-topics", type=int, default=5)
+    parser.add_argument("--output", default=None, help="Write the results to this JSON file")
+    parser.add_argument("--baseline", default=None, help="Baseline JSON (Default is benchmarks/baselines/<backend>-<scale>.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the baseline instead of comparing")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative slowdown that counts as a regression (Default is 0.2)")
+    args = parser.parse_args(argv)
+    args.cases = [case.strip() for case in args.cases.split(",") if case.strip()]
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    path = baseline_path(args)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {path}")
+        return 0
+    if not os.path.exists(path):
+        print(f"No baseline at {path}; run with --save-baseline to create one")
+        return 0
+    with open(path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    for name, metric, before, after in regressions:
+        print(f"REGRESSION {name} {metric}: {before} -> {after}")
+    if regressions:
+        return 1
+    print(f"No regressions beyond {args.threshold:.0%} against {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,20 @@
+import re
+from benchmarks.corpus import ENTITIES
+
+
+class StubGLiNER:
+    # Same interface as GLiNER.batch_predict_entities, but finds the corpus entity names with a regex,
+    # so the NER benchmark measures windowing, batching and merging rather than the model
+    def __init__(self):
+        self.labels = {name: label for label, names in ENTITIES.items() for name in names}
+        self.pattern = re.compile("|".join(re.escape(name) for name in sorted(self.labels, key=len, reverse=True)))
+
+    def batch_predict_entities(self, texts, labels, threshold=0.5):
+        return [
+            [
+                {"start": match.start(), "end": match.end(), "text": match.group(0), "label": self.labels[match.group(0)], "score": 1.0}
+                for match in self.pattern.finditer(text)
+                if self.labels[match.group(0)] in labels
+            ]
+            for text in texts
+        ]
@@ -0,0 +1,24 @@
+import inspect
+import unittest
+
+try:
+    import mongomock
+    import mongomock.collection
+except ImportError:
+    mongomock = None
+
+requires_mongomock = unittest.skipIf(mongomock is None, "mongomock is not installed; pip install mongomock")
+
+if mongomock is not None and "sort" not in inspect.signature(mongomock.collection.BulkOperationBuilder.add_update).parameters:
+    # pymongo 4.9+ hands UpdateOne's sort to the bulk builder, which mongomock 4.3 does not accept
+    _add_update = mongomock.collection.BulkOperationBuilder.add_update
+
+    def _add_update_without_sort(self, *args, sort=None, **kwargs):
+        return _add_update(self, *args, **kwargs)
+
+    mongomock.collection.BulkOperationBuilder.add_update = _add_update_without_sort
+
+
+def news_collection():
+    # A fresh database per test, so state and rollup collections do not leak between tests
+    return mongomock.MongoClient()["sentiment_test"]["news"]
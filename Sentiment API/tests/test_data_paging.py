@@ -0,0 +1,53 @@
+import unittest
+from fastapi.testclient import TestClient
+from mongo import news_collection, requires_mongomock
+from app import app
+
+
+def pages(client, url):
+    items, cursor = [], None
+    while True:
+        response = client.get(url if cursor is None else f"{url}&cursor={cursor}")
+        assert response.status_code == 200, response.text
+        body = response.json()
+        items.extend(body["data"])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return items
+
+
+@requires_mongomock
+class DataPagingTest(unittest.TestCase):
+    def setUp(self):
+        self.collection = news_collection()
+        # Inserted out of date order, so _id and publishedDate order differ
+        self.ids = self.collection.insert_many([
+            {"title": f"Article {i}", "publishedDate": f"2024-0{9 - i}-01T00:00:00Z", "severity": "Low"}
+            for i in range(5)
+        ]).inserted_ids
+        app.news = self.collection
+        self.client = TestClient(app)
+
+    def test_fields_paged_by_id_keep_id_and_leave_out_sort_key(self):
+        items = pages(self.client, "/data/all?fields=title&page_size=2")
+        self.assertEqual([item["_id"] for item in items], [str(_id) for _id in self.ids])
+        self.assertEqual([item["title"] for item in items], [f"Article {i}" for i in range(5)])
+        self.assertTrue(all("publishedDate" not in item for item in items))
+
+    def test_fields_paged_by_date_leave_out_unrequested_sort_key(self):
+        items = pages(self.client, "/data/all?fields=title&page_size=2&sort=publishedDate")
+        self.assertEqual([item["title"] for item in items], [f"Article {i}" for i in reversed(range(5))])
+        self.assertTrue(all(set(item) == {"_id", "title"} for item in items))
+
+    def test_fields_paged_by_date_keep_requested_sort_key(self):
+        items = pages(self.client, "/data/all?fields=title,publishedDate&page_size=2&sort=publishedDate")
+        self.assertEqual([item["publishedDate"][:7] for item in items], ["2024-05", "2024-06", "2024-07", "2024-08", "2024-09"])
+
+    def test_unpaged_fields_leave_out_sort_key(self):
+        response = self.client.get("/data/all?fields=title&sort=publishedDate")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(all(set(item) == {"_id", "title"} for item in response.json()))
+
+
+if __name__ == "__main__":
+    unittest.main()
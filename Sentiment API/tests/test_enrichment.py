@@ -0,0 +1,63 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+from mongo import news_collection, requires_mongomock
+import app.backfill as backfill
+import app.enrichment as enrichment
+import app.utils as utils
+from app.config import Config
+
+
+@requires_mongomock
+class EnrichmentPollTest(unittest.TestCase):
+    def setUp(self):
+        patches = [
+            mock.patch.object(Config, "ENRICH_BATCH_SIZE", 5),
+            mock.patch.object(Config, "ENRICH_FETCH", False),
+            mock.patch.object(Config, "DEDUP_ENABLED", False),
+            mock.patch.object(backfill.sentiment_engine, "score", lambda texts: [0.5 for _ in texts]),
+            mock.patch.object(utils, "gliner_ner_batch", lambda texts: [{"organisation": ["Maersk"]} for _ in texts]),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.collection = news_collection()
+        self.worker = enrichment.EnrichmentWorker()
+        self.worker.news = self.collection
+        self.worker.state = self.collection.database[Config.STATE_COLLECTION]
+
+    def insert(self, texts):
+        return self.collection.insert_many([
+            {"title": "Port closed", "url": f"https://news.example.com/{i}", "publishedDate": "2024-06-01T00:00:00Z", "actual_text": text}
+            for i, text in enumerate(texts)
+        ]).inserted_ids
+
+    def test_articles_without_text_do_not_hold_up_newer_ones(self):
+        # A full batch of unfetchable articles ahead of the ones that can be scored
+        dead = self.insert(["NA"] * 5)
+        good = self.insert(["Strikes closed the port for a week."] * 5)
+        for _ in range(3):
+            self.worker._poll_once()
+        for doc in self.collection.find({"_id": {"$in": good}}):
+            self.assertEqual(doc["sentiment"], 0.5)
+            self.assertEqual(doc["ner"], {"organisation": ["Maersk"]})
+        for doc in self.collection.find({"_id": {"$in": dead}}):
+            self.assertNotIn("sentiment", doc)
+            self.assertNotIn("ner", doc)
+            # Tried once, then left alone until the backoff has passed
+            self.assertEqual(doc["enrich"]["attempts"], 1)
+
+    def test_skipped_articles_are_tried_again_after_the_backoff(self):
+        dead = self.insert(["NA"] * 2)
+        self.worker._poll_once()
+        self.collection.update_many({"_id": {"$in": dead}}, {"$set": {"actual_text": "Text that arrived later."}})
+        self.assertEqual(self.worker._poll_once(), 0)
+        later = datetime.now(timezone.utc) + timedelta(seconds=Config.ENRICH_SKIP_BACKOFF + 1)
+        with mock.patch.object(enrichment, "_now", lambda: later):
+            self.assertEqual(self.worker._poll_once(), 2)
+        for doc in self.collection.find({"_id": {"$in": dead}}):
+            self.assertEqual(doc["sentiment"], 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
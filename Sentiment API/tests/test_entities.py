@@ -0,0 +1,47 @@
+import unittest
+from datetime import datetime
+from mongo import news_collection, requires_mongomock
+import app.entities as entities
+import app.utils as utils
+
+
+@requires_mongomock
+class EntityMentionsTest(unittest.TestCase):
+    def setUp(self):
+        self.news = news_collection()
+        dates = ["2024-05-01T00:00:00Z", None, "2024-02-01T00:00:00Z", "not a date", "2024-09-01T00:00:00Z", None, "2024-07-01T00:00:00Z"]
+        self.ids = self.news.insert_many([
+            {"title": f"Article {i}", "url": f"https://news.example.com/{i}", "ner": {"organisation": ["Maersk"]}, **({"publishedDate": date} if date else {})}
+            for i, date in enumerate(dates)
+        ]).inserted_ids
+        entities.rebuild_index(self.news)
+
+    def pages(self, page_size, **kwargs):
+        data, cursor = [], None
+        while True:
+            page = entities.find_mentions(self.news, "organisation", "maersk", page_size=page_size, cursor=cursor, **kwargs)
+            data.extend(page["data"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return data
+
+    def test_paging_includes_articles_without_a_date(self):
+        for page_size in [1, 2, 3]:
+            data = self.pages(page_size)
+            self.assertEqual(sorted(item["article_id"] for item in data), sorted(str(_id) for _id in self.ids))
+            # Undated mentions first, then by date
+            dates = [item["publishedDate"] for item in data]
+            self.assertEqual(dates[:3], [None, None, None])
+            self.assertEqual(dates[3:], sorted(dates[3:]))
+
+    def test_date_range_leaves_out_undated_articles(self):
+        data = self.pages(1, start=datetime(2024, 3, 1), end=datetime(2024, 8, 1))
+        self.assertEqual([item["title"] for item in data], ["Article 0", "Article 6"])
+
+    def test_cursor_after_an_undated_document(self):
+        query = utils.cursor_query(utils.encode_cursor({"_id": self.ids[1], "publishedDate": None}, "publishedDate"), "publishedDate")
+        self.assertEqual(query, {"$or": [{"publishedDate": {"$ne": None}}, {"publishedDate": None, "_id": {"$gt": self.ids[1]}}]})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,253 @@
+import asyncio
+import unittest
+from unittest import mock
+import httpx
+from pymongo.results import BulkWriteResult
+import app.fetcher as fetcher
+from app.config import Config
+
+# The tests replace asyncio.sleep to record backoff delays; slow hosts still need a real one
+real_sleep = asyncio.sleep
+
+
+def _get(doc, path):
+    for part in path.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+
+def _matches(doc, query):
+    # Just the operators fetch_query and the keyset batches use
+    for field, condition in query.items():
+        if field == "$and":
+            if not all(_matches(doc, part) for part in condition):
+                return False
+            continue
+        value = _get(doc, field)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for op, operand in condition.items():
+            if op == "$eq" and value != operand:
+                return False
+            if op == "$in" and value not in operand:
+                return False
+            if op == "$nin" and value in operand:
+                return False
+            if op == "$gt" and (value is None or value <= operand):
+                return False
+    return True
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, key, direction=1):
+        self.docs = sorted(self.docs, key=lambda doc: doc[key], reverse=direction == -1)
+        return self
+
+    def limit(self, count):
+        self.docs = self.docs[:count]
+        return self
+
+    def __iter__(self):
+        return iter(self.docs)
+
+
+class FakeCollection:
+    name = "news"
+
+    def __init__(self, docs):
+        self.docs = docs
+        # Only the corpus version in the state collection is written through it
+        self.database = mock.MagicMock()
+
+    def count_documents(self, query):
+        return sum(1 for doc in self.docs if _matches(doc, query))
+
+    def find(self, query, projection=None):
+        return FakeCursor([dict(doc) for doc in self.docs if _matches(doc, query)])
+
+    def bulk_write(self, operations, ordered=True):
+        for operation in operations:
+            for doc in self.docs:
+                if _matches(doc, operation._filter):
+                    for path, value in operation._doc["$set"].items():
+                        *parents, last = path.split(".")
+                        target = doc
+                        for part in parents:
+                            target = target.setdefault(part, {})
+                        target[last] = value
+        return BulkWriteResult({"nMatched": len(operations), "nModified": len(operations), "nUpserted": 0}, True)
+
+    def get(self, _id):
+        return next(doc for doc in self.docs if doc["_id"] == _id)
+
+
+def mock_client(responses):
+    # responses: url -> list of responses (or exceptions) handed out in order; the last one repeats
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        queue = responses[str(request.url)]
+        response = queue.pop(0) if len(queue) > 1 else queue[0]
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler)), requests
+
+
+class FetcherTest(unittest.TestCase):
+    def setUp(self):
+        patches = [
+            mock.patch.object(Config, "FETCH_RETRIES", 2),
+            mock.patch.object(Config, "FETCH_BACKOFF", 0.01),
+            mock.patch.object(Config, "FETCH_MAX_BACKOFF", 1),
+            mock.patch.object(fetcher, "parse_article", lambda url, html: html),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.delays = []
+
+        async def sleep(delay):
+            self.delays.append(delay)
+
+        sleep_patch = mock.patch.object(fetcher.asyncio, "sleep", sleep)
+        sleep_patch.start()
+        self.addCleanup(sleep_patch.stop)
+
+    def fetch_url(self, client, url, **kwargs):
+        async def run():
+            async with client:
+                return await fetcher.fetch_url(client, url, **kwargs)
+        return asyncio.run(run())
+
+    def fetch_documents(self, collection, client, **kwargs):
+        async def run():
+            async with client:
+                return await fetcher.fetch_documents(collection, client=client, **kwargs)
+        return asyncio.run(run())
+
+    def test_retries_429_and_503_with_backoff(self):
+        url = "https://news.example.com/a"
+        client, requests = mock_client({url: [
+            httpx.Response(429, headers={"Retry-After": "0"}),
+            httpx.Response(503),
+            httpx.Response(200, text="body"),
+        ]})
+        result = self.fetch_url(client, url)
+        self.assertEqual(result["status"], fetcher.OK)
+        self.assertEqual(result["attempts"], 3)
+        self.assertEqual(len(requests), 3)
+        # Retry-After is honoured, otherwise the delay doubles per attempt with jitter
+        self.assertEqual(self.delays[0], 0)
+        self.assertTrue(0.02 <= self.delays[1] <= 0.04)
+
+    def test_gives_up_after_retries(self):
+        url = "https://news.example.com/a"
+        client, requests = mock_client({url: [httpx.Response(503)]})
+        result = self.fetch_url(client, url)
+        self.assertEqual(result["status"], fetcher.HTTP_RETRYABLE_ERROR)
+        self.assertEqual(result["http_status"], 503)
+        self.assertEqual(result["attempts"], Config.FETCH_RETRIES + 1)
+        self.assertEqual(len(requests), Config.FETCH_RETRIES + 1)
+        self.assertEqual(len(self.delays), Config.FETCH_RETRIES)
+
+    def test_client_error_is_not_retried(self):
+        url = "https://news.example.com/a"
+        client, requests = mock_client({url: [httpx.Response(404)]})
+        result = self.fetch_url(client, url)
+        self.assertEqual(result["status"], fetcher.HTTP_CLIENT_ERROR)
+        self.assertEqual(result["attempts"], 1)
+        self.assertEqual(self.delays, [])
+
+    def test_timeout_is_retried_then_classified(self):
+        url = "https://news.example.com/a"
+        request = httpx.Request("GET", url)
+        client, requests = mock_client({url: [httpx.ReadTimeout("timed out", request=request)]})
+        result = self.fetch_url(client, url)
+        self.assertEqual(result["status"], fetcher.TIMEOUT)
+        self.assertEqual(result["attempts"], Config.FETCH_RETRIES + 1)
+
+    def test_invalid_url(self):
+        # Rejected by httpx before any connection is made
+        result = self.fetch_url(fetcher.new_client(), "not a url")
+        self.assertEqual(result["status"], fetcher.INVALID_URL)
+        self.assertEqual(result["attempts"], 1)
+
+    def test_refresh_sends_validators_and_keeps_text_on_304(self):
+        url = "https://news.example.com/a"
+        collection = FakeCollection([
+            {"_id": 1, "url": url, "actual_text": "old text", "fetch": {"status": fetcher.OK, "etag": '"v1"', "last_modified": "Mon, 01 Jan 2024 00:00:00 GMT"}},
+        ])
+        client, requests = mock_client({url: [httpx.Response(304)]})
+        result = self.fetch_documents(collection, client, mode="refresh")
+        self.assertEqual(result["not_modified"], 1)
+        self.assertEqual(result["fetched"], 0)
+        self.assertEqual(requests[0].headers["If-None-Match"], '"v1"')
+        self.assertEqual(requests[0].headers["If-Modified-Since"], "Mon, 01 Jan 2024 00:00:00 GMT")
+        doc = collection.get(1)
+        self.assertEqual(doc["actual_text"], "old text")
+        self.assertEqual(doc["fetch"]["status"], fetcher.NOT_MODIFIED)
+        # Unchanged text leaves cached topic models valid
+        collection.database[Config.STATE_COLLECTION].update_one.assert_not_called()
+
+    def test_missing_mode_skips_permanent_failures(self):
+        def docs():
+            return [
+                {"_id": 1, "url": "https://news.example.com/new", "actual_text": "NA"},
+                {"_id": 2, "url": "https://news.example.com/gone", "actual_text": "NA", "fetch": {"status": fetcher.HTTP_CLIENT_ERROR}},
+                {"_id": 3, "url": "https://news.example.com/slow", "actual_text": "", "fetch": {"status": fetcher.TIMEOUT}},
+                {"_id": 4, "url": "https://news.example.com/done", "actual_text": "already fetched"},
+            ]
+
+        def responses():
+            return {f"https://news.example.com/{name}": [httpx.Response(200, text=f"{name} body")] for name in ["new", "gone", "slow", "done"]}
+
+        collection = FakeCollection(docs())
+        client, requests = mock_client(responses())
+        result = self.fetch_documents(collection, client)
+        self.assertEqual(sorted(str(request.url) for request in requests), ["https://news.example.com/new", "https://news.example.com/slow"])
+        self.assertEqual(result["fetched"], 2)
+        self.assertEqual(collection.get(1)["actual_text"], "new body")
+        self.assertEqual(collection.get(2)["actual_text"], "NA")
+        collection.database[Config.STATE_COLLECTION].update_one.assert_called_once_with({"_id": "corpus_version"}, {"$inc": {"version": 1}}, upsert=True)
+
+        collection = FakeCollection(docs())
+        client, requests = mock_client(responses())
+        result = self.fetch_documents(collection, client, retry_failed=True)
+        self.assertEqual(result["fetched"], 3)
+        self.assertEqual(collection.get(2)["actual_text"], "gone body")
+        self.assertEqual(collection.get(2)["fetch"]["status"], fetcher.OK)
+
+    def test_busy_host_does_not_starve_other_hosts(self):
+        busy = [{"_id": i, "url": f"https://busy.example.com/{i}", "actual_text": "NA"} for i in range(1, 7)]
+        quiet = [{"_id": i, "url": f"https://quiet.example.com/{i}", "actual_text": "NA"} for i in range(7, 9)]
+        collection = FakeCollection(busy + quiet)
+        started = []
+        in_flight = [0, 0]
+
+        async def handler(request):
+            started.append(request.url.host)
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight)
+            await real_sleep(0.01)
+            in_flight[0] -= 1
+            return httpx.Response(200, text="body")
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        with mock.patch.object(Config, "FETCH_CONCURRENCY", 2), mock.patch.object(Config, "FETCH_PER_HOST", 1):
+            result = self.fetch_documents(collection, client)
+        self.assertEqual(result["fetched"], 8)
+        # One slot serves the busy host, the other is free for the quiet one from the start
+        self.assertEqual(sorted(started[:2]), ["busy.example.com", "quiet.example.com"])
+        self.assertEqual(in_flight[1], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
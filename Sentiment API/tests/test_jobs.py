@@ -0,0 +1,64 @@
+import unittest
+from unittest import mock
+from fastapi.testclient import TestClient
+from mongo import news_collection, requires_mongomock
+import app.backfill as backfill
+from app import app
+from app.config import Config
+from app.jobs import QUEUED, RUNNING, COMPLETED, manager as job_manager
+
+
+@requires_mongomock
+class TopicExtrasDedupeTest(unittest.TestCase):
+    def setUp(self):
+        self.collection = news_collection()
+        self.jobs = self.collection.database[Config.JOBS_COLLECTION]
+        app.news = self.collection
+        self.pending = ["visual"]
+        patches = [
+            mock.patch.object(job_manager, "jobs", self.jobs),
+            mock.patch.object(job_manager, "submit", return_value={"_id": "new"}),
+            mock.patch.object(backfill, "train_topic_model", lambda *args, **kwargs: ({"Persplexity": -7.0}, {"Topic 0": "0.1*\"port\""}, self.pending)),
+        ]
+        _, self.submit, _ = [patch.start() for patch in patches]
+        for patch in patches:
+            self.addCleanup(patch.stop)
+        self.client = TestClient(app)
+
+    def extras_job(self, status, **params):
+        self.jobs.insert_one({"_id": f"job{self.jobs.count_documents({})}", "kind": "topic_extras", "status": status, "params": params})
+
+    def request(self, query):
+        response = self.client.get(f"/get_topic_model_pyLDAvis?{query}")
+        self.assertEqual(response.status_code, 200, response.text)
+
+    def test_active_matches_params(self):
+        self.extras_job(QUEUED, num_topics=5, online=False, coherence=False, visual=True)
+        self.extras_job(COMPLETED, num_topics=7, online=False, coherence=False, visual=True)
+        self.assertIsNotNone(job_manager.active("topic_extras"))
+        self.assertIsNotNone(job_manager.active("topic_extras", {"num_topics": 5, "online": False}))
+        self.assertIsNone(job_manager.active("topic_extras", {"num_topics": 5, "online": True}))
+        self.assertIsNone(job_manager.active("topic_extras", {"num_topics": 7, "online": False}))
+
+    def test_pending_work_for_another_model_is_submitted(self):
+        self.extras_job(RUNNING, num_topics=5, online=False, coherence=False, visual=True)
+        self.request("num_topics=7")
+        self.request("num_topics=5&online=true")
+        self.assertEqual([call.args for call in self.submit.call_args_list], [
+            ("topic_extras", {"num_topics": 7, "online": False, "coherence": False, "visual": True}),
+            ("topic_extras", {"num_topics": 5, "online": True, "coherence": False, "visual": True}),
+        ])
+
+    def test_pending_work_already_queued_is_not_submitted_again(self):
+        self.extras_job(QUEUED, num_topics=5, online=False, coherence=False, visual=True)
+        self.request("num_topics=5")
+        self.submit.assert_not_called()
+
+    def test_job_missing_a_pending_step_does_not_cover_it(self):
+        self.extras_job(QUEUED, num_topics=5, online=False, coherence=True, visual=False)
+        self.request("num_topics=5")
+        self.submit.assert_called_once_with("topic_extras", {"num_topics": 5, "online": False, "coherence": False, "visual": True})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+from unittest import mock
+from mongo import news_collection, requires_mongomock
+import app.backfill as backfill
+import app.utils as utils
+from app.config import Config
+
+
+@requires_mongomock
+class NerBackfillTest(unittest.TestCase):
+    def setUp(self):
+        self.texts = []
+
+        def gliner(texts):
+            self.texts.extend(texts)
+            return [{"organisation": ["Maersk"]} for _ in texts]
+
+        patches = [
+            mock.patch.object(Config, "DEDUP_ENABLED", False),
+            mock.patch.object(Config, "BULK_WRITE_SIZE", 2),
+            mock.patch.object(utils, "gliner_ner_batch", gliner),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.collection = news_collection()
+        old = {"organisation": ["Old"]}
+        self.collection.insert_many([
+            {"_id": 1, "actual_text": "never extracted"},
+            {"_id": 2, "actual_text": "unchanged", "ner": old, "ner_text_hash": utils.text_hash("unchanged")},
+            {"_id": 3, "actual_text": "edited since", "ner": old, "ner_text_hash": utils.text_hash("before the edit")},
+            {"_id": 4, "actual_text": "extracted before hashes", "ner": old},
+            {"_id": 5, "actual_text": "also edited", "ner": old, "ner_text_hash": utils.text_hash("old text")},
+        ])
+
+    def test_verify_hash_reprocesses_changed_text_only(self):
+        # Hashes are stamped and documents flagged through bulk writes, not one update per document
+        with mock.patch.object(self.collection, "update_one", side_effect=AssertionError("single update")):
+            result = backfill.backfill_ner(self.collection, verify_hash=True)
+        self.assertEqual(result["to_modify"], 3)
+        self.assertEqual(sorted(self.texts), ["also edited", "edited since", "never extracted"])
+        docs = {doc["_id"]: doc for doc in self.collection.find()}
+        for _id in [1, 3, 5]:
+            self.assertEqual(docs[_id]["ner"], {"organisation": ["Maersk"]})
+            self.assertEqual(docs[_id]["ner_text_hash"], utils.text_hash(docs[_id]["actual_text"]))
+            self.assertNotIn("ner_stale", docs[_id])
+        self.assertEqual(docs[2]["ner"], {"organisation": ["Old"]})
+        self.assertEqual(docs[4]["ner"], {"organisation": ["Old"]})
+        self.assertEqual(docs[4]["ner_text_hash"], utils.text_hash("extracted before hashes"))
+
+    def test_without_verify_hash_only_missing_ner_is_processed(self):
+        backfill.backfill_ner(self.collection)
+        self.assertEqual(self.texts, ["never extracted"])
+        self.assertNotIn("ner_text_hash", self.collection.find_one({"_id": 4}))
+
+    def test_query_does_not_grow_with_stale_documents(self):
+        self.assertEqual(backfill.ner_query(self.collection, "incremental", True), {"$or": [{"ner": {"$exists": False}}, {"ner_stale": True}]})
+        self.assertEqual(self.collection.count_documents({"ner_stale": True}), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
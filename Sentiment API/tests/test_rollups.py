@@ -0,0 +1,75 @@
+import unittest
+from datetime import datetime
+from mongo import news_collection, requires_mongomock
+import app.rollups as rollups
+
+JUNE_1 = datetime(2024, 6, 1)
+JUNE_2 = datetime(2024, 6, 2)
+
+
+def article(published, location="Germany", **fields):
+    return {"publishedDate": published, "disruptionType": "Logistics", "location": location, **fields}
+
+
+@requires_mongomock
+class RollupWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.news = news_collection()
+
+    def test_sentiment_is_counted_per_day_and_dimension(self):
+        with rollups.RollupWriter(self.news) as rollup:
+            rollup.sentiment(article("2024-06-01T08:00:00Z"), 0.5)
+            rollup.sentiment(article("2024-06-01T20:00:00Z", location="China"), -0.25)
+            rollup.sentiment(article("2024-06-02T09:30:00Z"), 0.0)
+        self.assertEqual(rollups.sentiment_series(self.news, "sum"), {JUNE_1: 0.25, JUNE_2: 0.0})
+        self.assertEqual(rollups.sentiment_series(self.news, "average"), {JUNE_1: 0.125, JUNE_2: 0.0})
+        self.assertEqual(rollups.sentiment_series(self.news, "total_count"), {JUNE_1: 2, JUNE_2: 1})
+        self.assertEqual(rollups.sentiment_series(self.news, "positive_count"), {JUNE_1: 1})
+        self.assertEqual(rollups.sentiment_series(self.news, "negative_count"), {JUNE_1: 1})
+        # Dimension values are matched case-insensitively
+        self.assertEqual(rollups.sentiment_series(self.news, "sum", "location", "GERMANY"), {JUNE_1: 0.5, JUNE_2: 0.0})
+
+    def test_rescoring_replaces_the_old_score(self):
+        with rollups.RollupWriter(self.news) as rollup:
+            rollup.sentiment(article("2024-06-01T08:00:00Z"), 0.5)
+            rollup.sentiment(article("2024-06-01T08:00:00Z", sentiment=0.5), -0.5)
+        self.assertEqual(rollups.sentiment_series(self.news, "total_count"), {JUNE_1: 1})
+        self.assertEqual(rollups.sentiment_series(self.news, "sum"), {JUNE_1: -0.5})
+        self.assertEqual(rollups.sentiment_series(self.news, "positive_count"), {})
+
+    def test_duplicates_and_undated_articles_are_not_counted(self):
+        with rollups.RollupWriter(self.news) as rollup:
+            rollup.sentiment(article("2024-06-01T08:00:00Z", dedup={"canonical": False}), 0.5)
+            rollup.sentiment(article(None), 0.5)
+            rollup.sentiment(article("not a date"), 0.5)
+            rollup.ner(article(None), {"organisation": ["Maersk"]})
+        self.assertEqual(rollups.day_rollups(self.news).count_documents({}), 0)
+        self.assertEqual(rollups.entity_rollups(self.news).count_documents({}), 0)
+
+    def test_ner_counts_each_entity_once_per_article(self):
+        with rollups.RollupWriter(self.news) as rollup:
+            rollup.ner(article("2024-06-01T08:00:00Z"), {"organisation": ["Maersk", "Maersk", "FedEx"]})
+            rollup.ner(article("2024-06-01T10:00:00Z"), {"organisation": ["Maersk"], "city": ["Hamburg"]})
+        self.assertEqual(rollups.ner_count_series(self.news), {
+            "2024-06-01T00:00:00": {"city": {"Hamburg": 1}, "organisation": {"Maersk": 2, "FedEx": 1}},
+        })
+        self.assertEqual(rollups.ner_count_series(self.news, top_k=1)["2024-06-01T00:00:00"]["organisation"], {"Maersk": 2})
+        series = rollups.ner_series(self.news)
+        self.assertEqual(sorted(series["2024-06-01T00:00:00"]["organisation"]), ["FedEx", "Maersk", "Maersk"])
+
+    def test_reextraction_moves_counts_without_counting_the_article_twice(self):
+        doc = article("2024-06-01T08:00:00Z")
+        with rollups.RollupWriter(self.news) as rollup:
+            rollup.ner(doc, {"organisation": ["Maersk"]})
+            rollup.ner({**doc, "ner": {"organisation": ["Maersk"]}}, {"organisation": ["FedEx"]})
+        self.assertEqual(rollups.ner_count_series(self.news), {"2024-06-01T00:00:00": {"organisation": {"FedEx": 1}}})
+        day = rollups.day_rollups(self.news).find_one({"_id.dim": "all"})
+        self.assertEqual(day["ner_docs"], 1)
+
+    def test_articles_without_entities_still_count_as_extracted(self):
+        rollups.record_ner(self.news, article("2024-06-02T08:00:00Z"), {})
+        self.assertEqual(rollups.ner_series(self.news), {"2024-06-02T00:00:00": {}})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from fastapi.testclient import TestClient
+from mongo import news_collection, requires_mongomock
+import app.concurrency as concurrency
+import app.preprocess as preprocess
+import app.rollups as rollups
+import app.topics as topics
+import app.utils as utils
+from app import app
+from app.config import Config
+
+WORDS = ["port", "strike", "storm", "flood", "tariff", "export", "factory", "shortage", "vessel", "canal"]
+
+
+def article(i):
+    return " ".join(WORDS[(i + j) % len(WORDS)] for j in range(12))
+
+
+@requires_mongomock
+class TopicCacheTest(unittest.TestCase):
+    def setUp(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        patches = [
+            mock.patch.object(Config, "TOPIC_CACHE_DIR", cache_dir),
+            # No nltk download in tests; the words above are not stop words anyway
+            mock.patch.object(preprocess, "_stop_words", frozenset()),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.collection = news_collection()
+        self.collection.insert_many([{"title": f"Article {i}", "actual_text": article(i)} for i in range(20)])
+
+    def test_fingerprint_changes_with_inserts_and_the_corpus_version_only(self):
+        before = topics.corpus_fingerprint(self.collection)
+        self.assertEqual(topics.corpus_fingerprint(self.collection), before)
+        # Enrichment fields are not part of the topic model corpus
+        self.collection.update_many({}, {"$set": {"sentiment": 0.1}})
+        self.assertEqual(topics.corpus_fingerprint(self.collection), before)
+        rollups.bump_corpus_version(self.collection)
+        bumped = topics.corpus_fingerprint(self.collection)
+        self.assertNotEqual(bumped, before)
+        self.collection.insert_one({"title": "New", "actual_text": article(3)})
+        self.assertNotEqual(topics.corpus_fingerprint(self.collection), bumped)
+
+    def test_trained_model_is_reused_until_the_corpus_changes(self):
+        with mock.patch.object(topics, "_train", wraps=topics._train) as train:
+            first = topics.topic_model(self.collection, 2, coherence="skip", visual="skip")
+            second = topics.topic_model(self.collection, 2, coherence="skip", visual="skip")
+            self.assertEqual(train.call_count, 1)
+            self.assertEqual(first[1], second[1])
+            # Another num_topics is another model
+            topics.topic_model(self.collection, 3, coherence="skip", visual="skip")
+            self.assertEqual(train.call_count, 2)
+            rollups.bump_corpus_version(self.collection)
+            topics.topic_model(self.collection, 2, coherence="skip", visual="skip")
+            self.assertEqual(train.call_count, 3)
+
+    def test_visual_page_is_prepared_on_the_model_executor_once(self):
+        topics.topic_model(self.collection, 2, coherence="skip", visual="skip")
+
+        def prepare(lda_model, corpus, id2word, path):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("{}")
+
+        app.news = self.collection
+        client = TestClient(app)
+        with mock.patch.object(utils, "prepare_pyLDAvis", side_effect=prepare) as prepared, \
+                mock.patch.object(utils, "render_pyLDAvis", return_value="<html></html>"), \
+                mock.patch.object(concurrency, "run_model", wraps=concurrency.run_model) as run_model:
+            self.assertIsNone(topics.visual_page(self.collection, 2, prepare=False))
+            first = client.get("/get_topic_model_pyLDAvis/visual?num_topics=2")
+            self.assertEqual(first.status_code, 200)
+            self.assertEqual(run_model.call_count, 1)
+            second = client.get("/get_topic_model_pyLDAvis/visual?num_topics=2", headers={"If-None-Match": first.headers["ETag"]})
+            self.assertEqual(second.status_code, 304)
+            # The rendered page is served without going through the model executor again
+            self.assertEqual(run_model.call_count, 1)
+            self.assertEqual(prepared.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()